@@ -5,6 +5,7 @@ from .models import (
     AccountSnapshot,
     Asset,
     PortfolioSnapshot,
+    PortfolioSnapshotRollup,
     Settings,
 )
 
@@ -39,6 +40,13 @@ class PortfolioSnapshotAdmin(admin.ModelAdmin):
     readonly_fields = ("id",)
 
 
+@admin.register(PortfolioSnapshotRollup)
+class PortfolioSnapshotRollupAdmin(admin.ModelAdmin):
+    list_display = ("owner", "resolution", "period_start", "samples", "value_low", "value_high", "value_close")
+    list_filter = ("resolution", "period_start")
+    readonly_fields = ("id",)
+
+
 @admin.register(Settings)
 class SettingsAdmin(admin.ModelAdmin):
     list_display = ("user", "base_currency", "cost_basis_method", "fiscal_cost_method")
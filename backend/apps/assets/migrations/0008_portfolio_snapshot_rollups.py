@@ -0,0 +1,54 @@
+# Generated by Django 6.0.9 on 2026-10-17 09:48
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("assets", "0007_settings_tax_country"),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="PortfolioSnapshotRollup",
+            fields=[
+                ("id", models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name="ID")),
+                ("resolution", models.CharField(choices=[("HOUR", "Hour"), ("DAY", "Day")], max_length=4)),
+                ("period_start", models.DateTimeField()),
+                ("opened_at", models.DateTimeField()),
+                ("closed_at", models.DateTimeField()),
+                ("samples", models.PositiveIntegerField(default=0)),
+                ("value_open", models.DecimalField(decimal_places=2, max_digits=20)),
+                ("value_high", models.DecimalField(decimal_places=2, max_digits=20)),
+                ("value_low", models.DecimalField(decimal_places=2, max_digits=20)),
+                ("value_close", models.DecimalField(decimal_places=2, max_digits=20)),
+                ("cost_open", models.DecimalField(blank=True, decimal_places=2, max_digits=20, null=True)),
+                ("cost_high", models.DecimalField(blank=True, decimal_places=2, max_digits=20, null=True)),
+                ("cost_low", models.DecimalField(blank=True, decimal_places=2, max_digits=20, null=True)),
+                ("cost_close", models.DecimalField(blank=True, decimal_places=2, max_digits=20, null=True)),
+                ("pnl_open", models.DecimalField(blank=True, decimal_places=2, max_digits=20, null=True)),
+                ("pnl_high", models.DecimalField(blank=True, decimal_places=2, max_digits=20, null=True)),
+                ("pnl_low", models.DecimalField(blank=True, decimal_places=2, max_digits=20, null=True)),
+                ("pnl_close", models.DecimalField(blank=True, decimal_places=2, max_digits=20, null=True)),
+                (
+                    "owner",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="assets_portfoliosnapshotrollup_set",
+                        to=settings.AUTH_USER_MODEL,
+                    ),
+                ),
+            ],
+            options={
+                "ordering": ["-period_start"],
+                "constraints": [
+                    models.UniqueConstraint(
+                        fields=("owner", "resolution", "period_start"), name="unique_rollup_owner_resolution_period"
+                    )
+                ],
+            },
+        ),
+    ]
@@ -0,0 +1,68 @@
+"""Data migration: fill the hourly and daily snapshot rollups from existing snapshots.
+
+From here on the rollups are kept up to date by the receiver in
+``apps.assets.models``; without this, charts over long ranges, which read
+the rollups, would miss the history captured before. The reverse step is a
+no-op because the table is dropped with its model.
+
+The period and folding helpers are frozen copies of ``rollup_period_start``
+and ``fold_snapshot`` in ``apps.assets.models`` as of this migration, so
+later changes to the models module cannot change what it writes.
+"""
+
+import datetime
+
+from django.db import migrations
+
+METRICS = {"value": "total_market_value", "cost": "total_cost", "pnl": "total_unrealized_pnl"}
+
+
+def rollup_period_start(resolution, captured_at):
+    start = captured_at.astimezone(datetime.UTC).replace(minute=0, second=0, microsecond=0)
+    return start.replace(hour=0) if resolution == "DAY" else start
+
+
+def fold_snapshot(rollup, snapshot):
+    at = snapshot.captured_at
+    first = not rollup.samples
+    for metric, field in METRICS.items():
+        value = getattr(snapshot, field)
+        if first or at < rollup.opened_at:
+            setattr(rollup, f"{metric}_open", value)
+        if first or at >= rollup.closed_at:
+            setattr(rollup, f"{metric}_close", value)
+        if value is None:
+            continue
+        high, low = getattr(rollup, f"{metric}_high"), getattr(rollup, f"{metric}_low")
+        if first or high is None or value > high:
+            setattr(rollup, f"{metric}_high", value)
+        if first or low is None or value < low:
+            setattr(rollup, f"{metric}_low", value)
+    if first or at < rollup.opened_at:
+        rollup.opened_at = at
+    if first or at >= rollup.closed_at:
+        rollup.closed_at = at
+    rollup.samples += 1
+
+
+def backfill_snapshot_rollups(apps, schema_editor):
+    PortfolioSnapshot = apps.get_model("assets", "PortfolioSnapshot")
+    PortfolioSnapshotRollup = apps.get_model("assets", "PortfolioSnapshotRollup")
+    rollups = {}
+    for snapshot in PortfolioSnapshot.objects.order_by("owner_id", "captured_at").iterator():
+        for resolution in ("HOUR", "DAY"):
+            key = (snapshot.owner_id, resolution, rollup_period_start(resolution, snapshot.captured_at))
+            if key not in rollups:
+                rollups[key] = PortfolioSnapshotRollup(owner_id=key[0], resolution=resolution, period_start=key[2])
+            fold_snapshot(rollups[key], snapshot)
+    PortfolioSnapshotRollup.objects.bulk_create(rollups.values(), batch_size=1000)
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("assets", "0008_portfolio_snapshot_rollups"),
+    ]
+
+    operations = [
+        migrations.RunPython(backfill_snapshot_rollups, migrations.RunPython.noop),
+    ]
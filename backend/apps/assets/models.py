@@ -1,6 +1,9 @@
+import datetime
+from dataclasses import dataclass, fields
+
 from django.conf import settings as django_settings
-from django.db import models
-from django.db.models.signals import post_delete
+from django.db import IntegrityError, models, transaction
+from django.db.models.signals import post_delete, post_save
 from django.dispatch import receiver
 
 from apps.core.models import UserOwnedModel
@@ -139,6 +142,117 @@ class PortfolioSnapshot(models.Model):
         return f"Portfolio @ {self.captured_at}: {self.total_market_value}"
 
 
+class PortfolioSnapshotRollup(models.Model):
+    """Open, high, low and close of the portfolio snapshots of one hour or one day (UTC).
+
+    Every new snapshot is folded into its hour and its day by the receiver
+    below, so the rollups cover the same history as the snapshots.
+    Compaction (``apps.assets.services.compact_portfolio_snapshots``) then
+    deletes the snapshots, and later the hourly rows, past their window;
+    daily rows are only removed by the data retention purge.
+    """
+
+    class Resolution(models.TextChoices):
+        HOUR = "HOUR", "Hour"
+        DAY = "DAY", "Day"
+
+    owner = models.ForeignKey(
+        django_settings.AUTH_USER_MODEL,
+        on_delete=models.CASCADE,
+        related_name="assets_portfoliosnapshotrollup_set",
+    )
+    resolution = models.CharField(max_length=4, choices=Resolution.choices)
+    period_start = models.DateTimeField()
+    opened_at = models.DateTimeField()
+    closed_at = models.DateTimeField()
+    samples = models.PositiveIntegerField(default=0)
+    value_open = models.DecimalField(max_digits=20, decimal_places=2)
+    value_high = models.DecimalField(max_digits=20, decimal_places=2)
+    value_low = models.DecimalField(max_digits=20, decimal_places=2)
+    value_close = models.DecimalField(max_digits=20, decimal_places=2)
+    cost_open = models.DecimalField(max_digits=20, decimal_places=2, null=True, blank=True)
+    cost_high = models.DecimalField(max_digits=20, decimal_places=2, null=True, blank=True)
+    cost_low = models.DecimalField(max_digits=20, decimal_places=2, null=True, blank=True)
+    cost_close = models.DecimalField(max_digits=20, decimal_places=2, null=True, blank=True)
+    pnl_open = models.DecimalField(max_digits=20, decimal_places=2, null=True, blank=True)
+    pnl_high = models.DecimalField(max_digits=20, decimal_places=2, null=True, blank=True)
+    pnl_low = models.DecimalField(max_digits=20, decimal_places=2, null=True, blank=True)
+    pnl_close = models.DecimalField(max_digits=20, decimal_places=2, null=True, blank=True)
+
+    class Meta:
+        ordering = ["-period_start"]
+        constraints = [
+            models.UniqueConstraint(
+                fields=["owner", "resolution", "period_start"], name="unique_rollup_owner_resolution_period"
+            ),
+        ]
+
+    def __str__(self):
+        return f"Portfolio {self.resolution.lower()} @ {self.period_start}: {self.value_close}"
+
+
+ROLLUP_METRICS = {"value": "total_market_value", "cost": "total_cost", "pnl": "total_unrealized_pnl"}
+
+
+def rollup_period_start(resolution, captured_at):
+    """Start of the hour or UTC day that ``captured_at`` falls in."""
+    start = captured_at.astimezone(datetime.UTC).replace(minute=0, second=0, microsecond=0)
+    return start.replace(hour=0) if resolution == PortfolioSnapshotRollup.Resolution.DAY else start
+
+
+def fold_snapshot(rollup, snapshot):
+    """Add ``snapshot`` to ``rollup`` in place; a rollup with no samples takes it as its only one."""
+    at = snapshot.captured_at
+    first = not rollup.samples
+    for metric, field in ROLLUP_METRICS.items():
+        value = getattr(snapshot, field)
+        if first or at < rollup.opened_at:
+            setattr(rollup, f"{metric}_open", value)
+        if first or at >= rollup.closed_at:
+            setattr(rollup, f"{metric}_close", value)
+        if value is None:
+            continue
+        high, low = getattr(rollup, f"{metric}_high"), getattr(rollup, f"{metric}_low")
+        if first or high is None or value > high:
+            setattr(rollup, f"{metric}_high", value)
+        if first or low is None or value < low:
+            setattr(rollup, f"{metric}_low", value)
+    if first or at < rollup.opened_at:
+        rollup.opened_at = at
+    if first or at >= rollup.closed_at:
+        rollup.closed_at = at
+    rollup.samples += 1
+
+
+@receiver(post_save, sender=PortfolioSnapshot)
+def rollup_portfolio_snapshot(sender, instance, created, raw=False, **kwargs):
+    # Snapshots are only ever re-saved by a backup restore, with the values they already had.
+    if not created or raw:
+        return
+    with transaction.atomic():
+        rollups = PortfolioSnapshotRollup.objects.select_for_update()
+        for resolution in PortfolioSnapshotRollup.Resolution.values:
+            period = {
+                "owner_id": instance.owner_id,
+                "resolution": resolution,
+                "period_start": rollup_period_start(resolution, instance.captured_at),
+            }
+            rollup = rollups.filter(**period).first()
+            if rollup is None:
+                # No row to lock yet: insert under a savepoint, and if a concurrent snapshot of
+                # the same period inserted first, lock its row and fold into that one instead.
+                rollup = PortfolioSnapshotRollup(**period)
+                fold_snapshot(rollup, instance)
+                try:
+                    with transaction.atomic():
+                        rollup.save(force_insert=True)
+                    continue
+                except IntegrityError:
+                    rollup = rollups.get(**period)
+            fold_snapshot(rollup, instance)
+            rollup.save()
+
+
 class Settings(models.Model):
     class CostBasisMethod(models.TextChoices):
         FIFO = "FIFO", "First In, First Out"
@@ -205,15 +319,27 @@ class Settings(models.Model):
 
     @classmethod
     def load(cls, user):
-        from apps.core.cache import NS_SETTINGS, get_user_cache, set_user_cache
-
-        cached = get_user_cache(user.pk, NS_SETTINGS)
-        if cached is not None:
-            return cached
+        """The user's settings row, created on first use. For writes; reads use :meth:`snapshot`."""
         obj, _ = cls.objects.get_or_create(user=user)
-        set_user_cache(user.pk, NS_SETTINGS, obj, timeout=3600)
         return obj
 
+    @classmethod
+    def snapshot(cls, user):
+        """The user's settings as a read-only :class:`SettingsSnapshot`, cached and memoized per request."""
+        from apps.core.context import memoized
+
+        return memoized((user.pk, "settings"), lambda: cls._snapshot(user))
+
+    @classmethod
+    def _snapshot(cls, user):
+        from apps.core.cache import NS_SETTINGS, get_user_cache, set_user_cache
+
+        snapshot = get_user_cache(user.pk, NS_SETTINGS)
+        if snapshot is None:
+            snapshot = SettingsSnapshot.of(cls.load(user))
+            set_user_cache(user.pk, NS_SETTINGS, snapshot, timeout=3600)
+        return snapshot
+
     def save(self, *args, **kwargs):
         super().save(*args, **kwargs)
         from apps.core.cache import NS_SETTINGS, invalidate_user_cache
@@ -222,3 +348,32 @@ class Settings(models.Model):
 
     def __str__(self):
         return f"Settings ({self.user})"
+
+
+@dataclass(frozen=True, slots=True)
+class SettingsSnapshot:
+    """Read-only copy of a user's :class:`Settings`, as read by the engine and reports.
+
+    Cheap to pickle and, being immutable, safe to share between requests
+    through the in-process cache tier. ``tax_treaty_limits`` must not be
+    modified either.
+    """
+
+    user_id: int
+    base_currency: str
+    cost_basis_method: str
+    fiscal_cost_method: str
+    gift_cost_mode: str
+    rounding_money: int
+    rounding_qty: int
+    price_update_interval: int
+    default_price_source: str
+    snapshot_frequency: int
+    data_retention_days: int | None
+    purge_portfolio_snapshots: bool
+    tax_treaty_limits: dict
+    tax_country: str
+
+    @classmethod
+    def of(cls, settings):
+        return cls(**{field.name: getattr(settings, field.name) for field in fields(cls)})
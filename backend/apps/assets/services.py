@@ -1,11 +1,15 @@
+import datetime
 import math
 import uuid
 from decimal import Decimal, InvalidOperation
 
+from django.conf import settings as django_settings
 from django.db import transaction
 from django.utils import timezone
 
-from .models import Asset, PortfolioSnapshot
+from apps.core.cache import invalidate_user_cache_for
+
+from .models import Asset, PortfolioSnapshot, PortfolioSnapshotRollup, rollup_period_start
 
 
 def _fetch_batch(tickers, period="5d"):
@@ -85,6 +89,36 @@ def create_portfolio_snapshot_now(user) -> None:
             total_cost=new_cost,
             total_unrealized_pnl=new_pnl,
         )
+    invalidate_user_cache_for(user.pk, PortfolioSnapshot)
+
+
+def compact_portfolio_snapshots(user, now=None) -> dict:
+    """Delete the snapshots and hourly rollups of `user` that are past their window.
+
+    Their hourly and daily rollups already hold them (see
+    ``PortfolioSnapshotRollup``). Cutoffs fall on whole hours for snapshots and
+    whole days for hourly rollups, so the rows kept never cover part of a
+    deleted period. Returns the number of rows deleted per tier.
+    """
+    now = now or timezone.now()
+    Resolution = PortfolioSnapshotRollup.Resolution
+    deleted = {"snapshots": 0, "hourly": 0}
+
+    raw_days = getattr(django_settings, "SNAPSHOT_RAW_DAYS", 30)
+    hourly_days = getattr(django_settings, "SNAPSHOT_HOURLY_DAYS", 365)
+    with transaction.atomic():
+        if raw_days:
+            cutoff = rollup_period_start(Resolution.HOUR, now - datetime.timedelta(days=raw_days))
+            deleted["snapshots"], _ = PortfolioSnapshot.objects.filter(owner=user, captured_at__lt=cutoff).delete()
+        if hourly_days:
+            cutoff = rollup_period_start(Resolution.DAY, now - datetime.timedelta(days=hourly_days))
+            deleted["hourly"], _ = PortfolioSnapshotRollup.objects.filter(
+                owner=user, resolution=Resolution.HOUR, period_start__lt=cutoff
+            ).delete()
+
+    if any(deleted.values()):
+        invalidate_user_cache_for(user.pk, PortfolioSnapshot)
+    return deleted
 
 
 def update_prices(user):
@@ -22,10 +22,11 @@ def update_prices_task(self, user_id: int) -> dict:
     try:
         result = update_prices(user)
         result["user_id"] = user.pk
-        # Invalidate cached portfolio/reports since prices changed
-        from apps.core.cache import FINANCIAL_NAMESPACES, invalidate_user_cache
+        # Invalidate cached portfolio/reports since prices changed, and recompute them before the next visit
+        from apps.core.cache import invalidate_user_cache_for, schedule_user_cache_warm_up
 
-        invalidate_user_cache(user.pk, *FINANCIAL_NAMESPACES)
+        invalidate_user_cache_for(user.pk, "assets.Asset")
+        schedule_user_cache_warm_up(user.pk)
         return result
     except Exception as exc:
         logger.warning("update_prices_task failed for user %s: %s", user_id, exc)
@@ -67,9 +68,9 @@ def snapshot_single_user_task(self, user_id: int) -> None:
         result = update_prices(user)
         if result["updated"]:
             logger.info("Prices updated for user %s: %d assets", user, result["updated"])
-            from apps.core.cache import FINANCIAL_NAMESPACES, invalidate_user_cache
+            from apps.core.cache import invalidate_user_cache_for
 
-            invalidate_user_cache(user.pk, *FINANCIAL_NAMESPACES)
+            invalidate_user_cache_for(user.pk, "assets.Asset")
         if result["errors"]:
             logger.warning("Price errors for user %s: %s", user, result["errors"])
     except Exception as exc:
@@ -82,6 +83,11 @@ def snapshot_single_user_task(self, user_id: int) -> None:
         logger.warning("Snapshot creation failed for user %s: %s", user, exc)
         raise self.retry(exc=exc) from exc
 
+    # New prices and the new snapshot invalidated the user's reports; have them ready for the next visit.
+    from apps.core.cache import schedule_user_cache_warm_up
+
+    schedule_user_cache_warm_up(user.pk)
+
 
 @shared_task
 def purge_old_snapshots_task() -> None:
@@ -91,7 +97,7 @@ def purge_old_snapshots_task() -> None:
     from django.db import transaction
     from django.utils import timezone
 
-    from apps.assets.models import PortfolioSnapshot, Settings
+    from apps.assets.models import PortfolioSnapshot, PortfolioSnapshotRollup, Settings
 
     for settings in Settings.objects.select_related("user").exclude(data_retention_days__isnull=True):
         cutoff = timezone.now() - timedelta(days=settings.data_retention_days)
@@ -102,3 +108,24 @@ def purge_old_snapshots_task() -> None:
                 deleted, _ = PortfolioSnapshot.objects.filter(owner=user, captured_at__lt=cutoff).delete()
                 if deleted:
                     logger.info("Purged %d PortfolioSnapshot(s) for user %s", deleted, user)
+                deleted, _ = PortfolioSnapshotRollup.objects.filter(owner=user, closed_at__lt=cutoff).delete()
+                if deleted:
+                    logger.info("Purged %d PortfolioSnapshotRollup(s) for user %s", deleted, user)
+
+
+@shared_task
+def compact_snapshots_task() -> None:
+    """Delete snapshots and hourly rollups past their window, for users that have any."""
+    from django.contrib.auth import get_user_model
+
+    from apps.assets.services import compact_portfolio_snapshots
+
+    for user in get_user_model().objects.filter(assets_portfoliosnapshotrollup_set__isnull=False).distinct():
+        deleted = compact_portfolio_snapshots(user)
+        if any(deleted.values()):
+            logger.info(
+                "Compacted %d PortfolioSnapshot(s) and %d hourly rollup(s) for user %s",
+                deleted["snapshots"],
+                deleted["hourly"],
+                user,
+            )
@@ -1,14 +1,16 @@
 """
-Tests for asset services: create_portfolio_snapshot_now.
+Tests for asset services: create_portfolio_snapshot_now, snapshot rollups.
 """
 
 import datetime
+import uuid
 from decimal import Decimal
+from unittest.mock import patch
 
 import pytest
 from django.contrib.auth import get_user_model
 
-from apps.assets.models import Account, Asset, PortfolioSnapshot, Settings
+from apps.assets.models import Account, Asset, PortfolioSnapshot, PortfolioSnapshotRollup, Settings
 from apps.assets.services import create_portfolio_snapshot_now
 from apps.transactions.models import Transaction
 
@@ -92,3 +94,59 @@ class TestCreatePortfolioSnapshotNow:
         create_portfolio_snapshot_now(user)
         # Empty portfolio creates a snapshot with 0 values
         assert PortfolioSnapshot.objects.filter(owner=user).count() == 1
+
+
+@pytest.mark.django_db
+class TestPortfolioSnapshotRollup:
+    def test_snapshots_fold_into_hour_and_day(self, user):
+        start = datetime.datetime(2025, 3, 4, 10, 0, tzinfo=datetime.UTC)
+        # Out of order, and one snapshot an hour later.
+        for minutes, value, cost in ((20, "110", None), (5, "100", "90"), (40, "95", "92"), (70, "130", "93")):
+            PortfolioSnapshot.objects.create(
+                owner=user,
+                captured_at=start + datetime.timedelta(minutes=minutes),
+                batch_id=uuid.uuid4(),
+                total_market_value=Decimal(value),
+                total_cost=Decimal(cost) if cost else None,
+            )
+
+        hour = PortfolioSnapshotRollup.objects.get(owner=user, resolution="HOUR", period_start=start)
+        assert hour.samples == 3
+        assert (hour.value_open, hour.value_high, hour.value_low, hour.value_close) == (
+            Decimal("100"),
+            Decimal("110"),
+            Decimal("95"),
+            Decimal("95"),
+        )
+        assert (hour.cost_open, hour.cost_low, hour.cost_high) == (Decimal("90"), Decimal("90"), Decimal("92"))
+        assert hour.opened_at == start + datetime.timedelta(minutes=5)
+        assert hour.closed_at == start + datetime.timedelta(minutes=40)
+
+        day = PortfolioSnapshotRollup.objects.get(owner=user, resolution="DAY")
+        assert day.period_start == start.replace(hour=0)
+        assert (day.samples, day.value_high, day.value_close) == (4, Decimal("130"), Decimal("130"))
+
+    def test_concurrent_first_snapshots_of_a_period_share_one_rollup(self, user):
+        start = datetime.datetime(2025, 3, 4, 10, 0, tzinfo=datetime.UTC)
+
+        def snapshot(minutes, value):
+            PortfolioSnapshot.objects.create(
+                owner=user,
+                captured_at=start + datetime.timedelta(minutes=minutes),
+                batch_id=uuid.uuid4(),
+                total_market_value=Decimal(value),
+            )
+
+        snapshot(5, "100")
+        # The second snapshot finds no row, as if the first were still uncommitted.
+        with patch("django.db.models.query.QuerySet.first", return_value=None):
+            snapshot(20, "120")
+
+        hour = PortfolioSnapshotRollup.objects.get(owner=user, resolution="HOUR")
+        assert (hour.samples, hour.value_open, hour.value_high, hour.value_close) == (
+            2,
+            Decimal("100"),
+            Decimal("120"),
+            Decimal("120"),
+        )
+        assert PortfolioSnapshotRollup.objects.get(owner=user, resolution="DAY").samples == 2
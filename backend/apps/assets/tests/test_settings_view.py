@@ -1,11 +1,15 @@
 """
-Tests for SettingsView (GET/PUT /api/settings/).
+Tests for SettingsView (GET/PUT /api/settings/) and the read-only settings snapshot.
 """
 
+import dataclasses
+
 import pytest
 from django.contrib.auth import get_user_model
 from rest_framework.test import APIClient
 
+from apps.assets.models import Settings, SettingsSnapshot
+
 User = get_user_model()
 
 
@@ -104,3 +108,19 @@ class TestSettingsView:
         client.get("/api/settings/")
         resp = client.patch("/api/settings/", {"tax_country": "ESP"}, format="json")
         assert resp.status_code == 400
+
+
+@pytest.mark.django_db
+class TestSettingsSnapshot:
+    def test_covers_every_setting(self):
+        model_fields = {f.attname for f in Settings._meta.concrete_fields} - {"id"}
+        assert model_fields == {f.name for f in dataclasses.fields(SettingsSnapshot)}
+
+    def test_is_read_only(self, user):
+        with pytest.raises(dataclasses.FrozenInstanceError):
+            Settings.snapshot(user).cost_basis_method = "LIFO"
+
+    def test_update_is_seen_by_next_read(self, client, user):
+        assert Settings.snapshot(user).cost_basis_method == "FIFO"
+        client.patch("/api/settings/", {"cost_basis_method": "LIFO"}, format="json")
+        assert Settings.snapshot(user).cost_basis_method == "LIFO"
@@ -1,5 +1,5 @@
 """
-Tests for Celery tasks: snapshot dispatch, purge old snapshots.
+Tests for Celery tasks: snapshot dispatch, purge old snapshots, snapshot compaction.
 """
 
 import datetime
@@ -11,8 +11,8 @@ import pytest
 from django.contrib.auth import get_user_model
 from django.utils import timezone
 
-from apps.assets.models import PortfolioSnapshot, Settings
-from apps.assets.tasks import purge_old_snapshots_task, snapshot_all_users_task
+from apps.assets.models import PortfolioSnapshot, PortfolioSnapshotRollup, Settings
+from apps.assets.tasks import compact_snapshots_task, purge_old_snapshots_task, snapshot_all_users_task
 
 User = get_user_model()
 
@@ -95,6 +95,10 @@ class TestPurgeOldSnapshotsTask:
         assert PortfolioSnapshot.objects.filter(owner=user).count() == 1
         remaining = PortfolioSnapshot.objects.get(owner=user)
         assert remaining.batch_id == new_batch
+        # The rollups of the purged snapshot go with it.
+        assert set(PortfolioSnapshotRollup.objects.filter(owner=user).values_list("value_close", flat=True)) == {
+            Decimal("200")
+        }
 
     def test_no_purge_when_disabled(self, user):
         s = Settings.load(user)
@@ -113,3 +117,42 @@ class TestPurgeOldSnapshotsTask:
 
         purge_old_snapshots_task()
         assert PortfolioSnapshot.objects.filter(owner=user).count() == 1
+
+
+def _snapshot(user, days_ago, value):
+    return PortfolioSnapshot.objects.create(
+        owner=user,
+        captured_at=timezone.now() - datetime.timedelta(days=days_ago),
+        batch_id=uuid.uuid4(),
+        total_market_value=Decimal(value),
+        total_cost=Decimal("80"),
+        total_unrealized_pnl=Decimal(value) - Decimal("80"),
+    )
+
+
+@pytest.mark.django_db
+class TestCompactSnapshotsTask:
+    def test_deletes_rows_past_their_window(self, user, settings):
+        settings.SNAPSHOT_RAW_DAYS = 30
+        settings.SNAPSHOT_HOURLY_DAYS = 90
+        _snapshot(user, 120, "100")
+        _snapshot(user, 60, "150")
+        recent = _snapshot(user, 5, "200")
+
+        compact_snapshots_task()
+
+        assert list(PortfolioSnapshot.objects.filter(owner=user)) == [recent]
+        hourly = PortfolioSnapshotRollup.objects.filter(owner=user, resolution="HOUR")
+        assert sorted(hourly.values_list("value_close", flat=True)) == [Decimal("150"), Decimal("200")]
+        daily = PortfolioSnapshotRollup.objects.filter(owner=user, resolution="DAY")
+        assert sorted(daily.values_list("value_close", flat=True)) == [Decimal("100"), Decimal("150"), Decimal("200")]
+
+    def test_zero_keeps_every_row(self, user, settings):
+        settings.SNAPSHOT_RAW_DAYS = 0
+        settings.SNAPSHOT_HOURLY_DAYS = 0
+        _snapshot(user, 400, "100")
+
+        compact_snapshots_task()
+
+        assert PortfolioSnapshot.objects.filter(owner=user).count() == 1
+        assert PortfolioSnapshotRollup.objects.filter(owner=user).count() == 2
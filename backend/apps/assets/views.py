@@ -9,7 +9,7 @@ from rest_framework.permissions import IsAdminUser
 from rest_framework.response import Response
 from rest_framework.views import APIView
 
-from apps.core.cache import FINANCIAL_NAMESPACES, invalidate_user_cache
+from apps.core.cache import FINANCIAL_NAMESPACES, invalidate_user_cache, invalidate_user_cache_for
 from apps.core.mixins import OwnedByUserMixin
 
 from .models import Account, AccountSnapshot, Asset, Settings
@@ -114,7 +114,7 @@ class AssetViewSet(OwnedByUserMixin, viewsets.ModelViewSet):
                 "updated_at",
             ]
         )
-        invalidate_user_cache(request.user.pk, *FINANCIAL_NAMESPACES)
+        invalidate_user_cache_for(request.user.pk, Asset)
         return Response(AssetSerializer(asset).data)
 
 
@@ -191,6 +191,7 @@ class BulkSnapshotView(APIView):
             )
             snapshot._sync_account_balance()
             results.append(AccountSnapshotSerializer(snapshot).data)
+        invalidate_user_cache_for(request.user.pk, AccountSnapshot)
         return Response(results, status=status.HTTP_201_CREATED)
 
 
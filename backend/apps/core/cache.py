@@ -10,30 +10,472 @@ Usage:
         data = expensive_computation(user)
         set_user_cache(user.pk, "portfolio", data, timeout=60)
 
+    # Or let one process compute a miss while concurrent requests wait for it
+    data = get_or_compute_user_cache(user.pk, "portfolio", lambda: expensive_computation(user), timeout=60)
+
     # After mutations — clear related caches
     invalidate_user_cache(user.pk, "portfolio", "reports")
+
+    # Or clear what depends on the models that were written (CACHE_DEPENDENCIES)
+    invalidate_user_cache_for(user.pk, Dividend)
+
+Keys are versioned: each user has a generation counter per scope (one per
+namespace, plus one shared by all of ``FINANCIAL_NAMESPACES``), and the
+current generations are part of every key. Invalidating bumps the counters
+with atomic increments, a single one for all financial namespaces at once;
+entries under older generations are never read again and simply expire. Within a request or task the generation is read once
+(``apps.core.context``), so a slow computation that started before an
+invalidation stores its result under the old generation, where it can never
+be served.
+
+Reads go through two tiers: a bounded in-process LRU (L1, ``apps.core.lru``;
+``CACHE_L1_MAX_ENTRIES`` entries for at most ``CACHE_L1_TTL`` seconds) in
+front of the Django cache (L2, Redis). Generation counters stay out of L1:
+they are read from Redis with one ``MGET`` per request (then memoized by
+the context), so an invalidation reaches every process as soon as the
+counter is bumped, and L1 entries of older generations are never read again.
+Entries replaced under the same key (stale-while-revalidate refreshes) are
+published on a Redis channel and a listener thread in every process drops
+them from its L1; a process that loses the subscription clears its L1 on
+reconnect, and ``CACHE_L1_TTL`` bounds how stale such an entry can get
+otherwise.
+:func:`cache_stats` reports the hit ratio of each tier in this process, and
+``apps.core.metrics`` hits, misses, sets, invalidations, payload sizes and
+compute times per namespace across processes.
+
+Values of ``FINANCIAL_NAMESPACES`` are stored in Redis as compact, possibly
+compressed JSON bytes (``apps.core.codec``) rather than pickles, unless
+``CACHE_COMPACT_PAYLOADS`` is off; readers get them back as JSON types.
+Registered computations (:func:`register_user_computation`) are cached as
+rendered response bodies with an ETag, which views return as is.
 """
 
+import logging
+import os
+import pickle
+import threading
+import time
+import uuid
+from contextlib import suppress
+
+from django.conf import settings as django_settings
 from django.core.cache import cache
 
+from . import codec, metrics
+from .context import current_memo, forget_user
+from .lru import MISSING, LRUCache
+
+logger = logging.getLogger(__name__)
+
 _PREFIX = "ft"
+_FINANCIAL_SCOPE = "data"
+# Seconds between cache reads while another process computes a value.
+_POLL_INTERVAL = 0.05
+_INVALIDATION_CHANNEL = f"{_PREFIX}:cache:invalidate"
+
+
+# ---------------------------------------------------------------------------
+# Tiers
+# ---------------------------------------------------------------------------
+
+_l1 = None
+_l1_pid = None
+_l2_hits = 0
+_l2_misses = 0
+
+
+def _local():
+    """This process's L1, or ``None`` when disabled.
+
+    Created on first use in each process (a forked worker never trusts its
+    parent's copy) together with the invalidation listener.
+    """
+    global _l1, _l1_pid
+    max_entries = getattr(django_settings, "CACHE_L1_MAX_ENTRIES", 1000)
+    if not max_entries:
+        return None
+    if _l1_pid != os.getpid():
+        _l1 = LRUCache(max_entries, getattr(django_settings, "CACHE_L1_TTL", 30))
+        _l1_pid = os.getpid()
+        _start_listener(_l1)
+    return _l1
+
+
+def _redis():
+    """The Redis client behind the Django cache, or ``None`` for other backends."""
+    get_client = getattr(getattr(cache, "_cache", None), "get_client", None)
+    return get_client(write=True) if get_client is not None else None
+
+
+def _start_listener(l1):
+    client = _redis()
+    if client is None:
+        return
+    threading.Thread(target=_listen, args=(client, l1), name="ft-cache-invalidation", daemon=True).start()
+
+
+def _listen(client, l1):
+    while True:
+        try:
+            pubsub = client.pubsub(ignore_subscribe_messages=True)
+            pubsub.subscribe(_INVALIDATION_CHANNEL)
+            # Anything published while we were not subscribed is lost.
+            l1.clear()
+            for message in pubsub.listen():
+                _on_message(l1, message["data"])
+        except Exception:
+            logger.warning("Cache invalidation listener lost its subscription; retrying", exc_info=True)
+            time.sleep(1)
+
+
+def _on_message(l1, data):
+    l1.delete(*(data.decode() if isinstance(data, bytes) else data).split())
+
 
+def _compact(namespace):
+    if namespace in FINANCIAL_NAMESPACES and getattr(django_settings, "CACHE_COMPACT_PAYLOADS", True):
+        return codec.JSON
+    return None
 
-def _key(user_id, namespace):
-    return f"{_PREFIX}:{user_id}:{namespace}"
+
+def _get(key, fmt=None):
+    """Read ``key`` from L1, then L2, decoding L2 values with the ``fmt`` codec.
+
+    L1 holds decoded values, so only an L2 hit pays for decoding.
+    """
+    global _l2_hits, _l2_misses
+    l1 = _local()
+    if l1 is not None:
+        value = l1.get(key)
+        if value is not MISSING:
+            return value
+    value = cache.get(key)
+    if value is None:
+        _l2_misses += 1
+        return None
+    _l2_hits += 1
+    # Entries pickled before compact payloads were turned on are still served as is.
+    if fmt is not None and isinstance(value, bytes):
+        value = fmt.loads(value)
+    if l1 is not None:
+        l1.set(key, value)
+    return value
+
+
+def _set(key, value, timeout, fmt=None, namespace=None):
+    if fmt is not None:
+        payload = fmt.dumps(value)
+        # Keep what other processes will read, so a hit looks the same from either tier.
+        value = fmt.loads(payload)
+    else:
+        payload = value
+    cache.set(key, payload, timeout)
+    if namespace is not None:
+        _record_set(namespace, payload)
+    l1 = _local()
+    if l1 is not None:
+        l1.set(key, value, timeout)
+
+
+def _record_set(namespace, payload):
+    if not getattr(django_settings, "CACHE_METRICS", True):
+        return
+    size = len(payload) if isinstance(payload, bytes) else len(pickle.dumps(payload, pickle.HIGHEST_PROTOCOL))
+    metrics.incr(namespace, "sets")
+    metrics.incr(namespace, "bytes_written", size)
+    metrics.observe(namespace, "payload_bytes", size)
+
+
+def _drop(*keys):
+    """Drop ``keys`` from the L1 of every process."""
+    l1 = _local()
+    if l1 is None:
+        return
+    l1.delete(*keys)
+    client = _redis()
+    if client is not None:
+        client.publish(_INVALIDATION_CHANNEL, " ".join(keys))
+
+
+def cache_stats():
+    """Hits, misses and hit ratio of each tier in this process. L2 only counts lookups that missed L1."""
+    l1 = _local()
+    tiers = {
+        "l1": {"hits": l1.hits if l1 else 0, "misses": l1.misses if l1 else 0, "size": len(l1) if l1 else 0},
+        "l2": {"hits": _l2_hits, "misses": _l2_misses},
+    }
+    for tier in tiers.values():
+        lookups = tier["hits"] + tier["misses"]
+        tier["hit_ratio"] = round(tier["hits"] / lookups, 4) if lookups else None
+    return tiers
+
+
+def _key(user_id, namespace, generation):
+    return f"{_PREFIX}:{user_id}:{namespace}:g{generation}"
+
+
+def _generation_key(user_id, scope):
+    return f"{_PREFIX}:{user_id}:gen:{scope}"
+
+
+def _scopes(namespace):
+    return (_FINANCIAL_SCOPE, namespace) if namespace in FINANCIAL_NAMESPACES else (namespace,)
+
+
+def _read_generations(user_id, scopes):
+    # Straight from Redis, never L1: a process that missed an invalidation message must still see the new generation.
+    keys = {scope: _generation_key(user_id, scope) for scope in scopes}
+    found = cache.get_many(list(keys.values()))
+    generations = {}
+    for scope, key in keys.items():
+        generation = found.get(key)
+        if generation is None:
+            # Start from the clock: a counter lost to eviction never restarts at a generation already used.
+            cache.add(key, time.time_ns(), timeout=None)
+            generation = cache.get(key)
+        generations[scope] = generation
+    return generations
+
+
+def _generation(user_id, namespace):
+    scopes = _scopes(namespace)
+    memo = current_memo()
+    generations = {}
+    if memo is not None:
+        generations = {scope: memo[key] for scope in scopes if (key := (user_id, "cache:generation", scope)) in memo}
+    missing = [scope for scope in scopes if scope not in generations]
+    if missing:
+        read = _read_generations(user_id, missing)
+        generations.update(read)
+        if memo is not None:
+            memo.update({(user_id, "cache:generation", scope): generation for scope, generation in read.items()})
+    return ".".join(str(generations[scope]) for scope in scopes)
 
 
 def get_user_cache(user_id, namespace):
-    return cache.get(_key(user_id, namespace))
+    data = _get(_key(user_id, namespace, _generation(user_id, namespace)), _compact(namespace))
+    metrics.incr(namespace, "misses" if data is None else "hits")
+    return data
 
 
 def set_user_cache(user_id, namespace, data, timeout=60):
-    cache.set(_key(user_id, namespace), data, timeout)
+    _set(_key(user_id, namespace, _generation(user_id, namespace)), data, timeout, _compact(namespace), namespace)
+
+
+def get_or_compute_user_cache(user_id, namespace, compute, timeout=60):
+    """Return the cached value, computing it on a miss in only one process at a time (single-flight).
+
+    The process that takes the ``SET NX`` lock on the key computes and stores
+    the value; the others poll for it for up to ``CACHE_COMPUTE_WAIT`` seconds
+    and compute it themselves if it has not appeared by then. The lock expires
+    after ``CACHE_COMPUTE_LOCK_TIMEOUT`` seconds in case its holder dies.
+    """
+    key = _key(user_id, namespace, _generation(user_id, namespace))
+    return _single_flight(namespace, key, compute, timeout, _compact(namespace))
+
+
+def _timed(namespace, compute):
+    start = time.perf_counter()
+    data = compute()
+    metrics.observe(namespace, "compute_seconds", time.perf_counter() - start)
+    return data
+
+
+def _single_flight(namespace, key, compute, timeout, fmt=None):
+    data = _get(key, fmt)
+    if data is not None:
+        metrics.incr(namespace, "hits")
+        return data
+    metrics.incr(namespace, "misses")
+
+    lock = f"{key}:lock"
+    token = uuid.uuid4().hex
+    if not _acquire(lock, token, getattr(django_settings, "CACHE_COMPUTE_LOCK_TIMEOUT", 30)):
+        deadline = time.monotonic() + getattr(django_settings, "CACHE_COMPUTE_WAIT", 5)
+        while time.monotonic() < deadline:
+            time.sleep(_POLL_INTERVAL)
+            data = _get(key, fmt)
+            if data is not None:
+                return data
+        token = None
+
+    try:
+        data = _timed(namespace, compute)
+        _set(key, data, timeout, fmt, namespace)
+    finally:
+        if token is not None:
+            _release(lock, token)
+    return data
+
+
+# Deletes the lock only while it still holds our token, in one step: a lock
+# that expired mid-compute and was taken by another process is left alone.
+_RELEASE_LOCK = """
+if redis.call("get", KEYS[1]) == ARGV[1] then
+    return redis.call("del", KEYS[1])
+end
+return 0
+"""
+
+
+def _acquire(lock, token, timeout):
+    client = _redis()
+    if client is None:
+        return cache.add(lock, token, timeout=timeout)
+    return bool(client.set(cache.make_and_validate_key(lock), token, nx=True, ex=timeout))
+
+
+def _release(lock, token):
+    client = _redis()
+    if client is None:
+        # No compare-and-delete without Redis; only the local-memory cache of tests and development gets here.
+        if cache.get(lock) == token:
+            cache.delete(lock)
+        return
+    client.eval(_RELEASE_LOCK, 1, cache.make_and_validate_key(lock), token)
+
+
+# ---------------------------------------------------------------------------
+# Registered computations and stale-while-revalidate
+# ---------------------------------------------------------------------------
+
+_computations = {}
+
+
+def register_user_computation(namespace, compute, timeout):
+    """Declare how ``namespace`` is computed (``compute(user)``) and for how many seconds it stays fresh.
+
+    Apps register their cached payloads in ``AppConfig.ready`` so that web
+    and Celery processes alike can (re)compute them by namespace.
+    """
+    _computations[namespace] = (compute, timeout)
+
+
+def registered_computations():
+    """``{namespace: (compute, timeout)}`` for every registered computation."""
+    return dict(_computations)
+
+
+def _stale_key(user_id, namespace):
+    return _key(user_id, f"{namespace}:swr", _generation(user_id, namespace))
+
+
+def _rendered(compute, user):
+    return codec.Rendered.of(codec.render(compute(user)))
+
+
+def cached_user_computation(user, namespace):
+    """Serve a registered computation from the cache; returns ``(rendered, stale)``.
+
+    ``rendered`` is a :class:`~apps.core.codec.Rendered` response body and
+    ETag: a hit costs no serialization at all. By default this is
+    :func:`get_or_compute_user_cache` and ``stale`` is always ``False``. With
+    ``CACHE_STALE_WHILE_REVALIDATE`` on, entries are kept for
+    ``CACHE_STALE_TTL`` seconds past their freshness timeout; an expired one
+    is returned at once with ``stale=True`` while a Celery task recomputes it.
+    Invalidation still moves readers to a new generation, so nothing written
+    before a change is ever served after it.
+    """
+    compute, timeout = _computations[namespace]
+    key = _key(user.pk, namespace, _generation(user.pk, namespace))
+    if not getattr(django_settings, "CACHE_STALE_WHILE_REVALIDATE", False):
+        return _single_flight(namespace, key, lambda: _rendered(compute, user), timeout, codec.RENDERED), False
+
+    key = _stale_key(user.pk, namespace)
+    rendered, fresh_until = _single_flight(
+        namespace,
+        key,
+        lambda: (_rendered(compute, user), time.time() + timeout),
+        timeout + getattr(django_settings, "CACHE_STALE_TTL", 3600),
+        codec.stale(codec.RENDERED),
+    )
+    if time.time() < fresh_until:
+        return rendered, False
+    metrics.incr(namespace, "stale_hits")
+    # One refresh per entry: the task clears the marker once the new value is stored.
+    if cache.add(f"{key}:refresh", 1, timeout=getattr(django_settings, "CACHE_COMPUTE_LOCK_TIMEOUT", 30)):
+        from .tasks import refresh_user_cache_task
+
+        refresh_user_cache_task.delay(user.pk, namespace)
+    return rendered, True
+
+
+def refresh_user_computation(user, namespace):
+    """Recompute a registered computation and store it as fresh (the background half of stale-while-revalidate)."""
+    compute, timeout = _computations[namespace]
+    key = _stale_key(user.pk, namespace)
+    rendered = _timed(namespace, lambda: _rendered(compute, user))
+    entry = codec.stale(codec.RENDERED).dumps((rendered, time.time() + timeout))
+    cache.set(key, entry, timeout + getattr(django_settings, "CACHE_STALE_TTL", 3600))
+    _record_set(namespace, entry)
+    cache.delete(f"{key}:refresh")
+    # Other processes still hold the stale entry in L1.
+    _drop(key)
+    return rendered
+
+
+# ---------------------------------------------------------------------------
+# Warm-up
+# ---------------------------------------------------------------------------
+
+
+def warm_user_cache(user, namespaces=None):
+    """Compute and store registered computations (all by default) that are not cached yet for ``user``.
+
+    Namespaces already cached for the current generation cost one lookup.
+    Best effort: a computation that fails is logged and skipped.
+    """
+    warmed = []
+    for namespace in namespaces or list(_computations):
+        try:
+            cached_user_computation(user, namespace)
+        except Exception:
+            logger.warning("Cache warm-up of %s failed for user %s", namespace, user.pk, exc_info=True)
+        else:
+            warmed.append(namespace)
+    return warmed
+
+
+def schedule_user_cache_warm_up(user_id, login=False):
+    """Queue a warm-up for ``user_id`` unless disabled or one was queued in the last ``CACHE_WARM_INTERVAL`` seconds.
+
+    Called after invalidations made by background jobs (``CACHE_WARM_UP``)
+    and, with ``login=True``, on sign-in (``CACHE_WARM_ON_LOGIN``). The
+    per-user interval and the task's ``CACHE_WARM_RATE_LIMIT`` keep bursts
+    from tying up the workers. Returns whether a task was queued.
+    """
+    if not getattr(django_settings, "CACHE_WARM_ON_LOGIN" if login else "CACHE_WARM_UP", not login):
+        return False
+    if not cache.add(f"{_PREFIX}:{user_id}:warm", 1, timeout=getattr(django_settings, "CACHE_WARM_INTERVAL", 60)):
+        return False
+    from .tasks import warm_user_cache_task
+
+    warm_user_cache_task.delay(user_id)
+    return True
 
 
 def invalidate_user_cache(user_id, *namespaces):
-    keys = [_key(user_id, ns) for ns in namespaces]
-    cache.delete_many(keys)
+    forget_user(user_id)
+    scopes = list(dict.fromkeys(namespaces))
+    for namespace in scopes:
+        metrics.incr(namespace, "invalidations")
+    if all(ns in scopes for ns in FINANCIAL_NAMESPACES):
+        scopes = [_FINANCIAL_SCOPE, *(ns for ns in scopes if ns not in FINANCIAL_NAMESPACES)]
+    for scope in scopes:
+        # No counter yet (or evicted) raises ValueError: the next read starts a fresh one from the clock.
+        with suppress(ValueError):
+            cache.incr(_generation_key(user_id, scope))
+
+
+def invalidate_user_cache_for(user_id, *models):
+    """Invalidate the namespaces that depend on ``models`` (classes or ``"app_label.Model"`` labels).
+
+    A model missing from ``CACHE_DEPENDENCIES`` invalidates every financial namespace.
+    """
+    labels = [model if isinstance(model, str) else model._meta.label for model in models]
+    invalidate_user_cache(
+        user_id, *(ns for label in labels for ns in CACHE_DEPENDENCIES.get(label, FINANCIAL_NAMESPACES))
+    )
 
 
 # All cache namespaces used in the app
@@ -54,3 +496,26 @@ FINANCIAL_NAMESPACES = (
     NS_REPORTS_YEAR,
     NS_REPORTS_ANNUAL_SAVINGS,
 )
+
+# Namespaces computed from each model's rows. Writes invalidate only these
+# (see invalidate_user_cache_for); an empty tuple means nothing cached reads it.
+CACHE_DEPENDENCIES = {
+    # Replayed for positions, realized P&L and monthly investment cost.
+    "transactions.Transaction": (
+        NS_PORTFOLIO,
+        NS_REPORTS_PATRIMONIO,
+        NS_REPORTS_SAVINGS,
+        NS_REPORTS_YEAR,
+        NS_REPORTS_ANNUAL_SAVINGS,
+    ),
+    "transactions.Dividend": (NS_REPORTS_YEAR,),
+    "transactions.Interest": (NS_REPORTS_YEAR,),
+    "payroll.Payroll": (NS_REPORTS_YEAR,),
+    "payroll.Employer": (),
+    # Current prices value open positions (and today's patrimonio point).
+    "assets.Asset": (NS_PORTFOLIO, NS_REPORTS_PATRIMONIO, NS_REPORTS_ANNUAL_SAVINGS),
+    # Cash balances.
+    "assets.Account": (NS_PORTFOLIO, NS_REPORTS_PATRIMONIO, NS_REPORTS_SAVINGS, NS_REPORTS_ANNUAL_SAVINGS),
+    "assets.AccountSnapshot": (NS_PORTFOLIO, NS_REPORTS_PATRIMONIO, NS_REPORTS_SAVINGS, NS_REPORTS_ANNUAL_SAVINGS),
+    "assets.PortfolioSnapshot": (NS_REPORTS_RV, NS_REPORTS_PATRIMONIO, NS_REPORTS_ANNUAL_SAVINGS),
+}
@@ -0,0 +1,89 @@
+"""
+Compact wire format for cached API payloads.
+
+Portfolio and report payloads are JSON-shaped dicts and lists full of
+``Decimal`` amounts and dates; pickled, every ``Decimal`` carries its class
+reference and constructor call. They are stored in Redis as compact JSON
+bytes instead, rendered exactly as the API renders them (DRF's
+``JSONRenderer``, so dates take their ISO form and a bare ``Decimal``
+becomes a number) and zlib-compressed above ``CACHE_COMPRESS_MIN_BYTES``.
+A one-byte header records which.
+
+A :class:`Codec` turns a value into those bytes and back, and tells the
+cache what its in-process tier should keep:
+
+- :data:`JSON` decodes to plain JSON types, which render to the same
+  response body as the original value.
+- :data:`RENDERED` keeps the response body itself (:class:`Rendered`, with
+  its ETag), so a cached view returns it without rendering anything.
+- :func:`stale` prefixes another codec's bytes with a freshness deadline.
+"""
+
+import hashlib
+import json
+import struct
+import zlib
+from typing import NamedTuple
+
+from django.conf import settings as django_settings
+from rest_framework.renderers import JSONRenderer
+
+_PLAIN = b"j"
+_ZLIB = b"z"
+_DEADLINE = struct.Struct("<d")
+
+
+class Codec(NamedTuple):
+    dumps: object
+    loads: object
+
+
+class Rendered(NamedTuple):
+    """A JSON response body and its ETag."""
+
+    body: bytes
+    etag: str
+
+    @classmethod
+    def of(cls, body):
+        return cls(body, f'"{hashlib.blake2b(body, digest_size=16).hexdigest()}"')
+
+
+def render(value):
+    return JSONRenderer().render(value)
+
+
+def pack(body):
+    threshold = getattr(django_settings, "CACHE_COMPRESS_MIN_BYTES", 1024)
+    if threshold and len(body) >= threshold:
+        return _ZLIB + zlib.compress(body, getattr(django_settings, "CACHE_COMPRESS_LEVEL", 6))
+    return _PLAIN + body
+
+
+def unpack(data):
+    header, body = data[:1], data[1:]
+    if header == _ZLIB:
+        return zlib.decompress(body)
+    if header != _PLAIN:
+        raise ValueError(f"Unknown cache payload header {header!r}")
+    return body
+
+
+def dumps(value):
+    return pack(render(value))
+
+
+def loads(data):
+    return json.loads(unpack(data))
+
+
+JSON = Codec(dumps, loads)
+RENDERED = Codec(lambda rendered: pack(rendered.body), lambda data: Rendered.of(unpack(data)))
+
+
+def stale(codec):
+    """Wrap ``codec`` for ``(value, fresh_until)`` pairs, the deadline being a timestamp."""
+    return Codec(
+        lambda entry: _DEADLINE.pack(entry[1]) + codec.dumps(entry[0]),
+        lambda data: (codec.loads(data[_DEADLINE.size :]), _DEADLINE.unpack_from(data)[0]),
+    )
@@ -0,0 +1,73 @@
+"""
+Request/task-scoped memoization for per-user computations.
+
+A single request (or Celery task) often asks for the same derived data
+several times: ``annual_savings`` replays the portfolio for three report
+series, ``year_summary`` and the tax adapter both need fiscal realized
+sales, and ``Settings.snapshot`` is called by almost every service. Inside a
+computation context those results are computed once and reused.
+
+Usage:
+    from apps.core.context import computation_context, memoized
+
+    with computation_context():
+        settings = memoized((user.pk, "settings"), lambda: load_settings(user))
+
+Outside a context ``memoized`` simply calls the function, so services behave
+exactly as before when used from the shell or tests.
+
+Keys must be tuples whose first element is the user id; writes that change a
+user's data call :func:`forget_user` (``invalidate_user_cache`` does it for
+every cache invalidation) so later reads in the same request see fresh data.
+"""
+
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+_memo = ContextVar("ft_computation_memo", default=None)
+
+
+def current_memo():
+    """Return the active memo dict, or ``None`` outside a computation context."""
+    return _memo.get()
+
+
+def enter_computation_context():
+    """Open a context and return a token for :func:`exit_computation_context`.
+
+    Nested calls reuse the outer context and return ``None``.
+    """
+    if _memo.get() is not None:
+        return None
+    return _memo.set({})
+
+
+def exit_computation_context(token):
+    if token is not None:
+        _memo.reset(token)
+
+
+@contextmanager
+def computation_context():
+    token = enter_computation_context()
+    try:
+        yield
+    finally:
+        exit_computation_context(token)
+
+
+def memoized(key, compute):
+    memo = _memo.get()
+    if memo is None:
+        return compute()
+    if key not in memo:
+        memo[key] = compute()
+    return memo[key]
+
+
+def forget_user(user_id):
+    memo = _memo.get()
+    if not memo:
+        return
+    for key in [k for k in memo if k[0] == user_id]:
+        del memo[key]
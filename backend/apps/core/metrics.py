@@ -0,0 +1,149 @@
+"""
+Per-namespace cache metrics, for tuning TTLs.
+
+``apps.core.cache`` records, per namespace, counters (hits, misses, stale
+hits, sets, invalidations, bytes written) and histograms (seconds spent
+computing a miss, size of the stored payload). Each process accumulates
+them in memory and adds them to one Redis hash every
+``CACHE_METRICS_FLUSH_INTERVAL`` seconds, so :func:`report` covers every
+web and Celery process. Without Redis (tests, a local-memory cache) the
+report covers this process only.
+
+Usage:
+    from apps.core import metrics
+
+    metrics.incr("portfolio", "hits")
+    metrics.observe("portfolio", "compute_seconds", 0.42)
+    metrics.report()  # {"portfolio": {"hits": 1, ..., "compute_seconds": {...}}}
+"""
+
+import logging
+import threading
+import time
+from collections import defaultdict
+
+from django.conf import settings as django_settings
+
+logger = logging.getLogger(__name__)
+
+COUNTERS = ("hits", "misses", "stale_hits", "sets", "invalidations", "bytes_written")
+# Upper bounds of each histogram's buckets; larger values land in "+Inf".
+HISTOGRAMS = {
+    "compute_seconds": (0.01, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30),
+    "payload_bytes": (1024, 4096, 16384, 65536, 262144, 1048576),
+}
+_HASH = "ft:cache:metrics"
+
+_lock = threading.Lock()
+# Field ("namespace|name" or "namespace|histogram|bucket") -> amount not yet flushed.
+_pending = defaultdict(float)
+# Everything flushed so far, when there is no Redis to flush to.
+_local_totals = defaultdict(float)
+_flushed_at = time.monotonic()
+
+
+def _enabled():
+    return getattr(django_settings, "CACHE_METRICS", True)
+
+
+def _add(amounts):
+    if not _enabled():
+        return
+    with _lock:
+        for field, amount in amounts.items():
+            _pending[field] += amount
+        due = time.monotonic() - _flushed_at >= getattr(django_settings, "CACHE_METRICS_FLUSH_INTERVAL", 10)
+    if due:
+        flush()
+
+
+def incr(namespace, name, amount=1):
+    _add({f"{namespace}|{name}": amount})
+
+
+def observe(namespace, name, value):
+    bucket = next((str(bound) for bound in HISTOGRAMS[name] if value <= bound), "+Inf")
+    _add({f"{namespace}|{name}|{bucket}": 1, f"{namespace}|{name}|sum": value})
+
+
+def _redis():
+    from .cache import _redis
+
+    return _redis()
+
+
+def flush():
+    """Add this process's pending amounts to the shared totals."""
+    global _flushed_at
+    with _lock:
+        pending = dict(_pending)
+        _pending.clear()
+        _flushed_at = time.monotonic()
+    if not pending:
+        return
+    client = _redis()
+    if client is None:
+        with _lock:
+            for field, amount in pending.items():
+                _local_totals[field] += amount
+        return
+    try:
+        pipe = client.pipeline(transaction=False)
+        for field, amount in pending.items():
+            if field.endswith("|sum"):
+                pipe.hincrbyfloat(_HASH, field, amount)
+            else:
+                pipe.hincrby(_HASH, field, int(amount))
+        pipe.execute()
+    except Exception:
+        logger.warning("Could not flush cache metrics; keeping them for the next flush", exc_info=True)
+        with _lock:
+            for field, amount in pending.items():
+                _pending[field] += amount
+
+
+def _totals():
+    client = _redis()
+    if client is None:
+        with _lock:
+            return dict(_local_totals)
+    return {field.decode(): float(value) for field, value in client.hgetall(_HASH).items()}
+
+
+def report():
+    """``{namespace: {counter: n, ..., "hit_ratio": r, histogram: {"count", "sum", "buckets"}}}`` across processes."""
+    flush()
+    namespaces = {}
+    for field, amount in _totals().items():
+        namespace, name, *bucket = field.split("|")
+        entry = namespaces.setdefault(namespace, _empty())
+        if bucket:
+            histogram = entry[name]
+            if bucket[0] == "sum":
+                histogram["sum"] = round(amount, 6)
+            else:
+                histogram["buckets"][bucket[0]] = int(amount)
+                histogram["count"] += int(amount)
+        else:
+            entry[name] = int(amount)
+    for entry in namespaces.values():
+        lookups = entry["hits"] + entry["misses"]
+        entry["hit_ratio"] = round(entry["hits"] / lookups, 4) if lookups else None
+    return dict(sorted(namespaces.items()))
+
+
+def _empty():
+    entry = dict.fromkeys(COUNTERS, 0)
+    for name, bounds in HISTOGRAMS.items():
+        entry[name] = {"count": 0, "sum": 0, "buckets": dict.fromkeys([*map(str, bounds), "+Inf"], 0)}
+    return entry
+
+
+def reset():
+    """Forget every metric, here and in Redis."""
+    with _lock:
+        _pending.clear()
+        _local_totals.clear()
+    client = _redis()
+    if client is not None:
+        client.delete(_HASH)
@@ -0,0 +1,12 @@
+from .context import computation_context
+
+
+class ComputationContextMiddleware:
+    """Scope memoized per-user computations (see ``apps.core.context``) to one request."""
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        with computation_context():
+            return self.get_response(request)
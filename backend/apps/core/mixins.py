@@ -1,4 +1,11 @@
-from apps.core.cache import FINANCIAL_NAMESPACES, invalidate_user_cache
+import json
+
+from django.utils.http import parse_etags
+from rest_framework import status
+from rest_framework.renderers import JSONRenderer
+from rest_framework.response import Response
+
+from apps.core.cache import cached_user_computation, invalidate_user_cache_for
 
 
 class OwnedByUserMixin:
@@ -6,7 +13,8 @@ class OwnedByUserMixin:
     ViewSet mixin that automatically filters querysets to the authenticated user
     and injects owner on creation. Must be listed BEFORE ModelViewSet in MRO.
 
-    Automatically invalidates financial caches on create/update/delete.
+    Automatically invalidates the caches that depend on the model
+    (``apps.core.cache.CACHE_DEPENDENCIES``) on create/update/delete.
     """
 
     # Subclasses can set this to False to skip cache invalidation
@@ -17,7 +25,7 @@ class OwnedByUserMixin:
 
     def _invalidate(self):
         if self.invalidates_financial_cache:
-            invalidate_user_cache(self.request.user.pk, *FINANCIAL_NAMESPACES)
+            invalidate_user_cache_for(self.request.user.pk, self.get_queryset().model)
 
     def perform_create(self, serializer):
         serializer.save(owner=self.request.user)
@@ -30,3 +38,68 @@ class OwnedByUserMixin:
     def perform_destroy(self, instance):
         super().perform_destroy(instance)
         self._invalidate()
+
+
+class RenderedResponse(Response):
+    """A ``Response`` whose JSON body was rendered ahead of time (see ``apps.core.codec.Rendered``).
+
+    Negotiated to plain JSON it returns the body as is; any other renderer
+    (the browsable API, or JSON with an ``indent`` parameter) renders the
+    parsed body as usual. ``data`` is parsed lazily, for those renderers and
+    for tests.
+    """
+
+    def __init__(self, body, **kwargs):
+        self.body = body
+        super().__init__(**kwargs)
+
+    @property
+    def data(self):
+        if self._data is None:
+            self._data = json.loads(self.body)
+        return self._data
+
+    @data.setter
+    def data(self, value):
+        self._data = value
+
+    @property
+    def rendered_content(self):
+        if type(self.accepted_renderer) is not JSONRenderer or "indent" in self.accepted_media_type:
+            return super().rendered_content
+        self["Content-Type"] = self.content_type or self.accepted_renderer.media_type
+        return self.body
+
+
+def rendered_response(request, rendered, stale=False):
+    """Respond with a :class:`~apps.core.codec.Rendered` body and its ETag, or a 304 if the client has it."""
+    etags = parse_etags(request.headers.get("If-None-Match", ""))
+    if rendered.etag in etags or "*" in etags:
+        response = Response(status=status.HTTP_304_NOT_MODIFIED)
+    else:
+        response = RenderedResponse(rendered.body)
+    response["ETag"] = rendered.etag
+    if stale:
+        response["X-Cache-Stale"] = "true"
+    return response
+
+
+class CachedComputationMixin:
+    """
+    APIView mixin that serves the computation registered for ``cache_namespace``
+    (see ``apps.core.cache.register_user_computation``) for the requesting user.
+
+    Hits are returned as the cached JSON bytes, without rendering, and carry
+    an ``ETag``; a request whose ``If-None-Match`` matches gets a 304.
+    Responses served from an expired entry in stale-while-revalidate mode carry
+    an ``X-Cache-Stale: true`` header.
+    """
+
+    cache_namespace = None
+
+    def cached_response(self, request):
+        rendered, stale = cached_user_computation(request.user, self.cache_namespace)
+        return rendered_response(request, rendered, stale)
+
+    def get(self, request):
+        return self.cached_response(request)
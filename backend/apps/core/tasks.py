@@ -0,0 +1,34 @@
+import logging
+
+from celery import shared_task
+from django.conf import settings
+
+logger = logging.getLogger(__name__)
+
+
+@shared_task
+def refresh_user_cache_task(user_id: int, namespace: str) -> None:
+    """Recompute a stale cached computation for `user_id` (stale-while-revalidate, see apps.core.cache)."""
+    from django.contrib.auth import get_user_model
+
+    from apps.core.cache import refresh_user_computation
+
+    user = get_user_model().objects.filter(pk=user_id).first()
+    if user is None:
+        logger.info("refresh_user_cache_task: user %s not found, skipping", user_id)
+        return
+    refresh_user_computation(user, namespace)
+
+
+@shared_task(rate_limit=getattr(settings, "CACHE_WARM_RATE_LIMIT", None))
+def warm_user_cache_task(user_id: int) -> None:
+    """Precompute `user_id`'s portfolio and report caches (see apps.core.cache.schedule_user_cache_warm_up)."""
+    from django.contrib.auth import get_user_model
+
+    from apps.core.cache import warm_user_cache
+
+    user = get_user_model().objects.filter(pk=user_id).first()
+    if user is None:
+        logger.info("warm_user_cache_task: user %s not found, skipping", user_id)
+        return
+    warm_user_cache(user)
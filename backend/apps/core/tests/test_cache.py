@@ -1,6 +1,54 @@
+import datetime
+import json
+import time
+import uuid
+from decimal import Decimal
+from unittest.mock import MagicMock, patch
+
 import pytest
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from rest_framework.test import APIClient
+
+from apps.core import codec, metrics
+from apps.core.cache import (
+    FINANCIAL_NAMESPACES,
+    NS_PORTFOLIO,
+    NS_REPORTS_RV,
+    NS_REPORTS_YEAR,
+    NS_SETTINGS,
+    _computations,
+    _generation,
+    _key,
+    _local,
+    _on_message,
+    cache_stats,
+    cached_user_computation,
+    get_or_compute_user_cache,
+    get_user_cache,
+    invalidate_user_cache,
+    invalidate_user_cache_for,
+    register_user_computation,
+    registered_computations,
+    schedule_user_cache_warm_up,
+    set_user_cache,
+    warm_user_cache,
+)
+from apps.core.context import computation_context
+from apps.core.lru import MISSING, LRUCache
+from apps.core.tasks import refresh_user_cache_task
+
+
+@pytest.fixture(autouse=True)
+def _clear_caches():
+    # These tests write under small user ids that other test modules reuse.
+    yield
+    cache.clear()
+
 
-from apps.core.cache import _key, get_user_cache, invalidate_user_cache, set_user_cache
+@pytest.fixture
+def user(db):
+    return get_user_model().objects.create_user(username="cacheuser", password="testpass123")
 
 
 @pytest.mark.django_db
@@ -22,10 +70,380 @@ class TestCacheHelpers:
         assert get_user_cache(1, "ns2") is None
 
     def test_key_format(self):
-        assert _key(42, "portfolio") == "ft:42:portfolio"
+        assert _key(42, "portfolio", 7) == "ft:42:portfolio:g7"
+
+    def test_invalidate_is_one_increment_per_scope(self):
+        set_user_cache(1, NS_PORTFOLIO, "p")
+        set_user_cache(1, NS_SETTINGS, "s")
+        with patch.object(cache, "incr", wraps=cache.incr) as incr, patch.object(cache, "delete_many") as delete_many:
+            invalidate_user_cache(1, *FINANCIAL_NAMESPACES)
+        assert incr.call_count == 1
+        delete_many.assert_not_called()
+        assert get_user_cache(1, NS_PORTFOLIO) is None
+        assert get_user_cache(1, NS_SETTINGS) == "s"
+
+    def test_late_write_after_invalidation_is_never_served(self):
+        with computation_context():
+            assert get_user_cache(1, NS_PORTFOLIO) is None
+            # Another worker invalidates while this one is still computing.
+            other_generation = cache.get("ft:1:gen:data")
+            cache.incr("ft:1:gen:data")
+            set_user_cache(1, NS_PORTFOLIO, "stale")
+        assert cache.get("ft:1:gen:data") == other_generation + 1
+        assert get_user_cache(1, NS_PORTFOLIO) is None
+
+    def test_lost_counter_restarts_above_previous_generations(self):
+        set_user_cache(1, NS_PORTFOLIO, "old")
+        cache.delete("ft:1:gen:data")
+        _local().clear()
+        assert get_user_cache(1, NS_PORTFOLIO) is None
 
     def test_different_users_isolated(self):
         set_user_cache(1, "ns", "user1_data")
         set_user_cache(2, "ns", "user2_data")
         assert get_user_cache(1, "ns") == "user1_data"
         assert get_user_cache(2, "ns") == "user2_data"
+
+
+def _lock_held_elsewhere():
+    add = cache.add
+    return patch.object(
+        cache, "add", lambda key, *args, **kwargs: not key.endswith(":lock") and add(key, *args, **kwargs)
+    )
+
+
+@pytest.mark.django_db
+class TestDependencies:
+    def _cached(self, user_id):
+        return {ns for ns in FINANCIAL_NAMESPACES if get_user_cache(user_id, ns) is not None}
+
+    def _fill(self, user_id):
+        for ns in FINANCIAL_NAMESPACES:
+            set_user_cache(user_id, ns, ns)
+
+    def test_invalidates_only_dependent_namespaces(self):
+        self._fill(1)
+        invalidate_user_cache_for(1, "transactions.Dividend")
+        assert self._cached(1) == set(FINANCIAL_NAMESPACES) - {NS_REPORTS_YEAR}
+        invalidate_user_cache_for(1, "transactions.Transaction")
+        assert self._cached(1) == {NS_REPORTS_RV}
+
+    def test_unmapped_model_invalidates_everything(self):
+        self._fill(1)
+        invalidate_user_cache_for(1, "realestate.Property")
+        assert self._cached(1) == set()
+
+    def test_payroll_bulk_writes_invalidate_year_summary(self, user):
+        self._fill(user.pk)
+        client = APIClient()
+        client.force_authenticate(user)
+        response = client.post("/api/payrolls/bulk-delete/", {"ids": [str(uuid.uuid4())]}, format="json")
+        assert response.status_code == 200
+        assert self._cached(user.pk) == set(FINANCIAL_NAMESPACES) - {NS_REPORTS_YEAR}
+
+
+class TestLocalTier:
+    def test_repeated_reads_skip_redis(self):
+        set_user_cache(1, NS_PORTFOLIO, "value")
+        with (
+            patch.object(cache, "get", wraps=cache.get) as l2_get,
+            patch.object(cache, "get_many", wraps=cache.get_many) as l2_get_many,
+            computation_context(),
+        ):
+            for _ in range(3):
+                assert get_user_cache(1, NS_PORTFOLIO) == "value"
+        # Both generations in one round trip, once per request; the value itself never leaves L1.
+        l2_get_many.assert_called_once_with(["ft:1:gen:data", "ft:1:gen:portfolio"])
+        assert {c.args[0] for c in l2_get.call_args_list} == {"ft:1:gen:data", "ft:1:gen:portfolio"}
+
+    def test_invalidation_from_another_process_is_seen_without_a_message(self):
+        set_user_cache(1, NS_PORTFOLIO, "old")
+        # Another process bumps the generation; its pub/sub message never arrives.
+        cache.incr("ft:1:gen:data")
+        assert get_user_cache(1, NS_PORTFOLIO) is None
+
+    def test_refresh_from_another_process_drops_the_entry(self):
+        set_user_cache(1, NS_PORTFOLIO, "old")
+        key = _key(1, NS_PORTFOLIO, _generation(1, NS_PORTFOLIO))
+        # Another process refreshes the entry in place and publishes its key.
+        cache.set(key, codec.dumps("new"))
+        assert get_user_cache(1, NS_PORTFOLIO) == "old"
+        _on_message(_local(), key.encode())
+        assert get_user_cache(1, NS_PORTFOLIO) == "new"
+
+    def test_generations_never_enter_l1(self):
+        set_user_cache(1, NS_PORTFOLIO, "value")
+        get_user_cache(1, NS_PORTFOLIO)
+        assert not [key for key in _local()._entries if ":gen:" in key]
+
+    def test_stats_report_both_tiers(self):
+        set_user_cache(1, "stats_ns", "value")
+        before = cache_stats()
+        get_user_cache(1, "stats_ns")
+        _local().clear()
+        get_user_cache(1, "stats_ns")
+        after = cache_stats()
+        assert after["l1"]["hits"] - before["l1"]["hits"] == 1
+        assert after["l2"]["hits"] - before["l2"]["hits"] == 1  # the value again after the clear
+        assert 0 <= after["l1"]["hit_ratio"] <= 1
+
+    def test_disabled(self, settings):
+        settings.CACHE_L1_MAX_ENTRIES = 0
+        set_user_cache(1, NS_PORTFOLIO, "value")
+        with patch.object(cache, "get", wraps=cache.get) as l2_get:
+            assert get_user_cache(1, NS_PORTFOLIO) == "value"
+        assert l2_get.call_count == 3  # both generations and the value
+
+
+class TestLRUCache:
+    def test_evicts_least_recently_used(self):
+        lru = LRUCache(max_entries=2, ttl=60)
+        lru.set("a", 1)
+        lru.set("b", 2)
+        lru.get("a")
+        lru.set("c", 3)
+        assert (lru.get("a"), lru.get("b"), lru.get("c")) == (1, MISSING, 3)
+
+    def test_entries_expire(self):
+        lru = LRUCache(max_entries=10, ttl=30)
+        lru.set("a", 1, ttl=5)
+        with patch("apps.core.lru.time.monotonic", return_value=time.monotonic() + 6):
+            assert lru.get("a") is MISSING
+        assert len(lru) == 0
+
+
+class TestCompactPayloads:
+    PAYLOAD = {"total": Decimal("1234.50"), "as_of": datetime.date(2024, 3, 1), "rows": [{"qty": 1.5}] * 200}
+    DECODED = {"total": 1234.5, "as_of": "2024-03-01", "rows": [{"qty": 1.5}] * 200}
+
+    def test_financial_payloads_are_stored_as_compressed_json(self):
+        set_user_cache(1, NS_PORTFOLIO, self.PAYLOAD)
+        stored = cache.get(_key(1, NS_PORTFOLIO, _generation(1, NS_PORTFOLIO)))
+        assert stored[:1] == b"z" and len(stored) < 200
+        assert codec.loads(stored) == self.DECODED
+
+    def test_both_tiers_return_what_the_api_renders(self):
+        set_user_cache(1, NS_PORTFOLIO, self.PAYLOAD)
+        assert get_user_cache(1, NS_PORTFOLIO) == self.DECODED
+        _local().clear()
+        assert get_user_cache(1, NS_PORTFOLIO) == self.DECODED
+
+    def test_small_payloads_are_not_compressed(self):
+        assert codec.dumps({"a": 1}) == b'j{"a":1}'
+
+    def test_disabled_and_other_namespaces_keep_pickles(self, settings):
+        set_user_cache(1, NS_SETTINGS, self.PAYLOAD)
+        assert get_user_cache(1, NS_SETTINGS) == self.PAYLOAD
+        settings.CACHE_COMPACT_PAYLOADS = False
+        set_user_cache(1, NS_PORTFOLIO, self.PAYLOAD)
+        _local().clear()
+        assert get_user_cache(1, NS_PORTFOLIO) == self.PAYLOAD
+
+
+@pytest.mark.django_db
+class TestGetOrCompute:
+    def test_computes_once_and_releases_lock(self):
+        calls = []
+        for _ in range(2):
+            assert get_or_compute_user_cache(1, NS_PORTFOLIO, lambda: calls.append(1) or "value") == "value"
+        assert len(calls) == 1
+        assert not [k for k in cache._cache if k.endswith(":lock")]
+
+    def test_waits_for_the_process_holding_the_lock(self):
+        def other_process_finishes(_):
+            set_user_cache(1, NS_PORTFOLIO, "theirs")
+
+        with (
+            _lock_held_elsewhere(),
+            patch("apps.core.cache.time.sleep", side_effect=other_process_finishes) as sleep,
+        ):
+            assert get_or_compute_user_cache(1, NS_PORTFOLIO, lambda: pytest.fail("computed twice")) == "theirs"
+        assert sleep.call_count == 1
+
+    def test_redis_lock_is_released_only_while_held(self):
+        client = MagicMock()
+        client.set.return_value = True
+        with patch("apps.core.cache._redis", return_value=client):
+            assert get_or_compute_user_cache(1, NS_PORTFOLIO, lambda: "value") == "value"
+
+        lock = client.set.call_args.args[0]
+        token = client.set.call_args.args[1]
+        assert lock.endswith(":lock")
+        assert client.set.call_args.kwargs == {"nx": True, "ex": 30}
+        # Compare-and-delete in one script, never a GET followed by a DEL.
+        script, numkeys, key, arg = client.eval.call_args.args
+        assert (numkeys, key, arg) == (1, lock, token)
+        assert 'redis.call("get", KEYS[1]) == ARGV[1]' in script
+        client.delete.assert_not_called()
+
+    def test_computes_itself_when_the_wait_runs_out(self, settings):
+        settings.CACHE_COMPUTE_WAIT = 0.1
+        with _lock_held_elsewhere():
+            assert get_or_compute_user_cache(1, NS_PORTFOLIO, lambda: "mine") == "mine"
+        assert get_user_cache(1, NS_PORTFOLIO) == "mine"
+
+
+@pytest.fixture
+def swr(settings):
+    settings.CACHE_STALE_WHILE_REVALIDATE = True
+    values = iter(["first", "second", "third"])
+    register_user_computation("test_swr", lambda user: next(values), timeout=60)
+    yield
+    _computations.pop("test_swr")
+
+
+def _served(user, namespace="test_swr"):
+    rendered, stale = cached_user_computation(user, namespace)
+    return json.loads(rendered.body), stale
+
+
+@pytest.mark.django_db
+class TestStaleWhileRevalidate:
+    def test_expired_entry_is_served_stale_and_refreshed_in_background(self, user, swr):
+        assert _served(user) == ("first", False)
+        later = time.time() + 61
+        with (
+            patch("apps.core.cache.time.time", return_value=later),
+            patch("apps.core.tasks.refresh_user_cache_task.delay") as delay,
+        ):
+            assert _served(user) == ("first", True)
+            assert _served(user) == ("first", True)
+            # Only one refresh is queued per expired entry.
+            delay.assert_called_once_with(user.pk, "test_swr")
+            refresh_user_cache_task(user.pk, "test_swr")
+            assert _served(user) == ("second", False)
+
+    def test_invalidation_is_never_served_stale(self, user, swr):
+        _served(user)
+        invalidate_user_cache(user.pk, "test_swr")
+        with patch("apps.core.cache.time.time", return_value=time.time() + 61):
+            assert _served(user) == ("second", False)
+
+    def test_view_flags_stale_responses(self, user, settings):
+        settings.CACHE_STALE_WHILE_REVALIDATE = True
+        client = APIClient()
+        client.force_authenticate(user)
+        assert "X-Cache-Stale" not in client.get("/api/reports/year-summary/")
+        with (
+            patch("apps.core.cache.time.time", return_value=time.time() + 121),
+            patch("apps.core.tasks.refresh_user_cache_task.delay"),
+        ):
+            response = client.get("/api/reports/year-summary/")
+        assert response.status_code == 200
+        assert response["X-Cache-Stale"] == "true"
+
+
+@pytest.mark.django_db
+class TestRenderedResponses:
+    URL = "/api/reports/year-summary/"
+
+    @pytest.fixture
+    def client(self, user):
+        client = APIClient()
+        client.force_authenticate(user)
+        return client
+
+    def test_hits_skip_rendering(self, client):
+        first = client.get(self.URL)
+        with patch("apps.core.codec.JSONRenderer.render") as render:
+            second = client.get(self.URL)
+        render.assert_not_called()
+        assert second.content == first.content
+        assert second["Content-Type"] == "application/json"
+        assert second.data == first.data
+
+    def test_etag_revalidation(self, client, user):
+        etag = client.get(self.URL)["ETag"]
+        response = client.get(self.URL, HTTP_IF_NONE_MATCH=etag)
+        assert (response.status_code, response.content, response["ETag"]) == (304, b"", etag)
+        invalidate_user_cache(user.pk, *FINANCIAL_NAMESPACES)
+        # Same data, same body: the new generation still revalidates.
+        assert client.get(self.URL, HTTP_IF_NONE_MATCH=etag).status_code == 304
+
+    def test_browsable_api_still_renders(self, client):
+        response = client.get(self.URL, HTTP_ACCEPT="text/html")
+        assert response.status_code == 200
+        assert response["Content-Type"].startswith("text/html")
+
+
+@pytest.mark.django_db
+class TestWarmUp:
+    def test_warmed_namespaces_are_hits(self, user):
+        assert sorted(warm_user_cache(user)) == sorted(registered_computations())
+        client = APIClient()
+        client.force_authenticate(user)
+        with patch("apps.core.codec.JSONRenderer.render") as render:
+            assert client.get("/api/portfolio/").status_code == 200
+            assert client.get("/api/reports/year-summary/").status_code == 200
+        render.assert_not_called()
+
+    def test_failures_are_skipped(self, user):
+        register_user_computation("test_broken", lambda user: 1 / 0, timeout=60)
+        try:
+            assert warm_user_cache(user, [NS_PORTFOLIO, "test_broken"]) == [NS_PORTFOLIO]
+        finally:
+            _computations.pop("test_broken")
+
+    def test_scheduling_is_throttled_per_user(self, settings):
+        with patch("apps.core.tasks.warm_user_cache_task.delay") as delay:
+            assert schedule_user_cache_warm_up(1)
+            assert not schedule_user_cache_warm_up(1)
+            assert schedule_user_cache_warm_up(2)
+            settings.CACHE_WARM_UP = False
+            assert not schedule_user_cache_warm_up(3)
+        assert [c.args for c in delay.call_args_list] == [(1,), (2,)]
+
+    def test_login_warm_up_is_opt_in(self, user, settings):
+        client = APIClient()
+        credentials = {"username": user.username, "password": "testpass123"}
+        with patch("apps.core.tasks.warm_user_cache_task.delay") as delay:
+            assert client.post("/api/auth/token/", credentials).status_code == 200
+            delay.assert_not_called()
+            settings.CACHE_WARM_ON_LOGIN = True
+            assert client.post("/api/auth/token/", credentials).status_code == 200
+        delay.assert_called_once_with(user.pk)
+
+
+@pytest.fixture
+def recorded():
+    metrics.reset()
+    yield
+    metrics.reset()
+
+
+@pytest.mark.django_db
+@pytest.mark.usefixtures("recorded")
+class TestMetrics:
+    def test_lookups_sets_and_compute_time(self):
+        for _ in range(3):
+            get_or_compute_user_cache(1, NS_PORTFOLIO, lambda: {"total": "1"})
+        portfolio = metrics.report()[NS_PORTFOLIO]
+        assert (portfolio["hits"], portfolio["misses"], portfolio["sets"]) == (2, 1, 1)
+        assert portfolio["hit_ratio"] == pytest.approx(2 / 3, abs=1e-4)
+        assert portfolio["bytes_written"] > 0
+        assert portfolio["compute_seconds"]["count"] == 1
+        assert portfolio["payload_bytes"]["buckets"]["1024"] == 1
+
+    def test_invalidations_per_namespace(self):
+        invalidate_user_cache(1, NS_PORTFOLIO, NS_REPORTS_YEAR)
+        invalidate_user_cache(1, NS_PORTFOLIO)
+        report = metrics.report()
+        assert report[NS_PORTFOLIO]["invalidations"] == 2
+        assert report[NS_REPORTS_YEAR]["invalidations"] == 1
+
+    def test_disabled(self, settings):
+        settings.CACHE_METRICS = False
+        get_or_compute_user_cache(1, NS_PORTFOLIO, lambda: "value")
+        assert metrics.report() == {}
+
+    def test_endpoint_is_admin_only(self, user):
+        client = APIClient()
+        client.force_authenticate(user)
+        assert client.get("/api/cache/metrics/").status_code == 403
+        user.is_staff = True
+        user.save()
+        get_or_compute_user_cache(user.pk, NS_PORTFOLIO, lambda: "value")
+        response = client.get("/api/cache/metrics/")
+        assert response.status_code == 200
+        assert response.data["namespaces"][NS_PORTFOLIO]["misses"] == 1
+        assert set(response.data["tiers"]) == {"l1", "l2"}
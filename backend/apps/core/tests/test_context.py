@@ -0,0 +1,120 @@
+"""
+Tests for request/task-scoped memoization: computations are shared inside a
+context, never outside one, and writes drop the affected user's entries.
+"""
+
+import datetime
+from decimal import Decimal
+
+import pytest
+from django.contrib.auth import get_user_model
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+
+from apps.assets.models import Account, Asset, Settings
+from apps.core.cache import invalidate_user_cache
+from apps.core.context import computation_context, current_memo, memoized
+from apps.core.middleware import ComputationContextMiddleware
+from apps.portfolio.services import calculate_portfolio_full, calculate_realized_pnl_fiscal
+from apps.reports.services import year_summary
+from apps.reports.tax_adapters.es import SpanishTaxAdapter
+from apps.transactions.models import Transaction
+
+User = get_user_model()
+
+
+@pytest.fixture
+def user(db):
+    return User.objects.create_user(username="ctxuser", password="testpass123")
+
+
+@pytest.fixture
+def history(user):
+    account = Account.objects.create(owner=user, name="Broker", type=Account.AccountType.INVERSION)
+    asset = Asset.objects.create(owner=user, name="Alpha", ticker="ALP", current_price=Decimal("20"))
+    for day, tx_type, qty, price in [(1, "BUY", 10, 10), (2, "BUY", 5, 12), (3, "SELL", 8, 15)]:
+        Transaction.objects.create(
+            owner=user,
+            asset=asset,
+            account=account,
+            type=tx_type,
+            date=datetime.date(2024, 1, day),
+            quantity=Decimal(qty),
+            price=Decimal(price),
+        )
+    return account, asset
+
+
+def _transaction_reads(queries):
+    return [q for q in queries if 'FROM "transactions_transaction"' in q["sql"] and "COUNT(" not in q["sql"]]
+
+
+class TestMemoized:
+    def test_no_context_always_computes(self):
+        calls = []
+        memoized((1, "x"), lambda: calls.append(1))
+        memoized((1, "x"), lambda: calls.append(1))
+        assert len(calls) == 2
+        assert current_memo() is None
+
+    def test_context_computes_once(self):
+        calls = []
+        with computation_context():
+            memoized((1, "x"), lambda: calls.append(1) or "v")
+            assert memoized((1, "x"), lambda: calls.append(1) or "v") == "v"
+        assert len(calls) == 1
+        assert current_memo() is None
+
+    def test_nested_context_shares_outer_memo(self):
+        with computation_context():
+            memoized((1, "x"), lambda: "outer")
+            with computation_context():
+                assert memoized((1, "x"), lambda: "inner") == "outer"
+            assert current_memo() is not None
+
+    @pytest.mark.django_db
+    def test_invalidate_user_cache_forgets_only_that_user(self):
+        with computation_context():
+            memoized((1, "x"), lambda: "a")
+            memoized((2, "x"), lambda: "b")
+            invalidate_user_cache(1, "portfolio")
+            assert set(current_memo()) == {(2, "x")}
+
+
+@pytest.mark.django_db
+class TestSharedComputations:
+    def test_settings_loaded_once(self, user):
+        Settings.snapshot(user)
+        with computation_context(), CaptureQueriesContext(connection) as ctx:
+            first = Settings.snapshot(user)
+            assert Settings.snapshot(user) is first
+        # One cache read; no repeated database hits either way.
+        assert not [q for q in ctx.captured_queries if "assets_settings" in q["sql"]]
+
+    def test_year_summary_and_tax_adapter_share_replay(self, user, history):
+        with computation_context(), CaptureQueriesContext(connection) as ctx:
+            year_summary(user)
+            SpanishTaxAdapter().declare(user, 2024)
+            calculate_realized_pnl_fiscal(user)
+        assert len(_transaction_reads(ctx.captured_queries)) == 1
+
+    def test_transaction_write_drops_memoized_replay(self, user, history):
+        account, asset = history
+        with computation_context():
+            before = calculate_portfolio_full(user)
+            Transaction.objects.create(
+                owner=user,
+                asset=asset,
+                account=account,
+                type="BUY",
+                date=datetime.date(2024, 1, 4),
+                quantity=Decimal("3"),
+                price=Decimal("11"),
+            )
+            after = calculate_portfolio_full(user)
+        assert before["positions"][0]["quantity"] != after["positions"][0]["quantity"]
+
+    def test_middleware_opens_context_per_request(self, rf):
+        middleware = ComputationContextMiddleware(lambda request: current_memo())
+        assert middleware(rf.get("/")) == {}
+        assert current_memo() is None
@@ -3,7 +3,7 @@ import contextlib
 from django.conf import settings as django_settings
 from django.contrib.auth import authenticate
 from rest_framework import status
-from rest_framework.permissions import AllowAny, IsAuthenticated
+from rest_framework.permissions import AllowAny, IsAdminUser, IsAuthenticated
 from rest_framework.response import Response
 from rest_framework.throttling import ScopedRateThrottle
 from rest_framework.views import APIView
@@ -11,6 +11,9 @@ from rest_framework_simplejwt.exceptions import InvalidToken, TokenError
 from rest_framework_simplejwt.serializers import TokenRefreshSerializer
 from rest_framework_simplejwt.tokens import RefreshToken
 
+from . import metrics
+from .cache import cache_stats, schedule_user_cache_warm_up
+
 # ---------------------------------------------------------------------------
 # Cookie helpers
 # ---------------------------------------------------------------------------
@@ -86,6 +89,7 @@ class JWTLoginView(APIView):
                 status=status.HTTP_401_UNAUTHORIZED,
             )
 
+        schedule_user_cache_warm_up(user.pk, login=True)
         refresh = RefreshToken.for_user(user)
         access = str(refresh.access_token)
         response = Response(
@@ -292,6 +296,7 @@ class GoogleAuthView(APIView):
                 counter += 1
             user = User.objects.create_user(username=username, email=email)
 
+        schedule_user_cache_warm_up(user.pk, login=True)
         refresh = RefreshToken.for_user(user)
         access = str(refresh.access_token)
         response = Response(
@@ -388,3 +393,12 @@ class HealthView(APIView):
             return Response({"status": "ok"})
         except Exception:
             return Response({"status": "error"}, status=status.HTTP_503_SERVICE_UNAVAILABLE)
+
+
+class CacheMetricsView(APIView):
+    """GET /api/cache/metrics/ — per-namespace cache metrics (all processes) and tier stats (this process)."""
+
+    permission_classes = [IsAdminUser]
+
+    def get(self, request):
+        return Response({"namespaces": metrics.report(), "tiers": cache_stats()})
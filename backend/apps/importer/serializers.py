@@ -1,6 +1,6 @@
 from rest_framework import serializers
 
-from apps.assets.models import Account, AccountSnapshot, Asset, PortfolioSnapshot, Settings
+from apps.assets.models import Account, AccountSnapshot, Asset, PortfolioSnapshot, PortfolioSnapshotRollup, Settings
 from apps.realestate.models import Amortization, Property
 from apps.reports.models import SavingsGoal
 from apps.transactions.models import Dividend, Interest, Transaction
@@ -98,6 +98,12 @@ class BackupPortfolioSnapshotSerializer(serializers.ModelSerializer):
         extra_kwargs = {"id": {"read_only": False}}
 
 
+class BackupPortfolioSnapshotRollupSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = PortfolioSnapshotRollup
+        exclude = ["id", "owner"]
+
+
 class BackupSavingsGoalSerializer(serializers.ModelSerializer):
     class Meta:
         model = SavingsGoal
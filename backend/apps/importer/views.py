@@ -8,7 +8,7 @@ from rest_framework.parsers import MultiPartParser
 from rest_framework.response import Response
 from rest_framework.views import APIView
 
-from apps.assets.models import Account, AccountSnapshot, Asset, PortfolioSnapshot, Settings
+from apps.assets.models import Account, AccountSnapshot, Asset, PortfolioSnapshot, PortfolioSnapshotRollup, Settings
 from apps.assets.serializers import SettingsSerializer
 from apps.realestate.models import Amortization, Property
 from apps.reports.models import SavingsGoal
@@ -21,6 +21,7 @@ from .serializers import (
     BackupAssetSerializer,
     BackupDividendSerializer,
     BackupInterestSerializer,
+    BackupPortfolioSnapshotRollupSerializer,
     BackupPortfolioSnapshotSerializer,
     BackupPropertySerializer,
     BackupSavingsGoalSerializer,
@@ -44,6 +45,9 @@ class BackupExportView(APIView):
             "portfolio_snapshots": BackupPortfolioSnapshotSerializer(
                 PortfolioSnapshot.objects.filter(owner=user), many=True
             ).data,
+            "portfolio_rollups": BackupPortfolioSnapshotRollupSerializer(
+                PortfolioSnapshotRollup.objects.filter(owner=user), many=True
+            ).data,
             "transactions": BackupTransactionSerializer(Transaction.objects.filter(owner=user), many=True).data,
             "dividends": BackupDividendSerializer(Dividend.objects.filter(owner=user), many=True).data,
             "interests": BackupInterestSerializer(Interest.objects.filter(owner=user), many=True).data,
@@ -90,6 +94,7 @@ class BackupImportView(APIView):
             "accounts": 0,
             "account_snapshots": 0,
             "portfolio_snapshots": 0,
+            "portfolio_rollups": 0,
             "transactions": 0,
             "dividends": 0,
             "interests": 0,
@@ -149,6 +154,17 @@ class BackupImportView(APIView):
                     )
                     counts["portfolio_snapshots"] += 1
 
+                # After the snapshots, whose receiver folds them into rollups: the backup's rollups
+                # also hold the history compacted away, so they replace what the receiver wrote.
+                for item in payload.get("portfolio_rollups", []):
+                    PortfolioSnapshotRollup.objects.update_or_create(
+                        owner=user,
+                        resolution=item["resolution"],
+                        period_start=item["period_start"],
+                        defaults=to_defaults(item, exclude=("resolution", "period_start")),
+                    )
+                    counts["portfolio_rollups"] += 1
+
                 for item in payload.get("transactions", []):
                     Transaction.objects.update_or_create(
                         id=item["id"],
@@ -0,0 +1,18 @@
+# Generated by Django 6.0.9 on 2026-10-17 09:24
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("payroll", "0006_alter_payroll_payroll_type"),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name="payroll",
+            index=models.Index(fields=["owner", "period_end"], name="idx_payroll_owner_period_end"),
+        ),
+    ]
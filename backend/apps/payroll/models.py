@@ -217,6 +217,9 @@ class Payroll(UserOwnedModel):
                 condition=models.Q(import_hash__isnull=False),
             ),
         ]
+        indexes = [
+            models.Index(fields=["owner", "period_end"], name="idx_payroll_owner_period_end"),
+        ]
 
     def __str__(self):
         return f"{self.period_start}→{self.period_end} {self.employer.name} net={self.net}"
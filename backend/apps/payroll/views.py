@@ -59,6 +59,7 @@ class PayrollViewSet(OwnedByUserMixin, viewsets.ModelViewSet):
         if not ids:
             return Response({"deleted": 0})
         deleted, _ = self.get_queryset().filter(id__in=ids).delete()
+        self._invalidate()
         return Response({"deleted": deleted})
 
     @action(detail=False, methods=["post"], url_path="bulk-create")
@@ -107,6 +108,7 @@ class PayrollViewSet(OwnedByUserMixin, viewsets.ModelViewSet):
         with transaction.atomic():
             for s in per_row:
                 s.save(owner=request.user)
+        self._invalidate()
         return Response({"created": [s.data for s in per_row]}, status=201)
 
 
@@ -4,3 +4,10 @@ from django.apps import AppConfig
 class PortfolioConfig(AppConfig):
     default_auto_field = "django.db.models.BigAutoField"
     name = "apps.portfolio"
+
+    def ready(self):
+        from apps.core.cache import NS_PORTFOLIO, register_user_computation
+
+        from .services import calculate_portfolio_full
+
+        register_user_computation(NS_PORTFOLIO, calculate_portfolio_full, timeout=60)
@@ -0,0 +1,183 @@
+"""Persisted lot-state checkpoints for the cost-basis engine.
+
+A checkpoint captures the state a ``LotReducer`` (see ``engine.py``) needs
+to carry on after replaying every transaction dated up to ``as_of``: the open
+lots (or WAC state) per asset, the number of sales so far and their realized
+P&L, and the running investment cost. A replay resumes from the newest valid
+checkpoint and only walks the transactions dated after it, so its cost does
+not grow with the history before it.
+
+Checkpoints stay small for the same reason. The sales themselves are kept by
+the realized-gain ledger (``ledger.py``), and each checkpoint stores the
+investment cost only for the months since the checkpoint it follows;
+:func:`load_month_costs` overlays the chain when the whole series is asked for.
+
+Transaction writes delete the checkpoints dated on or after the edited date
+(see the signal receivers in ``apps.portfolio.models``), so any checkpoint
+still on disk is consistent with the history before it. As a safety net the
+number of transactions up to ``as_of`` is stored and re-counted on load,
+which catches bulk writes that bypass model signals.
+
+JSON objects are avoided for anything whose order matters (assets, accounts):
+Postgres ``jsonb`` does not preserve key order and the engine output does.
+"""
+
+import logging
+from decimal import Decimal
+
+from django.conf import settings as django_settings
+from django.db import IntegrityError, transaction
+
+from apps.assets.models import Asset
+from apps.transactions.models import Transaction
+
+from .models import LotCheckpoint
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_CHECKPOINT_INTERVAL = 1000
+
+# Bump whenever the encoded state layout changes so older rows are ignored.
+STATE_VERSION = 5
+
+
+def checkpoint_interval():
+    return getattr(django_settings, "PORTFOLIO_CHECKPOINT_INTERVAL", DEFAULT_CHECKPOINT_INTERVAL)
+
+
+def settings_fingerprint(settings, variant):
+    """Identify the lot layout (``variant``) and user settings that change the stored state for a given method."""
+    return f"v{STATE_VERSION};{variant};gift={settings.gift_cost_mode};money={settings.rounding_money}"
+
+
+# ---------------------------------------------------------------------------
+# State (de)serialization
+# ---------------------------------------------------------------------------
+
+
+def load_assets(asset_ids):
+    assets = Asset.objects.in_bulk(asset_ids)
+    # Preserve the engine's first-seen order, which drives position ordering.
+    return {aid: assets[aid] for aid in asset_ids}
+
+
+# ---------------------------------------------------------------------------
+# Load / write
+# ---------------------------------------------------------------------------
+
+
+def load_checkpoint(user, method, settings, variant, as_of=None):
+    """Return the newest usable checkpoint for ``(user, method)`` or ``None``.
+
+    With ``as_of``, only checkpoints dated on or before it are considered, so a
+    point-in-time replay seeks to the nearest one before the requested date.
+    """
+    checkpoints = LotCheckpoint.objects.filter(
+        owner=user, method=method, fingerprint=settings_fingerprint(settings, variant)
+    )
+    if as_of is not None:
+        checkpoints = checkpoints.filter(as_of__lte=as_of)
+    checkpoint = checkpoints.order_by("-as_of").first()
+    if checkpoint is None:
+        return None
+
+    actual = Transaction.objects.filter(owner=user, date__lte=checkpoint.as_of).count()
+    if actual != checkpoint.tx_count:
+        logger.warning(
+            "Stale %s checkpoint for user %s at %s (%s tx recorded, %s found); discarding",
+            method,
+            user.pk,
+            checkpoint.as_of,
+            checkpoint.tx_count,
+            actual,
+        )
+        LotCheckpoint.objects.filter(owner=user, as_of__gte=checkpoint.as_of).delete()
+        return None
+    return checkpoint
+
+
+def load_month_costs(checkpoint):
+    """``{"YYYY-MM": Decimal}`` investment cost of every month up to ``checkpoint``.
+
+    Each checkpoint holds the months from the one before it on, and
+    invalidation only ever drops a checkpoint together with every later one,
+    so overlaying the chain oldest first rebuilds the whole series.
+    """
+    deltas = (
+        LotCheckpoint.objects.filter(
+            owner_id=checkpoint.owner_id,
+            method=checkpoint.method,
+            fingerprint=checkpoint.fingerprint,
+            as_of__lte=checkpoint.as_of,
+        )
+        .order_by("as_of")
+        .values_list("state__cost_by_month", flat=True)
+    )
+    months = {}
+    for delta in deltas:
+        months.update((month, Decimal(cost)) for month, cost in delta)
+    return months
+
+
+class CheckpointWriter:
+    """Writes a checkpoint every ``PORTFOLIO_CHECKPOINT_INTERVAL`` transactions during a replay.
+
+    Call :meth:`step` before processing each transaction. Checkpoints are only
+    taken on date boundaries: a resumed replay fetches ``date > as_of``, so a
+    checkpoint must never split transactions that share a date.
+    """
+
+    def __init__(self, user, method, settings, variant, checkpoint=None):
+        self.user = user
+        self.method = method
+        self.fingerprint = settings_fingerprint(settings, variant)
+        self.interval = checkpoint_interval()
+        self.tx_count = checkpoint.tx_count if checkpoint is not None else 0
+        self.pending = 0
+        self.last_date = None
+
+    def step(self, tx, encode_state):
+        if self.interval and self.last_date is not None and tx.date != self.last_date and self.pending >= self.interval:
+            self._write(self.last_date, encode_state())
+            self.pending = 0
+        self.last_date = tx.date
+        self.pending += 1
+        self.tx_count += 1
+
+    def skip(self, count, last_date):
+        """Account for ``count`` transactions replayed without :meth:`step` (a parallel replay)."""
+        self.tx_count += count
+        self.pending += count
+        self.last_date = last_date
+
+    def flush(self, encode_state):
+        """Checkpoint the state after the last transaction if an interval has passed since the previous one.
+
+        Only valid once every transaction dated ``last_date`` has been replayed.
+        """
+        if self.interval and self.last_date is not None and self.pending >= self.interval:
+            self._write(self.last_date, encode_state())
+            self.pending = 0
+
+    def _write(self, as_of, state):
+        realized_pnl = Decimal(state["realized_pnl"])
+        try:
+            with transaction.atomic():
+                # Settings changes make older checkpoints unusable; drop them instead of piling up.
+                LotCheckpoint.objects.filter(owner=self.user, method=self.method).exclude(
+                    fingerprint=self.fingerprint
+                ).delete()
+                LotCheckpoint.objects.update_or_create(
+                    owner=self.user,
+                    method=self.method,
+                    as_of=as_of,
+                    defaults={
+                        "fingerprint": self.fingerprint,
+                        "tx_count": self.tx_count,
+                        "realized_pnl": realized_pnl,
+                        "state": state,
+                    },
+                )
+        except IntegrityError:
+            # A concurrent replay wrote the same checkpoint first; theirs is as good as ours.
+            logger.info("Checkpoint for user %s at %s already written", self.user.pk, as_of)
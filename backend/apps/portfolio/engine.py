@@ -0,0 +1,468 @@
+"""Single-pass transaction engine.
+
+The user's transactions are read once, in ``(date, created_at)`` order, and
+fed to a set of reducers:
+
+- :class:`LotReducer` — open lots (or WAC state), realized sales and the
+  running investment cost per month for one cost-basis method. One reducer
+  per method, so ``cost_basis_method`` and ``fiscal_cost_method`` are served
+  by the same pass when they differ.
+- :class:`FlowByMonthReducer` — the naive running cash-flow cost
+  (``qty * price ± commission``) used by the patrimonio chart for months
+  without a portfolio snapshot.
+
+Lot reducers resume from their newest checkpoint (see ``checkpoints.py``);
+the pass starts at the oldest point any reducer needs and each reducer skips
+what it has already seen.
+"""
+
+import copy
+import logging
+import uuid
+from collections import deque
+from dataclasses import dataclass, field
+from decimal import ROUND_HALF_UP, Decimal
+
+from django.conf import settings as django_settings
+
+from apps.assets.models import Settings
+from apps.core.context import current_memo
+from apps.transactions.models import Transaction
+
+from .checkpoints import CheckpointWriter, load_assets, load_checkpoint, load_month_costs
+from .records import Lot, SaleLedger, WacPosition
+
+logger = logging.getLogger(__name__)
+
+BUY = Transaction.TransactionType.BUY
+SELL = Transaction.TransactionType.SELL
+GIFT = Transaction.TransactionType.GIFT
+
+
+def fetch_transactions(user, after=None, until=None):
+    qs = Transaction.objects.filter(owner=user)
+    if after is not None:
+        qs = qs.filter(date__gt=after)
+    if until is not None:
+        qs = qs.filter(date__lte=until)
+    return qs.select_related("asset").order_by("date", "created_at")
+
+
+class LotReducer:
+    """Cost-basis state for one method (FIFO, LIFO or WAC)."""
+
+    # Transaction attributes :meth:`match` reads; a parallel replay ships only these to its workers.
+    row_fields = ("id", "asset_id", "account_id", "type", "date", "quantity", "price", "commission", "tax")
+
+    def __init__(self, user, method, settings, as_of=None, record_matches=False):
+        self.method = method
+        self.lifo = method == Settings.CostBasisMethod.LIFO
+        self.wac = method == Settings.CostBasisMethod.WAC
+        self.gift_market = settings.gift_cost_mode == Settings.GiftCostMode.MARKET
+        self.money_exp = Decimal(10) ** -settings.rounding_money
+        # A merged lot remembers only its first buy, so a reducer that records lot matches never coalesces.
+        self.coalesce = getattr(django_settings, "PORTFOLIO_COALESCE_LOTS", False) and not (self.wac or record_matches)
+
+        # aid -> deque of Lot (FIFO/LIFO) or WacPosition (WAC)
+        self.positions = {}
+        self.asset_map = {}
+        # Sales replayed in this pass. A resumed reducer only knows how many sales
+        # came before its checkpoint and their P&L; the per-sale detail lives in
+        # the realized-gain ledger (see ledger.py).
+        self.realized_sales = SaleLedger(settings.rounding_money)
+        self.sales_before = 0
+        self.realized_pnl_before = Decimal("0")
+        # Mirrors the historical compute_investment_cost_by_month() arithmetic.
+        self.running_cost = Decimal("0")
+        self.month_cost = {}
+        self._month_date = None
+        self._month_key = None
+        # Months before a resumed checkpoint are read from the checkpoints only if asked for.
+        self._earlier_months = None
+        self._checkpoint_month = None
+        # (sell tx id, sale index, [(lot source tx id, qty, cost), ...]) per replayed
+        # sale, for the realized-gain ledger (see ledger.py). WAC sales match no lot.
+        self.sale_matches = [] if record_matches else None
+        self._matched = None
+
+        # Coalesced lots sum costs in a different order, so they keep their own checkpoints.
+        variant = "coalesce" if self.coalesce else "lots"
+        checkpoint = load_checkpoint(user, method, settings, variant, as_of=as_of)
+        if checkpoint is not None:
+            self._restore(checkpoint)
+        self.resume_after = checkpoint.as_of if checkpoint is not None else None
+        self.writer = CheckpointWriter(user, method, settings, variant, checkpoint)
+
+    # -- replay --------------------------------------------------------------
+
+    def apply(self, tx):
+        if self.resume_after is not None and tx.date <= self.resume_after:
+            return
+        self.writer.step(tx, self.encode)
+        self.asset_map[tx.asset_id] = tx.asset
+        self.match(tx)
+        self.close_month(tx.date)
+
+    def match(self, tx):
+        """Update the asset's lots (or WAC state), the running cost and the realized sales for one transaction."""
+        aid = tx.asset_id
+        if self.sale_matches is not None and tx.type == SELL:
+            self._matched = []
+        if self.wac:
+            self._apply_wac(tx, aid)
+        else:
+            self._apply_lots(tx, aid)
+        if self._matched is not None:
+            self.sale_matches.append((tx.id, len(self.realized_sales) - 1, self._matched))
+            self._matched = None
+
+    def change_cost(self, amount, subtract=False):
+        """Add ``amount`` to (or subtract it from) the running investment cost.
+
+        In a parallel worker the running cost is a tape that records the
+        change; the merge re-applies it here in transaction order.
+        """
+        if subtract:
+            self.running_cost -= amount
+        else:
+            self.running_cost += amount
+
+    def close_month(self, date):
+        """Record the running cost as the cost of ``date``'s month so far."""
+        if date != self._month_date:
+            self._month_date = date
+            self._month_key = date.strftime("%Y-%m")
+        self.month_cost[self._month_key] = self.running_cost
+
+    def detached(self):
+        """A copy of this reducer's configuration with empty state and no checkpoint writer.
+
+        It never touches the database, so it can be pickled to a worker
+        process that replays part of the history (see ``parallel.py``).
+        """
+        clone = copy.copy(self)
+        clone.positions = {}
+        clone.asset_map = {}
+        clone.realized_sales = SaleLedger(self.realized_sales.money_digits)
+        clone.running_cost = Decimal("0")
+        clone.month_cost = {}
+        clone._month_date = clone._month_key = None
+        clone._earlier_months = clone._checkpoint_month = None
+        clone.sale_matches = [] if self.sale_matches is not None else None
+        clone.writer = None
+        return clone
+
+    def _apply_lots(self, tx, aid):
+        if aid not in self.positions:
+            self.positions[aid] = deque()
+        lots = self.positions[aid]
+
+        if tx.type == BUY:
+            price = tx.price or Decimal("0")
+            price_per_unit = price + (tx.commission + tx.tax) / tx.quantity if tx.quantity else Decimal("0")
+            self._add_lot(lots, tx.quantity, price_per_unit, tx.account_id, tx.id)
+            self.running_cost += tx.quantity * price_per_unit
+
+        elif tx.type == GIFT:
+            price_per_unit = (tx.price or Decimal("0")) if self.gift_market else Decimal("0")
+            self._add_lot(lots, tx.quantity, price_per_unit, tx.account_id, tx.id)
+            self.running_cost += tx.quantity * price_per_unit
+
+        elif tx.type == SELL:
+            remaining = tx.quantity
+            cost_basis = Decimal("0")
+
+            while remaining > 0 and lots:
+                lot = lots[-1] if self.lifo else lots[0]
+                consumed = min(remaining, lot.qty)
+                cost_basis += lot.price_per_unit * consumed
+                self.running_cost -= consumed * lot.price_per_unit
+                if self._matched is not None:
+                    self._matched.append(self._lot_match(lot, consumed))
+                lot.qty -= consumed
+                remaining -= consumed
+                if lot.qty <= 0:
+                    lots.pop() if self.lifo else lots.popleft()
+
+            if remaining > 0:
+                logger.warning(
+                    "Oversell detected for asset %s: %s shares not covered by lots",
+                    aid,
+                    remaining,
+                )
+
+            self._record_sale(tx, aid, cost_basis.quantize(self.money_exp, rounding=ROUND_HALF_UP), remaining)
+
+    def _add_lot(self, lots, qty, price_per_unit, account_id, source_id):
+        """Open a lot, or grow the newest one when coalescing and it has the same account and unit cost.
+
+        The newest lot is the neighbour of the new one at the end both FIFO and
+        LIFO consume from, so a sale walks the merged lot exactly as it would
+        have walked the two: same quantities, same unit cost, same account.
+        A merged lot keeps the source transaction of its first buy, which is why
+        reducers that record lot matches for the ledger do not coalesce.
+        """
+        if self.coalesce and lots:
+            tail = lots[-1]
+            if tail.price_per_unit == price_per_unit and tail.account_id == account_id:
+                tail.qty += qty
+                return
+        lots.append(Lot(qty, price_per_unit, account_id, source_id))
+
+    def _lot_match(self, lot, consumed):
+        return lot.source_id, consumed, (lot.price_per_unit * consumed).quantize(self.money_exp, rounding=ROUND_HALF_UP)
+
+    def _apply_wac(self, tx, aid):
+        if aid not in self.positions:
+            self.positions[aid] = WacPosition(Decimal("0"), Decimal("0"), {})
+        state = self.positions[aid]
+
+        if tx.type in (BUY, GIFT):
+            if tx.type == BUY:
+                price = tx.price or Decimal("0")
+                price_per_unit = price + (tx.commission + tx.tax) / tx.quantity if tx.quantity else Decimal("0")
+            else:
+                price_per_unit = (tx.price or Decimal("0")) if self.gift_market else Decimal("0")
+            state.total_qty += tx.quantity
+            state.total_cost += price_per_unit * tx.quantity
+            state.acct_qty[tx.account_id] = state.acct_qty.get(tx.account_id, Decimal("0")) + tx.quantity
+            self.running_cost += tx.quantity * price_per_unit
+
+        elif tx.type == SELL:
+            has_position = state.total_qty > 0
+            avg_price = (state.total_cost / state.total_qty) if has_position else Decimal("0")
+            oversell_qty = max(Decimal("0"), tx.quantity - state.total_qty)
+            covered_qty = tx.quantity - oversell_qty
+            cost_basis = (avg_price * covered_qty).quantize(self.money_exp, rounding=ROUND_HALF_UP)
+
+            if oversell_qty > 0:
+                logger.warning(
+                    "Oversell detected for asset %s (WAC): %s shares not covered",
+                    aid,
+                    oversell_qty,
+                )
+
+            if has_position:
+                self.running_cost -= avg_price * tx.quantity
+            state.total_qty -= tx.quantity
+            state.total_cost -= avg_price * covered_qty
+            if state.total_qty <= 0:
+                state.total_qty = Decimal("0")
+                state.total_cost = Decimal("0")
+
+            self._record_sale(tx, aid, cost_basis, oversell_qty)
+
+            for acct_id in list(state.acct_qty):
+                if state.acct_qty[acct_id] > 0:
+                    state.acct_qty[acct_id] -= tx.quantity
+                    if state.acct_qty[acct_id] <= 0:
+                        del state.acct_qty[acct_id]
+                    break
+
+    def _record_sale(self, tx, aid, cost_basis, oversell_qty):
+        money_exp = self.money_exp
+        sell_price = tx.price or Decimal("0")
+        sell_total = (sell_price * tx.quantity - tx.commission - tx.tax).quantize(money_exp, rounding=ROUND_HALF_UP)
+        pnl = (sell_total - cost_basis).quantize(money_exp, rounding=ROUND_HALF_UP)
+
+        self.realized_sales.append(
+            aid,
+            tx.date,
+            tx.quantity,
+            sell_price.quantize(money_exp, rounding=ROUND_HALF_UP),
+            cost_basis,
+            sell_total,
+            pnl,
+            oversell_qty,
+        )
+
+    # -- output --------------------------------------------------------------
+
+    @property
+    def realized_pnl(self):
+        """Realized P&L of every sale up to now, including those before the resumed checkpoint."""
+        return self.realized_pnl_before + self.realized_sales.total_pnl()
+
+    @property
+    def cost_by_month(self):
+        if self._earlier_months is not None:
+            self.month_cost = {**load_month_costs(self._earlier_months), **self.month_cost}
+            self._earlier_months = None
+        return self.month_cost
+
+    @property
+    def lots(self):
+        """Open lots per asset; WAC collapses each asset into a single average-cost lot."""
+        if not self.wac:
+            return self.positions
+
+        lots = {}
+        for aid, state in self.positions.items():
+            if state.total_qty > 0:
+                avg_price = state.total_cost / state.total_qty
+                primary_account = max(state.acct_qty, key=state.acct_qty.get) if state.acct_qty else None
+                lots[aid] = deque([Lot(state.total_qty, avg_price, primary_account)])
+            else:
+                lots[aid] = deque()
+        return lots
+
+    # -- checkpoint state ----------------------------------------------------
+
+    def encode(self):
+        if self.wac:
+            assets = [
+                [
+                    str(aid),
+                    str(state.total_qty),
+                    str(state.total_cost),
+                    [[str(acct), str(qty)] for acct, qty in state.acct_qty.items()],
+                ]
+                for aid, state in self.positions.items()
+            ]
+        else:
+            assets = [
+                [
+                    str(aid),
+                    [[str(lot.qty), str(lot.price_per_unit), str(lot.account_id), str(lot.source_id)] for lot in lots],
+                ]
+                for aid, lots in self.positions.items()
+            ]
+        since = self._checkpoint_month
+        # The next checkpoint follows this one, so it only needs the months from here on.
+        self._checkpoint_month = self._month_key
+        return {
+            "assets": assets,
+            "sale_count": self.sales_before + len(self.realized_sales),
+            "realized_pnl": str(self.realized_pnl),
+            "running_cost": str(self.running_cost),
+            "cost_by_month": [
+                [month, str(cost)] for month, cost in self.month_cost.items() if since is None or month >= since
+            ],
+        }
+
+    def _restore(self, checkpoint):
+        state = checkpoint.state
+        for row in state["assets"]:
+            aid = uuid.UUID(row[0])
+            if self.wac:
+                _, total_qty, total_cost, acct_rows = row
+                self.positions[aid] = WacPosition(
+                    Decimal(total_qty),
+                    Decimal(total_cost),
+                    {uuid.UUID(acct): Decimal(qty) for acct, qty in acct_rows},
+                )
+            else:
+                self.positions[aid] = deque(
+                    Lot(Decimal(qty), Decimal(ppu), uuid.UUID(acct), uuid.UUID(source))
+                    for qty, ppu, acct, source in row[1]
+                )
+        self.asset_map = load_assets(list(self.positions))
+        self.sales_before = state["sale_count"]
+        self.realized_pnl_before = Decimal(state["realized_pnl"])
+        self.running_cost = Decimal(state["running_cost"])
+        self._earlier_months = checkpoint
+        self._checkpoint_month = checkpoint.as_of.strftime("%Y-%m")
+
+
+class FlowByMonthReducer:
+    """Running ``qty * price ± commission`` per month; no cost-basis method involved."""
+
+    resume_after = None
+
+    def __init__(self):
+        self.running = Decimal("0")
+        self.by_month = {}
+
+    def apply(self, tx):
+        qty = tx.quantity or Decimal("0")
+        price = tx.price or Decimal("0")
+        commission = tx.commission or Decimal("0")
+        if tx.type in (BUY, GIFT):
+            self.running += qty * price + commission
+        elif tx.type == SELL:
+            self.running -= qty * price - commission
+        self.by_month[tx.date.strftime("%Y-%m")] = self.running
+
+
+def lots_memo_key(user, method, as_of=None):
+    """Key of a finished :class:`LotReducer` in the computation-context memo."""
+    return (user.pk, "engine:lots", method, as_of)
+
+
+@dataclass
+class EngineResult:
+    settings: Settings
+    methods: dict = field(default_factory=dict)
+    flows: FlowByMonthReducer | None = None
+
+    def __getitem__(self, method):
+        return self.methods[method]
+
+
+def replay(user, methods=(), flows=False, settings=None, as_of=None):
+    """Run one pass over the user's transactions.
+
+    ``methods`` is any iterable of cost-basis methods (duplicates collapse to
+    one reducer). Returns an :class:`EngineResult` whose ``methods`` maps each
+    method to its :class:`LotReducer`.
+
+    With ``as_of`` (a date), only transactions dated on or before it are
+    replayed, starting from the newest checkpoint not after it, so asking for
+    several past dates costs at most one checkpoint interval each.
+
+    Inside a computation context (``apps.core.context``) finished reducers
+    are memoized per user and date, so later calls in the same request or
+    task only replay what is still missing.
+    """
+    if settings is None:
+        settings = Settings.snapshot(user)
+    memo = current_memo()
+    if memo is None:
+        memo = {}
+
+    result = EngineResult(settings=settings)
+    pending = {}
+    for method in methods:
+        if method in result.methods:
+            continue
+        key = lots_memo_key(user, method, as_of)
+        if key not in memo:
+            pending[key] = LotReducer(user, method, settings, as_of=as_of)
+        result.methods[method] = memo.get(key) or pending[key]
+    if flows:
+        key = (user.pk, "engine:flows", as_of)
+        if key not in memo:
+            pending[key] = FlowByMonthReducer()
+        result.flows = memo.get(key) or pending[key]
+
+    if not pending:
+        return result
+
+    reducers = list(pending.values())
+    starts = [r.resume_after for r in reducers]
+    after = None if any(s is None for s in starts) else min(starts)
+    transactions = fetch_transactions(user, after=after, until=as_of)
+    feed(reducers, transactions)
+    memo.update(pending)
+    return result
+
+
+def feed(reducers, transactions):
+    """Apply ``transactions`` (in replay order) to every reducer.
+
+    Histories of at least ``PORTFOLIO_PARALLEL_THRESHOLD`` transactions have
+    their lot matching split by asset across a process pool (see
+    ``parallel.py``); the result is the same either way.
+    """
+    from .parallel import replay_partitioned, worker_count
+
+    lot_reducers = [r for r in reducers if isinstance(r, LotReducer)]
+    if lot_reducers:
+        transactions = list(transactions)
+        workers = worker_count(len(transactions))
+        if workers > 1:
+            replay_partitioned(lot_reducers, transactions, workers)
+            reducers = [r for r in reducers if not isinstance(r, LotReducer)]
+    for tx in transactions:
+        for reducer in reducers:
+            reducer.apply(tx)
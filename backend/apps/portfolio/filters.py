@@ -0,0 +1,14 @@
+import django_filters
+
+from .models import RealizedSale
+
+
+class RealizedSaleFilter(django_filters.FilterSet):
+    year = django_filters.NumberFilter(field_name="date", lookup_expr="year")
+    from_date = django_filters.DateFilter(field_name="date", lookup_expr="gte")
+    to_date = django_filters.DateFilter(field_name="date", lookup_expr="lte")
+    asset_id = django_filters.UUIDFilter(field_name="asset_id")
+
+    class Meta:
+        model = RealizedSale
+        fields = []
@@ -0,0 +1,191 @@
+"""Persisted realized-gain ledger.
+
+Every SELL the engine replays is stored as a
+:class:`~apps.portfolio.models.RealizedSale` per cost-basis method, with one
+:class:`~apps.portfolio.models.RealizedLotMatch` per lot it consumed: which
+BUY or GIFT opened the lot, how much of it was sold and at what cost. Tax-year
+and year-summary figures then come from an indexed aggregate over the table
+instead of a replay, and the rows are an audit trail of the lot matching.
+
+The ledger is maintained incrementally. Transaction writes delete the rows
+dated on or after the edited date (the receivers that also drop checkpoints,
+see ``apps.portfolio.models``), and :func:`sync_ledger` replays from the
+newest checkpoint before the first missing sale and appends what is missing.
+Each row also keeps a digest of every transaction dated up to it (count,
+sums of the amounts the engine reads, latest ``updated_at``): a write that
+bypasses model signals, such as ``QuerySet.update`` or a bulk import, changes
+the digest of the rows it affects and the ledger is rebuilt.
+"""
+
+import datetime
+import logging
+from decimal import Decimal
+
+from django.db import IntegrityError, transaction
+from django.db.models import Count, Max, Q, Sum
+from django.db.models.functions import ExtractYear
+
+from apps.assets.models import Settings
+from apps.core.context import current_memo
+from apps.transactions.models import Transaction
+
+from .engine import SELL, LotReducer, feed, fetch_transactions, lots_memo_key
+from .models import RealizedLotMatch, RealizedSale
+
+logger = logging.getLogger(__name__)
+
+
+# Changes whenever a transaction is added, removed or edited in a way the engine sees.
+_HISTORY = {
+    "count": Count("id"),
+    "sells": Count("id", filter=Q(type=SELL)),
+    "quantity": Sum("quantity"),
+    "price": Sum("price"),
+    "commission": Sum("commission"),
+    "tax": Sum("tax"),
+    "updated": Max("updated_at"),
+}
+_HISTORY_SUMS = ("count", "sells", "quantity", "price", "commission", "tax")
+
+
+def ledger_fingerprint(settings):
+    """Identify the user settings that change the stored rows."""
+    return f"gift={settings.gift_cost_mode};money={settings.rounding_money}"
+
+
+def _digest(totals):
+    parts = [str(Decimal(totals[name] or 0).normalize()) for name in _HISTORY_SUMS]
+    parts.append(totals["updated"].isoformat() if totals["updated"] else "")
+    return ";".join(parts)
+
+
+def history_digest(transactions):
+    """Digest of ``transactions`` as stored in :attr:`RealizedSale.history`."""
+    return _digest(transactions.aggregate(**_HISTORY))
+
+
+def _digests_by_date(transactions, after, until):
+    """``{date: digest}`` of the transactions dated up to each date in ``(after, until]``."""
+    if after is None:
+        totals = dict.fromkeys(_HISTORY, None)
+        totals["count"] = totals["sells"] = 0
+    else:
+        totals = transactions.filter(date__lte=after).aggregate(**_HISTORY)
+        transactions = transactions.filter(date__gt=after)
+    digests = {}
+    days = transactions.filter(date__lte=until).values("date").annotate(**_HISTORY).order_by("date")
+    for day in days:
+        for name in _HISTORY_SUMS:
+            totals[name] = (totals[name] or 0) + (day[name] or 0)
+        if totals["updated"] is None or day["updated"] > totals["updated"]:
+            totals["updated"] = day["updated"]
+        digests[day["date"]] = _digest(totals)
+    return digests
+
+
+def sync_ledger(user, method, settings=None):
+    """Bring the ledger for ``(user, method)`` up to date with the transaction history."""
+    if settings is None:
+        settings = Settings.snapshot(user)
+    fingerprint = ledger_fingerprint(settings)
+    rows = RealizedSale.objects.filter(owner=user, method=method)
+    rows.exclude(fingerprint=fingerprint).delete()
+
+    transactions = Transaction.objects.filter(owner=user)
+    newest = rows.order_by("-sequence").first()
+    if newest is not None and history_digest(transactions.filter(date__lte=newest.date)) != newest.history:
+        logger.warning("Realized ledger for user %s (%s) is out of step with its history; rebuilding", user.pk, method)
+        rows.delete()
+        newest = None
+    recorded = newest.sequence + 1 if newest is not None else 0
+    if recorded == transactions.filter(type=SELL).count():
+        return
+
+    last = newest.date if newest is not None else None
+
+    # Seek to the newest checkpoint that precedes every missing sale.
+    reducer = LotReducer(user, method, settings, as_of=last or datetime.date.min, record_matches=True)
+    feed([reducer], fetch_transactions(user, after=reducer.resume_after))
+    _write(user, method, fingerprint, reducer, after=last)
+
+    # The reducer has now seen the whole history, so later replays in this request can reuse it.
+    memo = current_memo()
+    if memo is not None:
+        memo.setdefault(lots_memo_key(user, method), reducer)
+
+
+def _write(user, method, fingerprint, reducer, after):
+    sales = reducer.realized_sales
+    new_sales = []
+    new_matches = []
+    for tx_id, index, matched in reducer.sale_matches:
+        sale = sales[index]
+        if after is not None and sale.date <= after:
+            continue
+        new_sales.append(
+            RealizedSale(
+                owner=user,
+                method=method,
+                fingerprint=fingerprint,
+                transaction_id=tx_id,
+                asset_id=sale.asset_id,
+                sequence=reducer.sales_before + index,
+                date=sale.date,
+                quantity=sale.quantity,
+                sell_price=sale.sell_price,
+                cost_basis=sale.cost_basis,
+                proceeds=sale.proceeds,
+                realized_pnl=sale.realized_pnl,
+                oversell_quantity=sale.oversell_quantity,
+            )
+        )
+        new_matches.append(matched)
+    if not new_sales:
+        return
+
+    digests = _digests_by_date(Transaction.objects.filter(owner=user), after, new_sales[-1].date)
+    for sale in new_sales:
+        sale.history = digests[sale.date]
+    try:
+        with transaction.atomic():
+            RealizedSale.objects.bulk_create(new_sales)
+            RealizedLotMatch.objects.bulk_create(
+                RealizedLotMatch(sale=sale, source_id=source_id, quantity=qty, cost=cost)
+                for sale, matched in zip(new_sales, new_matches, strict=True)
+                for source_id, qty, cost in matched
+            )
+    except IntegrityError:
+        # A concurrent sync wrote the same sales first; theirs are as good as ours.
+        logger.info("Realized ledger for user %s (%s) already written", user.pk, method)
+
+
+def realized_pnl_by_year(user, method, settings=None):
+    """``{year: Decimal}`` realized P&L under ``method``."""
+    sync_ledger(user, method, settings)
+    totals = (
+        RealizedSale.objects.filter(owner=user, method=method)
+        .annotate(year=ExtractYear("date"))
+        .values("year")
+        .annotate(total=Sum("realized_pnl"))
+        .order_by("year")
+    )
+    return {row["year"]: row["total"] for row in totals}
+
+
+def realized_sales_in_year(user, method, year, settings=None):
+    """The ledger rows for sales dated in ``year``, in engine order."""
+    sync_ledger(user, method, settings)
+    return (
+        RealizedSale.objects.filter(owner=user, method=method, date__year=year)
+        .select_related("asset")
+        .order_by("sequence")
+    )
+
+
+def realized_sales_until(user, method, as_of=None, settings=None):
+    """The ledger rows for every sale (dated on or before ``as_of``), in engine order."""
+    sync_ledger(user, method, settings)
+    rows = RealizedSale.objects.filter(owner=user, method=method)
+    if as_of is not None:
+        rows = rows.filter(date__lte=as_of)
+    return rows.select_related("asset").order_by("sequence")
@@ -0,0 +1,77 @@
+"""Compare the pickled and compact cache encodings of every cached payload.
+
+Creates a throwaway user with a synthetic history inside a transaction that
+is rolled back, computes each registered cache namespace once (portfolio and
+reports) and reports, per namespace, the bytes stored in Redis and the
+encode/decode time of a pickle (what the Django Redis cache stores by
+default) against ``apps.core.codec``'s compact JSON.
+
+    python manage.py benchmark_cache_payloads --transactions 10000
+"""
+
+import logging
+import pickle
+import random
+import time
+
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from apps.core import codec
+from apps.core.cache import registered_computations
+from apps.portfolio.parallel import parallel_replays
+
+from .benchmark_engine_memory import _synthetic_history
+
+
+def _timed(fn, arg, repeat):
+    start = time.perf_counter()
+    for _ in range(repeat):
+        result = fn(arg)
+    return result, (time.perf_counter() - start) / repeat
+
+
+def _pickle(value):
+    return pickle.dumps(value, pickle.HIGHEST_PROTOCOL)
+
+
+class Command(BaseCommand):
+    help = "Report stored size and encode/decode time per cache namespace, pickled vs compact."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--transactions", type=int, default=10_000)
+        parser.add_argument("--seed", type=int, default=1)
+        parser.add_argument("--repeat", type=int, default=20)
+
+    def handle(self, *args, **options):
+        # Random sells oversell now and then; the per-sale warnings would drown the report.
+        engine_logger = logging.getLogger("apps.portfolio.engine")
+        level = engine_logger.level
+        engine_logger.setLevel(logging.ERROR)
+        try:
+            with parallel_replays():
+                self._run(options["transactions"], options["seed"], options["repeat"])
+        finally:
+            engine_logger.setLevel(level)
+
+    def _run(self, count, seed, repeat):
+        with transaction.atomic():
+            user = get_user_model().objects.create_user(username=f"cache-bench-{random.getrandbits(32):x}")
+            _synthetic_history(user, count, seed)
+
+            for namespace, (compute, _) in sorted(registered_computations().items()):
+                value = compute(user)
+                pickled, pickle_encode = _timed(_pickle, value, repeat)
+                _, pickle_decode = _timed(pickle.loads, pickled, repeat)
+                compact, compact_encode = _timed(codec.dumps, value, repeat)
+                _, compact_decode = _timed(codec.loads, compact, repeat)
+                self.stdout.write(
+                    f"{namespace}: pickle {len(pickled) / 1024:.1f} KiB "
+                    f"(encode {pickle_encode * 1000:.2f} ms, decode {pickle_decode * 1000:.2f} ms) vs "
+                    f"compact {len(compact) / 1024:.1f} KiB "
+                    f"(encode {compact_encode * 1000:.2f} ms, decode {compact_decode * 1000:.2f} ms), "
+                    f"{len(compact) / len(pickled):.0%} of the pickle size"
+                )
+
+            transaction.set_rollback(True)
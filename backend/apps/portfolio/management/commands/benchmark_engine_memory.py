@@ -0,0 +1,136 @@
+"""Measure the memory the cost-basis engine keeps per replayed history.
+
+Creates a throwaway user with a synthetic history inside a transaction that
+is rolled back, replays it once per method and reports the size of the state
+the reducer keeps (open lots + realized sales) as slotted records, next to
+the same state laid out the way the engine used to hold it: a dict per lot
+and a dict of pre-formatted strings per sale.
+
+    python manage.py benchmark_engine_memory --transactions 10000
+"""
+
+import datetime
+import logging
+import random
+import tracemalloc
+from collections import deque
+from decimal import Decimal
+
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from apps.assets.models import Account, Asset, Settings
+from apps.portfolio.engine import replay
+from apps.portfolio.parallel import parallel_replays
+from apps.portfolio.records import Lot, SaleLedger
+from apps.transactions.models import Transaction
+
+
+def _synthetic_history(user, count, seed):
+    rnd = random.Random(seed)
+    accounts = [Account.objects.create(owner=user, name=f"Bench {i}") for i in range(3)]
+    assets = [
+        Asset.objects.create(owner=user, name=f"Bench {i}", ticker=f"BN{i}", current_price=Decimal("100"))
+        for i in range(50)
+    ]
+    day = datetime.date(2000, 1, 1)
+    rows = []
+    for _ in range(count):
+        day += datetime.timedelta(days=rnd.choice((0, 0, 1)))
+        rows.append(
+            Transaction(
+                owner=user,
+                asset=rnd.choice(assets),
+                account=rnd.choice(accounts),
+                # Buy-heavy so plenty of lots stay open.
+                type=rnd.choice(("BUY", "BUY", "BUY", "SELL")),
+                date=day,
+                quantity=Decimal(rnd.randint(1, 500_000)) / Decimal(1000),
+                price=Decimal(rnd.randint(1, 5_000_000)) / Decimal(1000),
+                commission=Decimal(rnd.randint(0, 500)) / Decimal(100),
+            )
+        )
+    Transaction.objects.bulk_create(rows, batch_size=1000)
+
+
+def _record_layout(reducer):
+    """Fresh copies of the engine's lot records and sale ledger."""
+    lots = {
+        aid: deque(Lot(lot.qty, lot.price_per_unit, lot.account_id, lot.source_id) for lot in lots)
+        for aid, lots in reducer.lots.items()
+    }
+    sales = SaleLedger(reducer.realized_sales.money_digits)
+    for s in reducer.realized_sales:
+        sales.append(
+            s.asset_id,
+            s.date,
+            s.quantity,
+            s.sell_price,
+            s.cost_basis,
+            s.proceeds,
+            s.realized_pnl,
+            s.oversell_quantity,
+        )
+    return lots, sales
+
+
+def _legacy_layout(reducer):
+    """The previous representation: a dict per lot and a dict of pre-formatted strings per sale."""
+    lots = {
+        aid: deque({"qty": lot.qty, "price_per_unit": lot.price_per_unit, "account_id": lot.account_id} for lot in lots)
+        for aid, lots in reducer.lots.items()
+    }
+    sales = [s.as_dict(reducer.asset_map[s.asset_id]) for s in reducer.realized_sales]
+    return lots, sales
+
+
+def _retained(build):
+    tracemalloc.start()
+    try:
+        before = tracemalloc.get_traced_memory()[0]
+        kept = build()
+        after = tracemalloc.get_traced_memory()[0]
+    finally:
+        tracemalloc.stop()
+    return kept, after - before
+
+
+class Command(BaseCommand):
+    help = "Report the memory the cost-basis engine retains per replayed history."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--transactions", type=int, default=10_000)
+        parser.add_argument("--seed", type=int, default=1)
+
+    def handle(self, *args, **options):
+        count = options["transactions"]
+        # Random sells oversell now and then; the per-sale warnings would drown the report.
+        engine_logger = logging.getLogger("apps.portfolio.engine")
+        level = engine_logger.level
+        engine_logger.setLevel(logging.ERROR)
+        try:
+            with parallel_replays():
+                self._run(count, options["seed"])
+        finally:
+            engine_logger.setLevel(level)
+
+    def _run(self, count, seed):
+        with transaction.atomic():
+            user = get_user_model().objects.create_user(username=f"engine-bench-{random.getrandbits(32):x}")
+            _synthetic_history(user, count, seed)
+            settings = Settings.snapshot(user)
+
+            for method in Settings.CostBasisMethod.values:
+                reducer = replay(user, methods=[method], settings=settings)[method]
+                # Both layouts share the lot quantities/prices and account ids, as a replay does.
+                _, records = _retained(lambda r=reducer: _record_layout(r))
+                _, legacy = _retained(lambda r=reducer: _legacy_layout(r))
+                open_lots = sum(len(lots) for lots in reducer.lots.values())
+                self.stdout.write(
+                    f"{method}: {open_lots} open lots, {len(reducer.realized_sales)} sales — "
+                    f"records {records / 1024:.0f} KiB vs dicts {legacy / 1024:.0f} KiB "
+                    f"per {count} transactions ({100 * (1 - records / legacy):.0f}% less)"
+                )
+
+            transaction.set_rollback(True)
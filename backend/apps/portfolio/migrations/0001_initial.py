@@ -0,0 +1,59 @@
+# Generated by Django 6.0.9 on 2026-10-17 06:06
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    initial = True
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="LotCheckpoint",
+            fields=[
+                ("id", models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name="ID")),
+                (
+                    "method",
+                    models.CharField(
+                        choices=[
+                            ("FIFO", "First In, First Out"),
+                            ("LIFO", "Last In, First Out"),
+                            ("WAC", "Weighted Average Cost"),
+                        ],
+                        max_length=10,
+                    ),
+                ),
+                ("fingerprint", models.CharField(max_length=64)),
+                ("as_of", models.DateField()),
+                (
+                    "tx_count",
+                    models.PositiveIntegerField(help_text="Transactions dated on or before as_of when written."),
+                ),
+                ("realized_pnl", models.DecimalField(decimal_places=6, default=0, max_digits=24)),
+                ("state", models.JSONField()),
+                ("created_at", models.DateTimeField(auto_now_add=True)),
+                (
+                    "owner",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="portfolio_lotcheckpoint_set",
+                        to=settings.AUTH_USER_MODEL,
+                    ),
+                ),
+            ],
+            options={
+                "ordering": ["-as_of"],
+                "indexes": [models.Index(fields=["owner", "method", "-as_of"], name="idx_lotcp_owner_method_date")],
+                "constraints": [
+                    models.UniqueConstraint(
+                        fields=("owner", "method", "as_of"), name="unique_lotcheckpoint_owner_method_date"
+                    )
+                ],
+            },
+        ),
+    ]
@@ -0,0 +1,98 @@
+# Generated by Django 6.0.9 on 2026-10-17 07:10
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("assets", "0007_settings_tax_country"),
+        ("portfolio", "0001_initial"),
+        ("transactions", "0006_dividend_commission_interest_tax_commission"),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="RealizedSale",
+            fields=[
+                ("id", models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name="ID")),
+                (
+                    "method",
+                    models.CharField(
+                        choices=[
+                            ("FIFO", "First In, First Out"),
+                            ("LIFO", "Last In, First Out"),
+                            ("WAC", "Weighted Average Cost"),
+                        ],
+                        max_length=10,
+                    ),
+                ),
+                ("fingerprint", models.CharField(max_length=64)),
+                ("sequence", models.PositiveIntegerField()),
+                ("date", models.DateField()),
+                ("quantity", models.DecimalField(decimal_places=6, max_digits=20)),
+                ("sell_price", models.DecimalField(decimal_places=6, max_digits=24)),
+                ("cost_basis", models.DecimalField(decimal_places=6, max_digits=24)),
+                ("proceeds", models.DecimalField(decimal_places=6, max_digits=24)),
+                ("realized_pnl", models.DecimalField(decimal_places=6, max_digits=24)),
+                ("oversell_quantity", models.DecimalField(decimal_places=6, default=0, max_digits=20)),
+                (
+                    "asset",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE, related_name="realized_sales", to="assets.asset"
+                    ),
+                ),
+                (
+                    "owner",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="portfolio_realizedsale_set",
+                        to=settings.AUTH_USER_MODEL,
+                    ),
+                ),
+                (
+                    "transaction",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="realized_sales",
+                        to="transactions.transaction",
+                    ),
+                ),
+            ],
+            options={
+                "ordering": ["sequence"],
+            },
+        ),
+        migrations.CreateModel(
+            name="RealizedLotMatch",
+            fields=[
+                ("id", models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name="ID")),
+                ("quantity", models.DecimalField(decimal_places=6, max_digits=20)),
+                ("cost", models.DecimalField(decimal_places=6, max_digits=24)),
+                (
+                    "source",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="realized_lot_matches",
+                        to="transactions.transaction",
+                    ),
+                ),
+                (
+                    "sale",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE, related_name="matches", to="portfolio.realizedsale"
+                    ),
+                ),
+            ],
+        ),
+        migrations.AddIndex(
+            model_name="realizedsale",
+            index=models.Index(fields=["owner", "method", "date"], name="idx_realizedsale_owner_date"),
+        ),
+        migrations.AddConstraint(
+            model_name="realizedsale",
+            constraint=models.UniqueConstraint(fields=("transaction", "method"), name="unique_realizedsale_tx_method"),
+        ),
+    ]
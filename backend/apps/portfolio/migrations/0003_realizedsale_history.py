@@ -0,0 +1,19 @@
+# Generated by Django 6.0.9 on 2026-10-17 11:11
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("portfolio", "0002_realized_ledger"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="realizedsale",
+            name="history",
+            field=models.CharField(
+                blank=True, default="", help_text="Digest of the transactions dated up to this sale.", max_length=255
+            ),
+        ),
+    ]
@@ -0,0 +1,135 @@
+from django.conf import settings as django_settings
+from django.db import models
+from django.db.models.signals import post_delete, post_save, pre_save
+from django.dispatch import receiver
+
+from apps.assets.models import Settings
+from apps.core.context import forget_user
+from apps.transactions.models import Transaction
+
+
+class LotCheckpoint(models.Model):
+    """Serialized cost-basis engine state after every transaction dated up to ``as_of``.
+
+    Written periodically by the engine while it replays a user's history so the
+    next replay can resume from here instead of from the first trade. Rows are
+    scoped by ``method`` and by a ``fingerprint`` of the settings that change
+    the engine output (gift cost mode, money rounding).
+    """
+
+    owner = models.ForeignKey(
+        django_settings.AUTH_USER_MODEL,
+        on_delete=models.CASCADE,
+        related_name="portfolio_lotcheckpoint_set",
+    )
+    method = models.CharField(max_length=10, choices=Settings.CostBasisMethod.choices)
+    fingerprint = models.CharField(max_length=64)
+    as_of = models.DateField()
+    tx_count = models.PositiveIntegerField(help_text="Transactions dated on or before as_of when written.")
+    realized_pnl = models.DecimalField(max_digits=24, decimal_places=6, default=0)
+    state = models.JSONField()
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        ordering = ["-as_of"]
+        constraints = [
+            models.UniqueConstraint(fields=["owner", "method", "as_of"], name="unique_lotcheckpoint_owner_method_date"),
+        ]
+        indexes = [
+            models.Index(fields=["owner", "method", "-as_of"], name="idx_lotcp_owner_method_date"),
+        ]
+
+    def __str__(self):
+        return f"{self.method} checkpoint @ {self.as_of} ({self.tx_count} tx)"
+
+
+class RealizedSale(models.Model):
+    """One SELL as matched by the engine for one cost-basis method.
+
+    Persisted by ``apps.portfolio.ledger`` so per-year realized P&L is an
+    indexed aggregate instead of a full replay. ``sequence`` is the sale's
+    position in the replay, which is the order the engine reports sales in.
+    """
+
+    owner = models.ForeignKey(
+        django_settings.AUTH_USER_MODEL,
+        on_delete=models.CASCADE,
+        related_name="portfolio_realizedsale_set",
+    )
+    method = models.CharField(max_length=10, choices=Settings.CostBasisMethod.choices)
+    fingerprint = models.CharField(max_length=64)
+    transaction = models.ForeignKey(Transaction, on_delete=models.CASCADE, related_name="realized_sales")
+    asset = models.ForeignKey("assets.Asset", on_delete=models.CASCADE, related_name="realized_sales")
+    sequence = models.PositiveIntegerField()
+    date = models.DateField()
+    quantity = models.DecimalField(max_digits=20, decimal_places=6)
+    sell_price = models.DecimalField(max_digits=24, decimal_places=6)
+    cost_basis = models.DecimalField(max_digits=24, decimal_places=6)
+    proceeds = models.DecimalField(max_digits=24, decimal_places=6)
+    realized_pnl = models.DecimalField(max_digits=24, decimal_places=6)
+    oversell_quantity = models.DecimalField(max_digits=20, decimal_places=6, default=0)
+    history = models.CharField(
+        max_length=255, blank=True, default="", help_text="Digest of the transactions dated up to this sale."
+    )
+
+    class Meta:
+        ordering = ["sequence"]
+        constraints = [
+            models.UniqueConstraint(fields=["transaction", "method"], name="unique_realizedsale_tx_method"),
+        ]
+        indexes = [
+            models.Index(fields=["owner", "method", "date"], name="idx_realizedsale_owner_date"),
+        ]
+
+    def __str__(self):
+        return f"{self.method} sale @ {self.date}: {self.realized_pnl}"
+
+
+class RealizedLotMatch(models.Model):
+    """The part of an open lot a FIFO/LIFO sale consumed (WAC sales have none)."""
+
+    sale = models.ForeignKey(RealizedSale, on_delete=models.CASCADE, related_name="matches")
+    source = models.ForeignKey(Transaction, on_delete=models.CASCADE, related_name="realized_lot_matches")
+    quantity = models.DecimalField(max_digits=20, decimal_places=6)
+    cost = models.DecimalField(max_digits=24, decimal_places=6)
+
+    def __str__(self):
+        return f"{self.quantity} of {self.source_id} for sale {self.sale_id}"
+
+
+def invalidate_checkpoints(owner_id, since):
+    """Drop every checkpoint and ledger row that already includes transactions dated ``since`` or later."""
+    LotCheckpoint.objects.filter(owner_id=owner_id, as_of__gte=since).delete()
+    # A lot bought on ``since`` can only be consumed by sales on or after it.
+    RealizedSale.objects.filter(owner_id=owner_id, date__gte=since).delete()
+    # Replays memoized earlier in the same request/task no longer match the history.
+    forget_user(owner_id)
+
+
+def _transaction_date(value):
+    # Importer paths assign raw ISO strings, so normalise before comparing.
+    return Transaction._meta.get_field("date").to_python(value)
+
+
+@receiver(pre_save, sender=Transaction)
+def remember_previous_transaction_date(sender, instance, **kwargs):
+    if instance._state.adding:
+        instance._checkpoint_previous_date = None
+        return
+    instance._checkpoint_previous_date = (
+        Transaction.objects.filter(pk=instance.pk).values_list("date", flat=True).first()
+    )
+
+
+@receiver(post_save, sender=Transaction)
+def invalidate_checkpoints_on_save(sender, instance, **kwargs):
+    since = _transaction_date(instance.date)
+    previous = getattr(instance, "_checkpoint_previous_date", None)
+    if previous is not None and previous < since:
+        since = previous
+    invalidate_checkpoints(instance.owner_id, since)
+
+
+@receiver(post_delete, sender=Transaction)
+def invalidate_checkpoints_on_delete(sender, instance, **kwargs):
+    invalidate_checkpoints(instance.owner_id, _transaction_date(instance.date))
@@ -0,0 +1,180 @@
+"""Per-asset parallel replay for the cost-basis engine.
+
+Lot matching never looks across assets: a sale only consumes lots (or WAC
+state) of its own asset. Above ``PORTFOLIO_PARALLEL_THRESHOLD`` transactions
+a replay therefore splits the stream by asset into one partition per worker,
+matches each partition on a process pool with a :meth:`LotReducer.detached`
+copy of the reducer, and merges the results back into the reducer:
+
+- open lots per asset, in the order the assets were first seen;
+- realized sales (and their lot matches), in transaction order;
+- the running investment cost per month, by re-adding the cost changes each
+  worker recorded in transaction order, so every sum is taken in the same
+  order as a sequential replay and the ``Decimal`` results are identical.
+
+Workers get plain tuples of the columns in ``row_fields`` and never touch
+the database. Checkpoints cannot be taken mid-stream here, so a parallel
+replay writes at most one, after its last transaction.
+
+Only Celery tasks and management commands replay in parallel: they run the
+replay inside :func:`parallel_replays` (``config/celery.py`` does it for every
+task), and anywhere else, notably a web request, replays stay sequential so a
+single request cannot start a process per CPU. Workers are started with the
+``spawn`` method: forking a gunicorn or Celery process would copy its open
+database and Redis connections and its listener threads into every child.
+"""
+
+import heapq
+import logging
+import multiprocessing
+import os
+from collections import Counter, namedtuple
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+import django
+from django.conf import settings as django_settings
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_PARALLEL_THRESHOLD = 50_000
+
+_allowed = ContextVar("ft_parallel_replays", default=False)
+
+
+def allow_parallel_replays():
+    """Allow parallel replays until :func:`disallow_parallel_replays` is called with the returned token."""
+    return _allowed.set(True)
+
+
+def disallow_parallel_replays(token):
+    if token is not None:
+        _allowed.reset(token)
+
+
+@contextmanager
+def parallel_replays():
+    """Let replays inside the block use a process pool (Celery tasks and management commands only)."""
+    token = allow_parallel_replays()
+    try:
+        yield
+    finally:
+        disallow_parallel_replays(token)
+
+
+def worker_count(size):
+    """How many processes to replay a history of ``size`` transactions on; 1 means sequentially."""
+    threshold = getattr(django_settings, "PORTFOLIO_PARALLEL_THRESHOLD", DEFAULT_PARALLEL_THRESHOLD)
+    if not threshold or size < threshold or not _allowed.get():
+        return 1
+    if multiprocessing.current_process().daemon:
+        # Daemonic processes may not start children.
+        return 1
+    return getattr(django_settings, "PORTFOLIO_PARALLEL_WORKERS", None) or os.cpu_count() or 1
+
+
+class _CostTape:
+    """Stands in for a worker's ``running_cost``: keeps each change with its transaction's position."""
+
+    __slots__ = ("position", "changes")
+
+    def __init__(self):
+        self.position = None
+        self.changes = []
+
+    def __iadd__(self, amount):
+        self.changes.append((self.position, False, amount))
+        return self
+
+    def __isub__(self, amount):
+        self.changes.append((self.position, True, amount))
+        return self
+
+
+def _replay_partition(reducer, fields, rows):
+    """Worker: match one partition's transactions. ``rows`` are ``(position, *fields)`` tuples."""
+    row = namedtuple("Row", fields)
+    tape = reducer.running_cost = _CostTape()
+    sale_positions = []
+    for position, *values in rows:
+        tape.position = position
+        sold = len(reducer.realized_sales)
+        reducer.match(row._make(values))
+        if len(reducer.realized_sales) != sold:
+            sale_positions.append(position)
+    return reducer.positions, reducer.realized_sales, sale_positions, reducer.sale_matches, tape.changes
+
+
+def _partition(transactions, workers):
+    """Assign each asset to a worker, largest first onto the least loaded one."""
+    counts = Counter(tx.asset_id for tx in transactions)
+    loads = [(0, worker) for worker in range(workers)]
+    owner = {}
+    for aid, count in counts.most_common():
+        load, worker = heapq.heappop(loads)
+        owner[aid] = worker
+        heapq.heappush(loads, (load + count, worker))
+    return owner
+
+
+def _submit(pool, reducer, transactions, workers):
+    owner = _partition(transactions, workers)
+    fields = type(reducer).row_fields
+    rows = [[] for _ in range(workers)]
+    for position, tx in enumerate(transactions):
+        rows[owner[tx.asset_id]].append((position, *(getattr(tx, name) for name in fields)))
+
+    futures = []
+    for worker, partition in enumerate(rows):
+        if not partition:
+            continue
+        job = reducer.detached()
+        job.positions = {aid: lots for aid, lots in reducer.positions.items() if owner.get(aid) == worker}
+        futures.append(pool.submit(_replay_partition, job, fields, partition))
+    return futures
+
+
+def _merge(reducer, transactions, results):
+    positions = {}
+    for result in results:
+        positions.update(result[0])
+    for tx in transactions:
+        reducer.asset_map[tx.asset_id] = tx.asset
+        # Assets first seen in this replay join in first-seen order, as in a sequential one.
+        reducer.positions.setdefault(tx.asset_id, None)
+    reducer.positions.update(positions)
+
+    sales = sorted((position, i, index) for i, result in enumerate(results) for index, position in enumerate(result[2]))
+    for _, i, index in sales:
+        ledger = results[i][1]
+        reducer.realized_sales.append_from(ledger, index)
+        if reducer.sale_matches is not None:
+            tx_id, _, matched = results[i][3][index]
+            reducer.sale_matches.append((tx_id, len(reducer.realized_sales) - 1, matched))
+
+    changes = heapq.merge(*(result[4] for result in results), key=lambda change: change[0])
+    change = next(changes, None)
+    for position, tx in enumerate(transactions):
+        while change is not None and change[0] == position:
+            reducer.change_cost(change[2], subtract=change[1])
+            change = next(changes, None)
+        reducer.close_month(tx.date)
+
+    if transactions:
+        reducer.writer.skip(len(transactions), transactions[-1].date)
+        reducer.writer.flush(reducer.encode)
+
+
+def replay_partitioned(reducers, transactions, workers):
+    """Apply ``transactions`` to each :class:`LotReducer` in ``reducers``, per asset on ``workers`` processes."""
+    pending = []
+    context = multiprocessing.get_context("spawn")
+    with ProcessPoolExecutor(max_workers=workers, mp_context=context, initializer=django.setup) as pool:
+        for reducer in reducers:
+            after = reducer.resume_after
+            own = [tx for tx in transactions if after is None or tx.date > after]
+            pending.append((reducer, own, _submit(pool, reducer, own, workers)))
+        for reducer, own, futures in pending:
+            _merge(reducer, own, [future.result() for future in futures])
+    logger.debug("Replayed %s transactions for %s method(s) on %s workers", len(transactions), len(reducers), workers)
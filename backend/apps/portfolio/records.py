@@ -0,0 +1,185 @@
+"""Compact in-memory records for the cost-basis engine.
+
+A heavy history keeps thousands of open lots and realized sales alive per
+replay (and the snapshot worker replays every user in turn), so the engine
+holds slotted :class:`Lot`/:class:`WacPosition` records instead of dicts,
+and realized sales live column-wise in a :class:`SaleLedger` of machine
+integers. Sales are turned into API dicts only at the service boundary
+(:meth:`Sale.as_dict`).
+"""
+
+import datetime
+import uuid
+from array import array
+from dataclasses import dataclass
+from decimal import Decimal
+
+from apps.transactions.models import Transaction
+
+# Sale quantities are stored in units of the Transaction.quantity scale.
+QTY_DIGITS = Transaction._meta.get_field("quantity").decimal_places
+
+# SaleLedger.flags bits: signs and spellings an int column cannot carry.
+NEGATIVE_ZERO_PROCEEDS = 1
+NEGATIVE_ZERO_PNL = 2
+# WAC reports a fully covered sale's oversell as Decimal("0") rather than 0.000000.
+BARE_ZERO_OVERSELL = 4
+
+
+@dataclass(slots=True)
+class Lot:
+    qty: Decimal
+    price_per_unit: Decimal
+    account_id: uuid.UUID | None
+    # The BUY/GIFT transaction that opened the lot; None for WAC's average-cost lot.
+    source_id: uuid.UUID | None = None
+
+
+@dataclass(slots=True)
+class WacPosition:
+    total_qty: Decimal
+    total_cost: Decimal
+    acct_qty: dict
+
+
+@dataclass(slots=True)
+class Sale:
+    """One realized sale, materialized from a :class:`SaleLedger` row."""
+
+    asset_id: uuid.UUID
+    date: datetime.date
+    quantity: Decimal
+    sell_price: Decimal
+    cost_basis: Decimal
+    proceeds: Decimal
+    realized_pnl: Decimal
+    oversell_quantity: Decimal
+
+    def as_dict(self, asset):
+        return {
+            "date": self.date.isoformat(),
+            "asset_name": asset.name,
+            "asset_ticker": asset.ticker,
+            "quantity": str(self.quantity),
+            "sell_price": str(self.sell_price),
+            "cost_basis": str(self.cost_basis),
+            "proceeds": str(self.proceeds),
+            "realized_pnl": str(self.realized_pnl),
+            "oversell_quantity": str(self.oversell_quantity),
+        }
+
+
+def _decimal(units, digits, negative=False):
+    sign = "-" if negative and units == 0 else ""
+    return Decimal(f"{sign}{units}E-{digits}")
+
+
+def _units(value, digits):
+    return int(value.scaleb(digits))
+
+
+class SaleLedger:
+    """Realized sales in append-only ``array("q")`` columns.
+
+    Quantities are stored in ``10**-QTY_DIGITS`` units and money in
+    ``10**-money_digits`` units, which is exactly what the engine produces
+    (every money field is already rounded to ``rounding_money``). A value
+    outside int64 moves the columns to plain lists instead of failing.
+    """
+
+    _COLUMNS = (
+        "asset",
+        "date",
+        "quantity",
+        "sell_price",
+        "cost_basis",
+        "proceeds",
+        "realized_pnl",
+        "oversell",
+        "flags",
+    )
+
+    __slots__ = ("money_digits", "asset_ids", "_asset_index", *_COLUMNS)
+
+    def __init__(self, money_digits):
+        self.money_digits = money_digits
+        self.asset_ids = []
+        self._asset_index = {}
+        for name in self._COLUMNS:
+            setattr(self, name, array("q"))
+
+    def __len__(self):
+        return len(self.date)
+
+    def append_units(self, asset_id, date, quantity, sell_price, cost_basis, proceeds, realized_pnl, oversell, flags=0):
+        """Append a sale whose amounts are already scaled ints (see class docstring)."""
+        index = self._asset_index.get(asset_id)
+        if index is None:
+            index = self._asset_index[asset_id] = len(self.asset_ids)
+            self.asset_ids.append(asset_id)
+        row = (index, date.toordinal(), quantity, sell_price, cost_basis, proceeds, realized_pnl, oversell, flags)
+        size = len(self)
+        try:
+            for name, value in zip(self._COLUMNS, row, strict=True):
+                getattr(self, name).append(value)
+        except OverflowError:
+            self._promote(size)
+            for name, value in zip(self._COLUMNS, row, strict=True):
+                getattr(self, name).append(value)
+
+    def append(self, asset_id, date, quantity, sell_price, cost_basis, proceeds, realized_pnl, oversell):
+        """Append a sale given as ``Decimal`` amounts."""
+        digits = self.money_digits
+        flags = 0
+        if proceeds == 0 and proceeds.is_signed():
+            flags |= NEGATIVE_ZERO_PROCEEDS
+        if realized_pnl == 0 and realized_pnl.is_signed():
+            flags |= NEGATIVE_ZERO_PNL
+        if oversell == 0 and oversell.as_tuple().exponent == 0:
+            flags |= BARE_ZERO_OVERSELL
+        self.append_units(
+            asset_id,
+            date,
+            _units(quantity, QTY_DIGITS),
+            _units(sell_price, digits),
+            _units(cost_basis, digits),
+            _units(proceeds, digits),
+            _units(realized_pnl, digits),
+            _units(oversell, QTY_DIGITS),
+            flags,
+        )
+
+    def append_from(self, ledger, i):
+        """Append row ``i`` of another ledger with the same ``money_digits``, flags included."""
+        self.append_units(
+            ledger.asset_ids[ledger.asset[i]],
+            datetime.date.fromordinal(ledger.date[i]),
+            *(getattr(ledger, name)[i] for name in self._COLUMNS[2:]),
+        )
+
+    def _promote(self, size):
+        # Drop any partial row from the failed append, then switch to unbounded ints.
+        for name in self._COLUMNS:
+            setattr(self, name, list(getattr(self, name))[:size])
+
+    def total_pnl(self):
+        return _decimal(sum(self.realized_pnl), self.money_digits)
+
+    def __getitem__(self, i):
+        digits = self.money_digits
+        flags = self.flags[i]
+        oversell = self.oversell[i]
+        return Sale(
+            self.asset_ids[self.asset[i]],
+            datetime.date.fromordinal(self.date[i]),
+            _decimal(self.quantity[i], QTY_DIGITS),
+            _decimal(self.sell_price[i], digits),
+            _decimal(self.cost_basis[i], digits),
+            _decimal(self.proceeds[i], digits, flags & NEGATIVE_ZERO_PROCEEDS),
+            _decimal(self.realized_pnl[i], digits, flags & NEGATIVE_ZERO_PNL),
+            Decimal("0") if flags & BARE_ZERO_OVERSELL else _decimal(oversell, QTY_DIGITS),
+        )
+
+    def __iter__(self):
+        for i in range(len(self)):
+            yield self[i]
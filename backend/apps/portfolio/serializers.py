@@ -0,0 +1,50 @@
+from decimal import ROUND_HALF_UP
+
+from rest_framework import serializers
+
+from .models import RealizedLotMatch, RealizedSale
+
+
+class RealizedLotMatchSerializer(serializers.ModelSerializer):
+    source_date = serializers.DateField(source="source.date", read_only=True)
+    source_type = serializers.CharField(source="source.type", read_only=True)
+
+    class Meta:
+        model = RealizedLotMatch
+        fields = ["source", "source_date", "source_type", "quantity", "cost"]
+
+
+class RealizedSaleSerializer(serializers.ModelSerializer):
+    """A realized sale from the ledger; money is rounded to the user's ``rounding_money`` (context ``money_exp``)."""
+
+    asset_name = serializers.CharField(source="asset.name", read_only=True)
+    asset_ticker = serializers.CharField(source="asset.ticker", read_only=True)
+    matches = RealizedLotMatchSerializer(many=True, read_only=True)
+
+    money_fields = ("sell_price", "cost_basis", "proceeds", "realized_pnl")
+
+    class Meta:
+        model = RealizedSale
+        fields = [
+            "transaction",
+            "date",
+            "asset",
+            "asset_name",
+            "asset_ticker",
+            "quantity",
+            "sell_price",
+            "cost_basis",
+            "proceeds",
+            "realized_pnl",
+            "oversell_quantity",
+            "matches",
+        ]
+
+    def to_representation(self, instance):
+        data = super().to_representation(instance)
+        money_exp = self.context["money_exp"]
+        for name in self.money_fields:
+            data[name] = str(getattr(instance, name).quantize(money_exp, rounding=ROUND_HALF_UP))
+        for match, row in zip(instance.matches.all(), data["matches"], strict=True):
+            row["cost"] = str(match.cost.quantize(money_exp, rounding=ROUND_HALF_UP))
+        return data
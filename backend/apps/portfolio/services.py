@@ -1,312 +1,162 @@
 import logging
-from collections import deque
 from decimal import ROUND_HALF_UP, Decimal
 
-from apps.assets.models import Account, Settings
-from apps.transactions.models import Transaction
+from django.db.models import OuterRef, Subquery
 
-logger = logging.getLogger(__name__)
+from apps.assets.models import Account, AccountSnapshot, Asset, Settings
+from apps.transactions.models import Transaction
 
+from .engine import replay
 
-def _fetch_transactions(user):
-    return Transaction.objects.filter(owner=user).select_related("asset").order_by("date", "created_at")
+logger = logging.getLogger(__name__)
 
 
-def compute_investment_cost_by_month(user):
+def compute_investment_cost_by_month(user, engine=None):
     """Compute running investment cost at end of each month.
 
     Uses the user's fiscal_cost_method (FIFO/LIFO/WAC) to track lots.
     Returns dict mapping "YYYY-MM" → Decimal running investment cost.
+    Pass an ``engine`` result that already replayed the fiscal method to
+    reuse it instead of replaying again.
     """
-    settings = Settings.load(user)
-    method = settings.fiscal_cost_method
-    use_wac = method == "WAC"
-    use_lifo = method == "LIFO"
-    gift_market = settings.gift_cost_mode == "MARKET"
-
-    lots: dict = {}
-    wac_state: dict = {}
-    running_cost = Decimal("0")
-    cost_by_month: dict[str, Decimal] = {}
-
-    for tx in (
-        Transaction.objects.filter(owner=user)
-        .order_by("date", "created_at")
-        .values("date", "type", "asset_id", "quantity", "price", "commission", "tax")
-    ):
-        month_key = tx["date"].strftime("%Y-%m")
-        aid = tx["asset_id"]
-        qty = tx["quantity"] or Decimal("0")
-        price = tx["price"] or Decimal("0")
-        commission = tx["commission"] or Decimal("0")
-        tax = tx["tax"] or Decimal("0")
-
-        if tx["type"] == "BUY":
-            ppu = price + (commission + tax) / qty if qty else Decimal("0")
-            running_cost += qty * ppu
-            if use_wac:
-                if aid not in wac_state:
-                    wac_state[aid] = {"total_qty": Decimal("0"), "total_cost": Decimal("0")}
-                wac_state[aid]["total_qty"] += qty
-                wac_state[aid]["total_cost"] += qty * ppu
-            else:
-                if aid not in lots:
-                    lots[aid] = deque()
-                lots[aid].append({"qty": qty, "ppu": ppu})
-
-        elif tx["type"] == "GIFT":
-            ppu = price if gift_market else Decimal("0")
-            running_cost += qty * ppu
-            if use_wac:
-                if aid not in wac_state:
-                    wac_state[aid] = {"total_qty": Decimal("0"), "total_cost": Decimal("0")}
-                wac_state[aid]["total_qty"] += qty
-                wac_state[aid]["total_cost"] += qty * ppu
-            else:
-                if aid not in lots:
-                    lots[aid] = deque()
-                lots[aid].append({"qty": qty, "ppu": ppu})
-
-        elif tx["type"] == "SELL":
-            if use_wac:
-                state = wac_state.get(aid)
-                if state and state["total_qty"] > 0:
-                    avg = state["total_cost"] / state["total_qty"]
-                    running_cost -= avg * qty
-                    state["total_qty"] -= qty
-                    state["total_cost"] -= avg * qty
-                    if state["total_qty"] <= 0:
-                        state["total_qty"] = Decimal("0")
-                        state["total_cost"] = Decimal("0")
-            else:
-                if aid not in lots:
-                    lots[aid] = deque()
-                remaining = qty
-                while remaining > 0 and lots.get(aid):
-                    lot = lots[aid][-1] if use_lifo else lots[aid][0]
-                    consumed = min(remaining, lot["qty"])
-                    running_cost -= consumed * lot["ppu"]
-                    lot["qty"] -= consumed
-                    remaining -= consumed
-                    if lot["qty"] <= 0:
-                        lots[aid].pop() if use_lifo else lots[aid].popleft()
-
-        cost_by_month[month_key] = running_cost
-
-    return cost_by_month
-
-
-def _process_lot_based(user, lifo=False):
-    settings = Settings.load(user)
-    money_exp = Decimal(10) ** -settings.rounding_money
+    if engine is None:
+        settings = Settings.snapshot(user)
+        engine = replay(user, methods=[settings.fiscal_cost_method], settings=settings)
+    return engine[engine.settings.fiscal_cost_method].cost_by_month
 
-    lots = {}
-    asset_map = {}
-    realized_sales = []
-
-    for tx in _fetch_transactions(user):
-        aid = tx.asset_id
-        if aid not in lots:
-            lots[aid] = deque()
-        asset_map[aid] = tx.asset
-
-        if tx.type == Transaction.TransactionType.BUY:
-            price = tx.price or Decimal("0")
-            price_per_unit = price + (tx.commission + tx.tax) / tx.quantity if tx.quantity else Decimal("0")
-            lots[aid].append({"qty": tx.quantity, "price_per_unit": price_per_unit, "account_id": tx.account_id})
-
-        elif tx.type == Transaction.TransactionType.GIFT:
-            if settings.gift_cost_mode == Settings.GiftCostMode.MARKET:
-                price_per_unit = tx.price or Decimal("0")
-            else:
-                price_per_unit = Decimal("0")
-            lots[aid].append({"qty": tx.quantity, "price_per_unit": price_per_unit, "account_id": tx.account_id})
-
-        elif tx.type == Transaction.TransactionType.SELL:
-            sell_price = tx.price or Decimal("0")
-            remaining = tx.quantity
-            cost_basis = Decimal("0")
-
-            while remaining > 0 and lots[aid]:
-                lot = lots[aid][-1] if lifo else lots[aid][0]
-                consumed = min(remaining, lot["qty"])
-                cost_basis += lot["price_per_unit"] * consumed
-                lot["qty"] -= consumed
-                remaining -= consumed
-                if lot["qty"] <= 0:
-                    lots[aid].pop() if lifo else lots[aid].popleft()
-
-            if remaining > 0:
-                logger.warning(
-                    "Oversell detected for asset %s: %s shares not covered by lots",
-                    aid,
-                    remaining,
-                )
-
-            total_cost_basis = cost_basis.quantize(money_exp, rounding=ROUND_HALF_UP)
-            sell_total = (sell_price * tx.quantity - tx.commission - tx.tax).quantize(money_exp, rounding=ROUND_HALF_UP)
-            pnl = (sell_total - total_cost_basis).quantize(money_exp, rounding=ROUND_HALF_UP)
-
-            realized_sales.append(
-                {
-                    "date": tx.date.isoformat(),
-                    "asset_name": tx.asset.name,
-                    "asset_ticker": tx.asset.ticker,
-                    "quantity": str(tx.quantity),
-                    "sell_price": str(sell_price.quantize(money_exp, rounding=ROUND_HALF_UP)),
-                    "cost_basis": str(total_cost_basis),
-                    "proceeds": str(sell_total),
-                    "realized_pnl": str(pnl),
-                    "oversell_quantity": str(remaining),
-                }
-            )
 
-    return lots, realized_sales, asset_map, settings
+def _process_transactions(user, method=None, engine=None, as_of=None):
+    if engine is None:
+        settings = Settings.snapshot(user)
+        if method is None:
+            method = settings.cost_basis_method
+        engine = replay(user, methods=[method], settings=settings, as_of=as_of)
+    elif method is None:
+        method = engine.settings.cost_basis_method
+    reducer = engine[method]
+    return reducer.lots, reducer.realized_pnl, reducer.asset_map, engine.settings
 
 
-def _process_wac(user):
-    settings = Settings.load(user)
-    money_exp = Decimal(10) ** -settings.rounding_money
+def _sale_dicts(rows, method, settings):
+    """Realized-gain ledger rows shaped like the engine's sales (see ``Sale.as_dict``)."""
+    from .records import QTY_DIGITS
 
-    wac_state = {}
-    asset_map = {}
-    realized_sales = []
-
-    for tx in _fetch_transactions(user):
-        aid = tx.asset_id
-        if aid not in wac_state:
-            wac_state[aid] = {"total_qty": Decimal("0"), "total_cost": Decimal("0"), "acct_qty": {}}
-        asset_map[aid] = tx.asset
-        state = wac_state[aid]
-
-        if tx.type == Transaction.TransactionType.BUY:
-            price = tx.price or Decimal("0")
-            price_per_unit = price + (tx.commission + tx.tax) / tx.quantity if tx.quantity else Decimal("0")
-            state["total_qty"] += tx.quantity
-            state["total_cost"] += price_per_unit * tx.quantity
-            state["acct_qty"][tx.account_id] = state["acct_qty"].get(tx.account_id, Decimal("0")) + tx.quantity
-
-        elif tx.type == Transaction.TransactionType.GIFT:
-            if settings.gift_cost_mode == Settings.GiftCostMode.MARKET:
-                price_per_unit = tx.price or Decimal("0")
-            else:
-                price_per_unit = Decimal("0")
-            state["total_qty"] += tx.quantity
-            state["total_cost"] += price_per_unit * tx.quantity
-            state["acct_qty"][tx.account_id] = state["acct_qty"].get(tx.account_id, Decimal("0")) + tx.quantity
-
-        elif tx.type == Transaction.TransactionType.SELL:
-            sell_price = tx.price or Decimal("0")
-            avg_price = (state["total_cost"] / state["total_qty"]) if state["total_qty"] > 0 else Decimal("0")
-            oversell_qty = max(Decimal("0"), tx.quantity - state["total_qty"])
-            covered_qty = tx.quantity - oversell_qty
-            cost_basis = (avg_price * covered_qty).quantize(money_exp, rounding=ROUND_HALF_UP)
-
-            if oversell_qty > 0:
-                logger.warning(
-                    "Oversell detected for asset %s (WAC): %s shares not covered",
-                    aid,
-                    oversell_qty,
-                )
-
-            state["total_qty"] -= tx.quantity
-            state["total_cost"] -= avg_price * covered_qty
-            if state["total_qty"] <= 0:
-                state["total_qty"] = Decimal("0")
-                state["total_cost"] = Decimal("0")
-
-            sell_total = (sell_price * tx.quantity - tx.commission - tx.tax).quantize(money_exp, rounding=ROUND_HALF_UP)
-            pnl = (sell_total - cost_basis).quantize(money_exp, rounding=ROUND_HALF_UP)
-
-            realized_sales.append(
-                {
-                    "date": tx.date.isoformat(),
-                    "asset_name": tx.asset.name,
-                    "asset_ticker": tx.asset.ticker,
-                    "quantity": str(tx.quantity),
-                    "sell_price": str(sell_price.quantize(money_exp, rounding=ROUND_HALF_UP)),
-                    "cost_basis": str(cost_basis),
-                    "proceeds": str(sell_total),
-                    "realized_pnl": str(pnl),
-                    "oversell_quantity": str(oversell_qty),
-                }
-            )
-
-            for acct_id in list(state["acct_qty"]):
-                if state["acct_qty"][acct_id] > 0:
-                    state["acct_qty"][acct_id] -= tx.quantity
-                    if state["acct_qty"][acct_id] <= 0:
-                        del state["acct_qty"][acct_id]
-                    break
-
-    lots = {}
-    for aid, state in wac_state.items():
-        if state["total_qty"] > 0:
-            avg_price = state["total_cost"] / state["total_qty"]
-            primary_account = max(state["acct_qty"], key=state["acct_qty"].get) if state["acct_qty"] else None
-            lots[aid] = deque([{"qty": state["total_qty"], "price_per_unit": avg_price, "account_id": primary_account}])
-        else:
-            lots[aid] = deque()
-
-    return lots, realized_sales, asset_map, settings
-
-
-def _process_transactions(user, method=None):
-    if method is None:
-        settings = Settings.load(user)
-        method = settings.cost_basis_method
-    if method == Settings.CostBasisMethod.WAC:
-        return _process_wac(user)
-    if method == Settings.CostBasisMethod.LIFO:
-        return _process_lot_based(user, lifo=True)
-    return _process_lot_based(user, lifo=False)
-
-
-def calculate_realized_pnl(user):
-    _, realized_sales, _, settings = _process_transactions(user)
     money_exp = Decimal(10) ** -settings.rounding_money
-    total = sum((Decimal(s["realized_pnl"]) for s in realized_sales), Decimal("0"))
+    qty_exp = Decimal(10) ** -QTY_DIGITS
+    # The WAC engine reports a fully covered sale's oversell as a bare "0".
+    covered = "0" if method == Settings.CostBasisMethod.WAC else str(Decimal(0).quantize(qty_exp))
+    return [
+        {
+            "date": row.date.isoformat(),
+            "asset_name": row.asset.name,
+            "asset_ticker": row.asset.ticker,
+            "quantity": str(row.quantity.quantize(qty_exp)),
+            "sell_price": str(row.sell_price.quantize(money_exp)),
+            "cost_basis": str(row.cost_basis.quantize(money_exp)),
+            "proceeds": str(row.proceeds.quantize(money_exp)),
+            "realized_pnl": str(row.realized_pnl.quantize(money_exp)),
+            "oversell_quantity": str(row.oversell_quantity.quantize(qty_exp)) if row.oversell_quantity else covered,
+        }
+        for row in rows
+    ]
+
+
+def _realized_payload(user, method, settings, as_of=None):
+    """Every sale under ``method`` (up to ``as_of``), read from the realized-gain ledger."""
+    from .ledger import realized_sales_until
+
+    rows = list(realized_sales_until(user, method, as_of, settings))
+    total = sum((row.realized_pnl for row in rows), Decimal("0"))
+    money_exp = Decimal(10) ** -settings.rounding_money
     return {
         "realized_pnl_total": str(total.quantize(money_exp, rounding=ROUND_HALF_UP)),
-        "realized_sales": realized_sales,
+        "realized_sales": _sale_dicts(rows, method, settings),
     }
 
 
-def calculate_realized_pnl_fiscal(user):
-    settings = Settings.load(user)
-    _, realized_sales, _, settings = _process_transactions(user, method=settings.fiscal_cost_method)
+def calculate_realized_pnl(user, as_of=None):
+    settings = Settings.snapshot(user)
+    return _realized_payload(user, settings.cost_basis_method, settings, as_of=as_of)
+
+
+def calculate_realized_pnl_fiscal(user, as_of=None):
+    settings = Settings.snapshot(user)
+    return _realized_payload(user, settings.fiscal_cost_method, settings, as_of=as_of)
+
+
+def fiscal_realized_pnl_by_year(user):
+    """``{year: Decimal}`` realized P&L under the fiscal method, read from the realized-gain ledger."""
+    from .ledger import realized_pnl_by_year
+
+    settings = Settings.snapshot(user)
     money_exp = Decimal(10) ** -settings.rounding_money
-    total = sum((Decimal(s["realized_pnl"]) for s in realized_sales), Decimal("0"))
-    return {
-        "realized_pnl_total": str(total.quantize(money_exp, rounding=ROUND_HALF_UP)),
-        "realized_sales": realized_sales,
-    }
+    totals = realized_pnl_by_year(user, settings.fiscal_cost_method, settings)
+    return {year: total.quantize(money_exp, rounding=ROUND_HALF_UP) for year, total in totals.items()}
+
+
+def fiscal_realized_sales(user, year):
+    """Sales dated in ``year`` under the fiscal method, shaped like ``calculate_realized_pnl_fiscal``'s."""
+    from .ledger import realized_sales_in_year
+
+    settings = Settings.snapshot(user)
+    method = settings.fiscal_cost_method
+    return _sale_dicts(realized_sales_in_year(user, method, year, settings), method, settings)
+
 
+def _prices_as_of(asset_map, as_of):
+    """Price of each asset's last priced transaction on or before ``as_of``.
 
-def _build_portfolio(lots, asset_map, money_exp, qty_exp, user):
+    There is no stored price history, so a past valuation uses the last price
+    the user actually traded (or was gifted) at.
+    """
+    last_price = (
+        Transaction.objects.filter(asset=OuterRef("pk"), date__lte=as_of, price__gt=0)
+        .order_by("-date", "-created_at")
+        .values("price")[:1]
+    )
+    rows = Asset.objects.filter(pk__in=list(asset_map)).annotate(price_as_of=Subquery(last_price))
+    return dict(rows.values_list("pk", "price_as_of"))
+
+
+def _account_balances(user, as_of=None):
+    """``(account, balance)`` per account; past balances come from the last snapshot on or before ``as_of``."""
+    accounts = Account.objects.filter(owner=user)
+    if as_of is None:
+        return [(acc, acc.balance) for acc in accounts]
+    last_balance = (
+        AccountSnapshot.objects.filter(account=OuterRef("pk"), date__lte=as_of).order_by("-date").values("balance")[:1]
+    )
+    return [(acc, acc.balance_as_of) for acc in accounts.annotate(balance_as_of=Subquery(last_balance))]
+
+
+def _build_portfolio(lots, asset_map, money_exp, qty_exp, user, as_of=None):
     positions = []
     total_market_value = Decimal("0")
+    if as_of is None:
+        prices = {aid: asset.current_price for aid, asset in asset_map.items()}
+    else:
+        prices = _prices_as_of(asset_map, as_of)
 
     for aid, asset_lots in lots.items():
-        qty = sum((lot["qty"] for lot in asset_lots), Decimal("0"))
-        cost_total = sum((lot["qty"] * lot["price_per_unit"] for lot in asset_lots), Decimal("0"))
+        qty = sum((lot.qty for lot in asset_lots), Decimal("0"))
+        cost_total = sum((lot.qty * lot.price_per_unit for lot in asset_lots), Decimal("0"))
 
         if qty.quantize(qty_exp, rounding=ROUND_HALF_UP) <= 0:
             continue
         asset = asset_map[aid]
-        if not asset.current_price:
+        if not prices.get(aid):
             continue
 
         acct_qty = {}
         for lot in asset_lots:
-            if lot["qty"] > 0:
-                acct_qty[lot["account_id"]] = acct_qty.get(lot["account_id"], Decimal("0")) + lot["qty"]
+            if lot.qty > 0:
+                acct_qty[lot.account_id] = acct_qty.get(lot.account_id, Decimal("0")) + lot.qty
         primary_account_id = max(acct_qty, key=acct_qty.get) if acct_qty else None
 
         quantity = qty.quantize(qty_exp, rounding=ROUND_HALF_UP)
         cost_total_r = cost_total.quantize(money_exp, rounding=ROUND_HALF_UP)
         avg_cost = (cost_total / qty).quantize(money_exp, rounding=ROUND_HALF_UP)
-        current_price = asset.current_price or Decimal("0")
+        current_price = prices[aid]
         market_value = (quantity * current_price).quantize(money_exp, rounding=ROUND_HALF_UP)
         unrealized_pnl = (market_value - cost_total_r).quantize(money_exp, rounding=ROUND_HALF_UP)
         unrealized_pnl_pct = (
@@ -349,8 +199,8 @@ def _build_portfolio(lots, asset_map, money_exp, qty_exp, user):
 
     accounts = []
     total_cash = Decimal("0")
-    for acc in Account.objects.filter(owner=user):
-        bal = acc.balance or Decimal("0")
+    for acc, bal in _account_balances(user, as_of):
+        bal = bal or Decimal("0")
         if bal != 0:
             total_cash += bal
             accounts.append(
@@ -384,22 +234,29 @@ def _build_portfolio(lots, asset_map, money_exp, qty_exp, user):
     }
 
 
-def calculate_portfolio(user):
-    lots, _, asset_map, settings = _process_transactions(user)
+def calculate_portfolio(user, engine=None, as_of=None):
+    lots, _, asset_map, settings = _process_transactions(user, engine=engine, as_of=as_of)
     money_exp = Decimal(10) ** -settings.rounding_money
     qty_exp = Decimal(10) ** -settings.rounding_qty
-    return _build_portfolio(lots, asset_map, money_exp, qty_exp, user)
+    return _build_portfolio(lots, asset_map, money_exp, qty_exp, user, as_of=as_of)
 
 
-def calculate_portfolio_full(user):
-    lots, realized_sales, asset_map, settings = _process_transactions(user)
+def calculate_portfolio_full(user, as_of=None):
+    """Positions and totals now or, with ``as_of``, at the end of that day.
+
+    A past portfolio only counts transactions dated on or before ``as_of``,
+    values positions at their last traded price and cash at the last account
+    snapshot up to that date.
+    """
+    lots, realized_pnl, asset_map, settings = _process_transactions(user, as_of=as_of)
     money_exp = Decimal(10) ** -settings.rounding_money
     qty_exp = Decimal(10) ** -settings.rounding_qty
 
-    data = _build_portfolio(lots, asset_map, money_exp, qty_exp, user)
+    data = _build_portfolio(lots, asset_map, money_exp, qty_exp, user, as_of=as_of)
+    if as_of is not None:
+        data["as_of"] = as_of.isoformat()
 
-    total_realized = sum((Decimal(s["realized_pnl"]) for s in realized_sales), Decimal("0"))
-    data["totals"]["total_realized_pnl"] = str(total_realized.quantize(money_exp, rounding=ROUND_HALF_UP))
-    data["realized_sales"] = realized_sales
+    # Individual sales are served by /api/portfolio/realized-sales/ so this payload stays small.
+    data["totals"]["total_realized_pnl"] = str(realized_pnl.quantize(money_exp, rounding=ROUND_HALF_UP))
 
     return data
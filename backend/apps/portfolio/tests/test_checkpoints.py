@@ -0,0 +1,242 @@
+"""
+Tests for persisted lot-state checkpoints: resumed replays must produce the
+same output as a full replay, and transaction writes must only drop the
+checkpoints they affect.
+"""
+
+import datetime
+from decimal import Decimal
+from unittest.mock import patch
+
+import pytest
+from django.contrib.auth import get_user_model
+
+from apps.assets.models import Account, Asset, Settings
+from apps.portfolio.engine import replay
+from apps.portfolio.models import LotCheckpoint, RealizedSale
+from apps.portfolio.services import calculate_portfolio_full, calculate_realized_pnl, calculate_realized_pnl_fiscal
+from apps.transactions.models import Transaction
+
+User = get_user_model()
+
+
+@pytest.fixture
+def user(db):
+    return User.objects.create_user(username="cpuser", password="testpass123")
+
+
+@pytest.fixture
+def account(user):
+    return Account.objects.create(owner=user, name="Broker", type=Account.AccountType.INVERSION)
+
+
+@pytest.fixture
+def asset(user):
+    return Asset.objects.create(owner=user, name="Alpha", ticker="ALP", current_price=Decimal("20.00"))
+
+
+@pytest.fixture
+def asset_b(user):
+    return Asset.objects.create(owner=user, name="Beta", ticker="BET", current_price=Decimal("7.50"))
+
+
+@pytest.fixture
+def small_interval(settings):
+    settings.PORTFOLIO_CHECKPOINT_INTERVAL = 2
+
+
+def _set_method(user, method):
+    s = Settings.load(user)
+    s.cost_basis_method = method
+    s.fiscal_cost_method = method
+    s.save()
+
+
+def _tx(user, asset, account, tx_type, day, qty, price, commission=0):
+    return Transaction.objects.create(
+        owner=user,
+        asset=asset,
+        account=account,
+        type=tx_type,
+        date=datetime.date(2024, 1, 1) + datetime.timedelta(days=day),
+        quantity=Decimal(str(qty)),
+        price=Decimal(str(price)),
+        commission=Decimal(str(commission)),
+    )
+
+
+def _history(user, asset, asset_b, account):
+    _tx(user, asset, account, "BUY", 0, 10, 10, commission=1)
+    _tx(user, asset_b, account, "BUY", 1, 100, 5)
+    _tx(user, asset, account, "BUY", 2, 5, 12)
+    _tx(user, asset, account, "SELL", 3, 7, 15, commission=1)
+    _tx(user, asset_b, account, "SELL", 4, 30, 6)
+    _tx(user, asset, account, "BUY", 5, 3, 11)
+    _tx(user, asset, account, "SELL", 6, 4, 18)
+    _tx(user, asset_b, account, "BUY", 7, 10, 4.5)
+
+
+def _outputs(user):
+    """The portfolio plus its realized sales, which the portfolio payload leaves out."""
+    return {**calculate_portfolio_full(user), **calculate_realized_pnl(user)}
+
+
+def _full_replay(user, settings):
+    """Compute from the first trade, ignoring and not writing checkpoints, on a rebuilt realized-gain ledger."""
+    interval = settings.PORTFOLIO_CHECKPOINT_INTERVAL
+    settings.PORTFOLIO_CHECKPOINT_INTERVAL = 0
+    RealizedSale.objects.filter(owner=user).delete()
+    try:
+        with patch("apps.portfolio.engine.load_checkpoint", return_value=None):
+            return _outputs(user)
+    finally:
+        settings.PORTFOLIO_CHECKPOINT_INTERVAL = interval
+
+
+@pytest.mark.django_db
+@pytest.mark.parametrize("method", ["FIFO", "LIFO", "WAC"])
+class TestResumeMatchesFullReplay:
+    def test_resumed_output_is_identical(self, user, asset, asset_b, account, small_interval, settings, method):
+        _set_method(user, method)
+        _history(user, asset, asset_b, account)
+
+        first = _outputs(user)
+        assert LotCheckpoint.objects.filter(owner=user, method=method).exists()
+
+        resumed = _outputs(user)
+        assert resumed == first
+        assert resumed == _full_replay(user, settings)
+
+    def test_new_trade_after_checkpoints(self, user, asset, asset_b, account, small_interval, settings, method):
+        _set_method(user, method)
+        _history(user, asset, asset_b, account)
+        _outputs(user)
+        before = set(LotCheckpoint.objects.filter(owner=user).values_list("as_of", flat=True))
+
+        _tx(user, asset, account, "SELL", 10, 2, 21)
+
+        assert set(LotCheckpoint.objects.filter(owner=user).values_list("as_of", flat=True)) == before
+        assert _outputs(user) == _full_replay(user, settings)
+
+
+def _monthly_history(user, asset, account):
+    for month in range(6):
+        _tx(user, asset, account, "BUY", 31 * month, 10, 10 + month)
+        _tx(user, asset, account, "SELL", 31 * month + 1, 4, 12 + month, commission=1)
+
+
+def _reducer(user, method="FIFO"):
+    return replay(user, methods=[method])[method]
+
+
+@pytest.mark.django_db
+class TestCheckpointState:
+    def test_keeps_no_sales_and_only_the_months_since_the_previous_checkpoint(
+        self, user, asset, account, small_interval
+    ):
+        _monthly_history(user, asset, account)
+        _reducer(user)
+
+        checkpoints = list(LotCheckpoint.objects.filter(owner=user).order_by("as_of"))
+        assert len(checkpoints) >= 3
+        for previous, checkpoint in zip(checkpoints, checkpoints[1:], strict=False):
+            assert "sales" not in checkpoint.state
+            months = [month for month, _ in checkpoint.state["cost_by_month"]]
+            assert min(months) >= previous.as_of.strftime("%Y-%m")
+        newest = checkpoints[-1]
+        assert (
+            newest.state["sale_count"]
+            == Transaction.objects.filter(owner=user, type="SELL", date__lte=newest.as_of).count()
+        )
+
+    @pytest.mark.parametrize("method", ["FIFO", "WAC"])
+    def test_resumed_reducer_rebuilds_totals_and_months(self, user, asset, account, small_interval, settings, method):
+        _monthly_history(user, asset, account)
+        settings.PORTFOLIO_CHECKPOINT_INTERVAL = 0
+        with patch("apps.portfolio.engine.load_checkpoint", return_value=None):
+            full = _reducer(user, method)
+        settings.PORTFOLIO_CHECKPOINT_INTERVAL = 2
+        _reducer(user, method)
+
+        resumed = _reducer(user, method)
+        assert resumed.resume_after is not None
+        assert len(resumed.realized_sales) < len(full.realized_sales)
+        assert resumed.realized_pnl == full.realized_pnl
+        assert list(resumed.cost_by_month.items()) == list(full.cost_by_month.items())
+
+
+@pytest.mark.django_db
+class TestInvalidation:
+    def test_edit_drops_only_later_checkpoints(self, user, asset, asset_b, account, small_interval):
+        _set_method(user, "FIFO")
+        _history(user, asset, asset_b, account)
+        _outputs(user)
+        dates = sorted(LotCheckpoint.objects.filter(owner=user).values_list("as_of", flat=True))
+        assert len(dates) >= 2
+
+        tx = Transaction.objects.get(owner=user, date=dates[-1])
+        tx.quantity = Decimal("1")
+        tx.save()
+
+        remaining = sorted(LotCheckpoint.objects.filter(owner=user).values_list("as_of", flat=True))
+        assert remaining == dates[:-1]
+
+    def test_moving_trade_back_uses_old_and_new_date(self, user, asset, asset_b, account, small_interval):
+        _set_method(user, "FIFO")
+        _history(user, asset, asset_b, account)
+        _outputs(user)
+
+        tx = Transaction.objects.get(owner=user, date=datetime.date(2024, 1, 8))
+        tx.date = datetime.date(2024, 1, 2)
+        tx.save()
+
+        assert not LotCheckpoint.objects.filter(owner=user, as_of__gte=datetime.date(2024, 1, 2)).exists()
+
+    def test_delete_invalidates(self, user, asset, asset_b, account, small_interval, settings):
+        _set_method(user, "FIFO")
+        _history(user, asset, asset_b, account)
+        _outputs(user)
+
+        Transaction.objects.get(owner=user, date=datetime.date(2024, 1, 4)).delete()
+
+        assert not LotCheckpoint.objects.filter(owner=user, as_of__gte=datetime.date(2024, 1, 4)).exists()
+        assert _outputs(user) == _full_replay(user, settings)
+
+    def test_bulk_insert_detected_by_count(self, user, asset, asset_b, account, small_interval, settings):
+        _set_method(user, "FIFO")
+        _history(user, asset, asset_b, account)
+        _outputs(user)
+
+        # bulk_create bypasses model signals; the stored tx_count catches it.
+        Transaction.objects.bulk_create(
+            [
+                Transaction(
+                    owner=user,
+                    asset=asset,
+                    account=account,
+                    type="BUY",
+                    date=datetime.date(2024, 1, 1),
+                    quantity=Decimal("50"),
+                    price=Decimal("1"),
+                )
+            ]
+        )
+
+        assert _outputs(user) == _full_replay(user, settings)
+
+    def test_settings_change_ignores_old_fingerprint(self, user, asset, asset_b, account, small_interval, settings):
+        _set_method(user, "FIFO")
+        _tx(user, asset, account, "GIFT", 0, 10, 10)
+        _tx(user, asset, account, "BUY", 1, 10, 12)
+        _tx(user, asset, account, "SELL", 2, 15, 20)
+        _tx(user, asset, account, "BUY", 3, 1, 20)
+        _outputs(user)
+
+        s = Settings.load(user)
+        s.gift_cost_mode = Settings.GiftCostMode.MARKET
+        s.save()
+
+        result = calculate_realized_pnl_fiscal(user)
+        # 10 gifted @ market 10 + 5 bought @ 12 = 160 cost; proceeds 300
+        assert result["realized_sales"][0]["cost_basis"] == "160.00"
+        assert result["realized_sales"] == _full_replay(user, settings)["realized_sales"]
@@ -0,0 +1,227 @@
+"""
+Tests for the single-pass transaction engine: one read of the transaction
+table feeds every reducer, and each reducer matches the dedicated
+computation it replaces.
+"""
+
+import datetime
+from decimal import Decimal
+
+import pytest
+from django.contrib.auth import get_user_model
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+
+from apps.assets.models import Account, AccountSnapshot, Asset, Settings
+from apps.portfolio.engine import replay
+from apps.portfolio.models import LotCheckpoint
+from apps.portfolio.services import (
+    calculate_portfolio_full,
+    calculate_realized_pnl,
+    calculate_realized_pnl_fiscal,
+    compute_investment_cost_by_month,
+)
+from apps.reports.services import annual_savings
+from apps.transactions.models import Transaction
+
+User = get_user_model()
+
+
+@pytest.fixture
+def user(db):
+    return User.objects.create_user(username="engineuser", password="testpass123")
+
+
+@pytest.fixture
+def account(user):
+    return Account.objects.create(owner=user, name="Broker", type=Account.AccountType.INVERSION)
+
+
+@pytest.fixture
+def asset(user):
+    return Asset.objects.create(owner=user, name="Alpha", ticker="ALP", current_price=Decimal("20.00"))
+
+
+def _set_methods(user, cost_basis, fiscal):
+    s = Settings.load(user)
+    s.cost_basis_method = cost_basis
+    s.fiscal_cost_method = fiscal
+    s.save()
+
+
+def _tx(user, asset, account, tx_type, date, qty, price, commission=0):
+    return Transaction.objects.create(
+        owner=user,
+        asset=asset,
+        account=account,
+        type=tx_type,
+        date=date,
+        quantity=Decimal(str(qty)),
+        price=Decimal(str(price)),
+        commission=Decimal(str(commission)),
+    )
+
+
+@pytest.fixture
+def history(user, asset, account):
+    _tx(user, asset, account, "BUY", datetime.date(2024, 1, 10), 10, 10, commission=2)
+    _tx(user, asset, account, "BUY", datetime.date(2024, 2, 5), 10, 20)
+    _tx(user, asset, account, "SELL", datetime.date(2024, 3, 1), 15, 25, commission=1)
+    _tx(user, asset, account, "GIFT", datetime.date(2024, 3, 20), 2, 30)
+
+
+def _transaction_reads(queries):
+    return [q for q in queries if 'FROM "transactions_transaction"' in q["sql"] and "COUNT(" not in q["sql"]]
+
+
+@pytest.mark.django_db
+class TestReplay:
+    def test_two_methods_share_one_read(self, user, history):
+        _set_methods(user, "FIFO", "LIFO")
+
+        with CaptureQueriesContext(connection) as ctx:
+            engine = replay(user, methods=["FIFO", "LIFO"])
+
+        assert len(_transaction_reads(ctx.captured_queries)) == 1
+        assert set(engine.methods) == {"FIFO", "LIFO"}
+        # FIFO consumes 10 @ 10.20 + 5 @ 20; LIFO consumes 10 @ 20 + 5 @ 10.20
+        assert engine["FIFO"].realized_sales[0].cost_basis == Decimal("202.00")
+        assert engine["LIFO"].realized_sales[0].cost_basis == Decimal("251.00")
+        assert [s.as_dict(engine["LIFO"].asset_map[s.asset_id]) for s in engine["LIFO"].realized_sales] == (
+            calculate_realized_pnl_fiscal(user)["realized_sales"]
+        )
+
+    def test_duplicate_methods_collapse(self, user, history):
+        engine = replay(user, methods=["FIFO", "FIFO"])
+        assert list(engine.methods) == ["FIFO"]
+
+    @pytest.mark.parametrize(
+        ("method", "expected"),
+        [
+            ("FIFO", {"2024-01": "102.00", "2024-02": "302.00", "2024-03": "100.00"}),
+            ("LIFO", {"2024-01": "102.00", "2024-02": "302.00", "2024-03": "51.00"}),
+            ("WAC", {"2024-01": "102.00", "2024-02": "302.00", "2024-03": "75.50"}),
+        ],
+    )
+    def test_cost_by_month(self, user, history, method, expected):
+        _set_methods(user, method, method)
+        result = compute_investment_cost_by_month(user)
+        assert {k: str(v.quantize(Decimal("0.01"))) for k, v in result.items()} == expected
+
+    def test_wac_oversell_keeps_historical_cost_by_month(self, user, asset, account):
+        _set_methods(user, "WAC", "WAC")
+        _tx(user, asset, account, "BUY", datetime.date(2024, 1, 1), 10, 10)
+        _tx(user, asset, account, "SELL", datetime.date(2024, 2, 1), 15, 12)
+
+        # The monthly cost series subtracts avg * full quantity even when oversold.
+        assert compute_investment_cost_by_month(user)["2024-02"] == Decimal("-50")
+        assert calculate_realized_pnl(user)["realized_sales"][0]["cost_basis"] == "100.00"
+
+    def test_flows(self, user, history):
+        engine = replay(user, flows=True)
+        assert engine.flows.by_month == {
+            "2024-01": Decimal("102"),
+            "2024-02": Decimal("302"),
+            "2024-03": Decimal("-72") + Decimal("60"),
+        }
+
+
+@pytest.mark.django_db
+class TestReportsSharePass:
+    def test_annual_savings_reads_transactions_once(self, user, account, asset, history):
+        _set_methods(user, "FIFO", "LIFO")
+        AccountSnapshot.objects.create(owner=user, account=account, date=datetime.date(2024, 1, 31), balance=1000)
+        AccountSnapshot.objects.create(owner=user, account=account, date=datetime.date(2024, 3, 31), balance=1500)
+
+        with CaptureQueriesContext(connection) as ctx:
+            result = annual_savings(user)
+
+        assert len(_transaction_reads(ctx.captured_queries)) == 1
+        assert Decimal(result[0]["investment_cost_end"]) == Decimal("51")
+
+
+@pytest.fixture
+def dca_history(user, asset, account):
+    other = Account.objects.create(owner=user, name="Exchange", type=Account.AccountType.INVERSION)
+    day = datetime.date(2024, 1, 1)
+    for i in range(12):
+        _tx(user, asset, account, "BUY", day + datetime.timedelta(days=i // 3), "0.5", 10 if i < 6 else 11)
+    _tx(user, asset, other, "BUY", datetime.date(2024, 1, 5), "0.5", 11)
+    _tx(user, asset, account, "BUY", datetime.date(2024, 1, 6), 1, 11, commission="0.30")
+    _tx(user, asset, account, "SELL", datetime.date(2024, 1, 7), "3.25", 12)
+    _tx(user, asset, account, "GIFT", datetime.date(2024, 1, 8), "0.1", 12)
+    _tx(user, asset, account, "GIFT", datetime.date(2024, 1, 8), "0.2", 13)
+
+
+@pytest.mark.django_db
+class TestLotCoalescing:
+    @pytest.mark.parametrize("method", ["FIFO", "LIFO"])
+    def test_results_match_uncoalesced(self, user, dca_history, settings, method):
+        _set_methods(user, method, method)
+        settings.PORTFOLIO_COALESCE_LOTS = False
+        reference = calculate_portfolio_full(user), calculate_realized_pnl_fiscal(user)
+
+        settings.PORTFOLIO_COALESCE_LOTS = True
+        assert (calculate_portfolio_full(user), calculate_realized_pnl_fiscal(user)) == reference
+
+    def test_merges_only_same_account_and_unit_cost(self, user, asset, dca_history, settings):
+        settings.PORTFOLIO_COALESCE_LOTS = True
+        lots = replay(user, methods=["FIFO"])["FIFO"].lots[asset.pk]
+
+        # Twelve buys collapse into 3 @ 10 (sold) and 3 @ 11 (0.25 of it sold); the other
+        # account's buy and the buy with a commission stay apart; the two zero-cost gifts merge.
+        assert [(lot.qty, lot.price_per_unit) for lot in lots] == [
+            (Decimal("2.750000"), Decimal("11.000000")),
+            (Decimal("0.500000"), Decimal("11.000000")),
+            (Decimal("1.000000"), Decimal("11.3")),
+            (Decimal("0.300000"), Decimal("0")),
+        ]
+
+    def test_coalesced_state_has_its_own_checkpoints(self, user, dca_history, settings):
+        settings.PORTFOLIO_CHECKPOINT_INTERVAL = 2
+        settings.PORTFOLIO_COALESCE_LOTS = True
+        coalesced = calculate_portfolio_full(user)
+        assert set(LotCheckpoint.objects.filter(owner=user).values_list("fingerprint", flat=True)) == {
+            "v5;coalesce;gift=ZERO;money=2"
+        }
+
+        settings.PORTFOLIO_COALESCE_LOTS = False
+        assert calculate_portfolio_full(user) == coalesced
+        assert LotCheckpoint.objects.filter(owner=user, fingerprint="v5;lots;gift=ZERO;money=2").exists()
+
+
+@pytest.mark.django_db
+class TestAsOf:
+    def test_matches_history_truncated_at_date(self, user, asset, account, history):
+        AccountSnapshot.objects.create(owner=user, account=account, date=datetime.date(2024, 2, 1), balance=500)
+        AccountSnapshot.objects.create(owner=user, account=account, date=datetime.date(2024, 4, 1), balance=900)
+        as_of = datetime.date(2024, 3, 1)
+        past = calculate_portfolio_full(user, as_of=as_of)
+
+        assert past["as_of"] == "2024-03-01"
+        # 5 left @ 20 of the 2024-02-05 buy, valued at the 2024-03-01 sale price.
+        position = past["positions"][0]
+        assert (position["quantity"], position["cost_basis"], position["market_value"]) == (
+            "5.000000",
+            "100.00",
+            "125.00",
+        )
+        assert past["totals"]["total_cash"] == "500.00"
+
+        Transaction.objects.filter(owner=user, date__gt=as_of).delete()
+        truncated = calculate_portfolio_full(user)
+        assert past["totals"]["total_realized_pnl"] == truncated["totals"]["total_realized_pnl"]
+        assert calculate_realized_pnl(user, as_of=as_of) == calculate_realized_pnl(user)
+
+    def test_seeks_from_checkpoint_before_date(self, user, asset, account, settings):
+        settings.PORTFOLIO_CHECKPOINT_INTERVAL = 2
+        for day in range(1, 11):
+            _tx(user, asset, account, "BUY", datetime.date(2024, 1, day), 1, day)
+        calculate_portfolio_full(user)
+
+        with CaptureQueriesContext(connection) as ctx:
+            past = calculate_portfolio_full(user, as_of=datetime.date(2024, 1, 6))
+
+        reads = _transaction_reads(ctx.captured_queries)
+        assert '"transactions_transaction"."date" > ' in reads[0]["sql"]
+        assert past["positions"][0]["cost_basis"] == "21.00"
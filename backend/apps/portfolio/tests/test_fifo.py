@@ -12,7 +12,7 @@ import pytest
 from django.contrib.auth import get_user_model
 
 from apps.assets.models import Account, Asset, Settings
-from apps.portfolio.services import calculate_portfolio, calculate_portfolio_full
+from apps.portfolio.services import calculate_portfolio, calculate_portfolio_full, calculate_realized_pnl
 from apps.transactions.models import Transaction
 
 User = get_user_model()
@@ -175,6 +175,7 @@ class TestBuyThenSellFIFO:
         _make_tx(user, asset, account, "SELL", datetime.date(2025, 3, 1), 10, 25)
 
         result = calculate_portfolio_full(user)
+        sales = calculate_realized_pnl(user)["realized_sales"]
         pos = _pos(result, "TST")
 
         # Remaining: 10 shares from second lot @ 20
@@ -183,8 +184,8 @@ class TestBuyThenSellFIFO:
         assert Decimal(pos["cost_basis"]) == Decimal("200.00")
 
         # Realized: sold 10 @ 25, cost 10 => PnL = 250 - 100 = 150
-        assert len(result["realized_sales"]) == 1
-        sale = result["realized_sales"][0]
+        assert len(sales) == 1
+        sale = sales[0]
         assert Decimal(sale["realized_pnl"]) == Decimal("150.00")
 
 
@@ -198,6 +199,7 @@ class TestBuyThenSellLIFO:
         _make_tx(user, asset, account, "SELL", datetime.date(2025, 3, 1), 10, 25)
 
         result = calculate_portfolio_full(user)
+        sales = calculate_realized_pnl(user)["realized_sales"]
         pos = _pos(result, "TST")
 
         # Remaining: 10 shares from first lot @ 10
@@ -206,8 +208,8 @@ class TestBuyThenSellLIFO:
         assert Decimal(pos["cost_basis"]) == Decimal("100.00")
 
         # Realized: sold 10 @ 25, cost 20 => PnL = 250 - 200 = 50
-        assert len(result["realized_sales"]) == 1
-        sale = result["realized_sales"][0]
+        assert len(sales) == 1
+        sale = sales[0]
         assert Decimal(sale["realized_pnl"]) == Decimal("50.00")
 
 
@@ -269,6 +271,7 @@ class TestWACMethod:
         _make_tx(user, asset, account, "SELL", datetime.date(2025, 3, 1), 5, 25)
 
         result = calculate_portfolio_full(user)
+        sales = calculate_realized_pnl(user)["realized_sales"]
         pos = _pos(result, "TST")
 
         # Remaining: 15 shares, WAC still 15
@@ -276,8 +279,8 @@ class TestWACMethod:
         assert Decimal(pos["avg_cost"]) == Decimal("15.00")
 
         # Realized: sell_total = 5*25 = 125, cost = 75 => PnL = 50
-        assert len(result["realized_sales"]) == 1
-        sale = result["realized_sales"][0]
+        assert len(sales) == 1
+        sale = sales[0]
         assert Decimal(sale["cost_basis"]) == Decimal("75.00")
         assert Decimal(sale["proceeds"]) == Decimal("125.00")
         assert Decimal(sale["realized_pnl"]) == Decimal("50.00")
@@ -290,9 +293,10 @@ class TestRealizedPnL:
         _make_tx(user, asset, account, "SELL", datetime.date(2025, 2, 1), 20, 15)
 
         result = calculate_portfolio_full(user)
+        sales = calculate_realized_pnl(user)["realized_sales"]
         # sell_total = 20*15 = 300, cost = 20*10 = 200 => PnL = 100
         assert Decimal(result["totals"]["total_realized_pnl"]) == Decimal("100.00")
-        assert len(result["realized_sales"]) == 1
+        assert len(sales) == 1
 
     def test_realized_loss(self, user, settings_fifo, asset, account):
         _make_tx(user, asset, account, "BUY", datetime.date(2025, 1, 1), 10, 20)
@@ -358,7 +362,7 @@ class TestCommissionIncluded:
         # Sell 10 @ 20 with commission 10 => sell_total = 200 - 10 = 190
         _make_tx(user, asset, account, "SELL", datetime.date(2025, 2, 1), 10, 20, commission=10)
 
-        result = calculate_portfolio_full(user)
+        result = calculate_realized_pnl(user)
         sale = result["realized_sales"][0]
         # sell_total = 200 - 10 = 190, cost = 100 => PnL = 90
         assert Decimal(sale["proceeds"]) == Decimal("190.00")
@@ -375,13 +379,14 @@ class TestFIFOPartialLotConsumption:
         _make_tx(user, asset, account, "SELL", datetime.date(2025, 3, 1), 5, 25)
 
         result = calculate_portfolio_full(user)
+        sales = calculate_realized_pnl(user)["realized_sales"]
         pos = _pos(result, "TST")
 
         # Remaining: 5 from first lot @ 10 + 10 from second @ 20 = 250
         assert Decimal(pos["quantity"]) == Decimal("15")
         assert Decimal(pos["cost_basis"]) == Decimal("250.00")
 
-        sale = result["realized_sales"][0]
+        sale = sales[0]
         # cost = 5 * 10 = 50, sell = 5 * 25 = 125 => PnL = 75
         assert Decimal(sale["cost_basis"]) == Decimal("50.00")
         assert Decimal(sale["realized_pnl"]) == Decimal("75.00")
@@ -399,23 +404,24 @@ class TestFIFOMultipleSells:
         _make_tx(user, asset, account, "SELL", datetime.date(2025, 4, 1), 5, 30)
 
         result = calculate_portfolio_full(user)
+        sales = calculate_realized_pnl(user)["realized_sales"]
         pos = _pos(result, "TST")
 
         # Remaining: 7 shares from second lot @ 20
         assert Decimal(pos["quantity"]) == Decimal("7")
         assert Decimal(pos["cost_basis"]) == Decimal("140.00")
 
-        assert len(result["realized_sales"]) == 2
+        assert len(sales) == 2
 
         # First sell: 8 @ 25, cost = 8 * 10 = 80 => PnL = 200 - 80 = 120
-        s1 = result["realized_sales"][0]
+        s1 = sales[0]
         assert Decimal(s1["cost_basis"]) == Decimal("80.00")
         assert Decimal(s1["realized_pnl"]) == Decimal("120.00")
 
         # Second sell: 5 @ 30
         # 2 shares from lot1 @ 10 = 20, 3 shares from lot2 @ 20 = 60 => cost = 80
         # sell_total = 150 => PnL = 70
-        s2 = result["realized_sales"][1]
+        s2 = sales[1]
         assert Decimal(s2["cost_basis"]) == Decimal("80.00")
         assert Decimal(s2["realized_pnl"]) == Decimal("70.00")
 
@@ -435,17 +441,18 @@ class TestWACAfterMultipleSells:
         # cost = 5 * 20 = 100, remaining qty=10, remaining cost = 200
 
         result = calculate_portfolio_full(user)
+        sales = calculate_realized_pnl(user)["realized_sales"]
         pos = _pos(result, "TST")
 
         assert Decimal(pos["quantity"]) == Decimal("10")
         assert Decimal(pos["avg_cost"]) == Decimal("20.00")
         assert Decimal(pos["cost_basis"]) == Decimal("200.00")
 
-        assert len(result["realized_sales"]) == 2
+        assert len(sales) == 2
         # First sell: 125 - 100 = 25
-        assert Decimal(result["realized_sales"][0]["realized_pnl"]) == Decimal("25.00")
+        assert Decimal(sales[0]["realized_pnl"]) == Decimal("25.00")
         # Second sell: 175 - 100 = 75
-        assert Decimal(result["realized_sales"][1]["realized_pnl"]) == Decimal("75.00")
+        assert Decimal(sales[1]["realized_pnl"]) == Decimal("75.00")
 
 
 @pytest.mark.django_db
@@ -477,13 +484,14 @@ class TestOversellFIFO:
         _make_tx(user, asset, account, "SELL", datetime.date(2025, 2, 1), 100, 15)
 
         result = calculate_portfolio_full(user)
+        sales = calculate_realized_pnl(user)["realized_sales"]
 
         # Portfolio should have 0 positions (all lots consumed)
         assert len(result["positions"]) == 0
 
         # Realized sale should exist with oversell flagged
-        assert len(result["realized_sales"]) == 1
-        sale = result["realized_sales"][0]
+        assert len(sales) == 1
+        sale = sales[0]
         assert Decimal(sale["oversell_quantity"]) == Decimal("50")
         # Cost basis covers only 50 shares: 50 * 10 = 500
         assert Decimal(sale["cost_basis"]) == Decimal("500.00")
@@ -500,8 +508,9 @@ class TestOversellLIFO:
         _make_tx(user, asset, account, "SELL", datetime.date(2025, 2, 1), 100, 15)
 
         result = calculate_portfolio_full(user)
+        sales = calculate_realized_pnl(user)["realized_sales"]
         assert len(result["positions"]) == 0
-        sale = result["realized_sales"][0]
+        sale = sales[0]
         assert Decimal(sale["oversell_quantity"]) == Decimal("50")
         assert Decimal(sale["cost_basis"]) == Decimal("500.00")
 
@@ -515,8 +524,9 @@ class TestOversellWAC:
         _make_tx(user, asset, account, "SELL", datetime.date(2025, 2, 1), 100, 15)
 
         result = calculate_portfolio_full(user)
+        sales = calculate_realized_pnl(user)["realized_sales"]
         assert len(result["positions"]) == 0
-        sale = result["realized_sales"][0]
+        sale = sales[0]
         assert Decimal(sale["oversell_quantity"]) == Decimal("50")
         # WAC cost basis covers only 50 shares: 50 * 10 = 500
         assert Decimal(sale["cost_basis"]) == Decimal("500.00")
@@ -530,7 +540,7 @@ class TestOversellPartial:
         _make_tx(user, asset, account, "BUY", datetime.date(2025, 1, 1), 50, 10)
         _make_tx(user, asset, account, "SELL", datetime.date(2025, 2, 1), 70, 15)
 
-        result = calculate_portfolio_full(user)
+        result = calculate_realized_pnl(user)
         sale = result["realized_sales"][0]
         assert Decimal(sale["oversell_quantity"]) == Decimal("20")
         assert Decimal(sale["cost_basis"]) == Decimal("500.00")  # 50 * 10
@@ -545,6 +555,6 @@ class TestNoOversell:
         _make_tx(user, asset, account, "BUY", datetime.date(2025, 1, 1), 100, 10)
         _make_tx(user, asset, account, "SELL", datetime.date(2025, 2, 1), 50, 15)
 
-        result = calculate_portfolio_full(user)
+        result = calculate_realized_pnl(user)
         sale = result["realized_sales"][0]
         assert Decimal(sale["oversell_quantity"]) == Decimal("0")
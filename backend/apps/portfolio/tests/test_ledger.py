@@ -0,0 +1,172 @@
+"""
+Tests for the persisted realized-gain ledger: its rows must match the
+engine's sales and stay correct as transactions change.
+"""
+
+import datetime
+from decimal import Decimal
+
+import pytest
+from django.contrib.auth import get_user_model
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+
+from apps.assets.models import Account, Asset, Settings
+from apps.portfolio.ledger import realized_pnl_by_year, sync_ledger
+from apps.portfolio.models import RealizedLotMatch, RealizedSale
+from apps.portfolio.services import calculate_realized_pnl_fiscal, fiscal_realized_sales
+from apps.transactions.models import Transaction
+
+User = get_user_model()
+
+
+@pytest.fixture
+def user(db):
+    return User.objects.create_user(username="ledgeruser", password="testpass123")
+
+
+@pytest.fixture
+def account(user):
+    return Account.objects.create(owner=user, name="Broker", type=Account.AccountType.INVERSION)
+
+
+@pytest.fixture
+def asset(user):
+    return Asset.objects.create(owner=user, name="Alpha", ticker="ALP", current_price=Decimal("20.00"))
+
+
+def _tx(user, asset, account, tx_type, date, qty, price, commission=0):
+    return Transaction.objects.create(
+        owner=user,
+        asset=asset,
+        account=account,
+        type=tx_type,
+        date=date,
+        quantity=Decimal(str(qty)),
+        price=Decimal(str(price)),
+        commission=Decimal(str(commission)),
+    )
+
+
+@pytest.fixture
+def history(user, asset, account):
+    first = _tx(user, asset, account, "BUY", datetime.date(2023, 1, 10), 10, 10, commission=2)
+    second = _tx(user, asset, account, "BUY", datetime.date(2023, 2, 5), 10, 20)
+    _tx(user, asset, account, "SELL", datetime.date(2023, 6, 1), 15, 25, commission=1)
+    _tx(user, asset, account, "GIFT", datetime.date(2024, 1, 20), 2, 30)
+    _tx(user, asset, account, "SELL", datetime.date(2024, 3, 1), 4, 30)
+    return first, second
+
+
+def _set_fiscal(user, method, **fields):
+    s = Settings.load(user)
+    s.fiscal_cost_method = method
+    for name, value in fields.items():
+        setattr(s, name, value)
+    s.save()
+
+
+def _sales_by_year(user):
+    totals = {}
+    for sale in calculate_realized_pnl_fiscal(user)["realized_sales"]:
+        year = int(sale["date"][:4])
+        totals[year] = totals.get(year, Decimal("0")) + Decimal(sale["realized_pnl"])
+    return totals
+
+
+def _transaction_reads(queries):
+    return [q for q in queries if 'FROM "transactions_transaction"' in q["sql"] and "COUNT(" not in q["sql"]]
+
+
+@pytest.mark.django_db
+class TestLedger:
+    def test_records_lot_matches(self, user, history):
+        first, second = history
+        sync_ledger(user, "FIFO")
+
+        sale = RealizedSale.objects.get(owner=user, method="FIFO", date=datetime.date(2023, 6, 1))
+        assert (sale.cost_basis, sale.proceeds, sale.realized_pnl) == (Decimal("202"), Decimal("374"), Decimal("172"))
+        matches = [(m.source_id, m.quantity, m.cost) for m in sale.matches.order_by("id")]
+        assert matches == [(first.pk, Decimal("10"), Decimal("102")), (second.pk, Decimal("5"), Decimal("100"))]
+
+    def test_matches_name_every_lot_when_coalescing(self, user, asset, account, settings):
+        settings.PORTFOLIO_COALESCE_LOTS = True
+        first = _tx(user, asset, account, "BUY", datetime.date(2023, 1, 10), 5, 10)
+        second = _tx(user, asset, account, "BUY", datetime.date(2023, 1, 11), 5, 10)
+        _tx(user, asset, account, "SELL", datetime.date(2023, 2, 1), 8, 12)
+        sync_ledger(user, "FIFO")
+
+        matches = RealizedLotMatch.objects.order_by("id").values_list("source_id", "quantity", "cost")
+        assert list(matches) == [(first.pk, Decimal("5"), Decimal("50")), (second.pk, Decimal("3"), Decimal("30"))]
+
+    def test_wac_sales_have_no_lot_matches(self, user, history):
+        sync_ledger(user, "WAC")
+        assert RealizedSale.objects.filter(owner=user, method="WAC").count() == 2
+        assert not RealizedSale.objects.filter(owner=user, method="WAC", matches__isnull=False).exists()
+
+    @pytest.mark.parametrize("method", ["FIFO", "LIFO", "WAC"])
+    def test_matches_engine(self, user, history, method):
+        _set_fiscal(user, method)
+        assert realized_pnl_by_year(user, method) == _sales_by_year(user)
+        assert fiscal_realized_sales(user, 2024) == [
+            s for s in calculate_realized_pnl_fiscal(user)["realized_sales"] if s["date"].startswith("2024")
+        ]
+
+    def test_up_to_date_ledger_needs_no_replay(self, user, history):
+        sync_ledger(user, "FIFO")
+        with CaptureQueriesContext(connection) as ctx:
+            realized_pnl_by_year(user, "FIFO")
+        assert _transaction_reads(ctx.captured_queries) == []
+
+    def test_edit_rebuilds_from_edited_date(self, user, asset, account, history):
+        first, _ = history
+        sync_ledger(user, "FIFO")
+        kept = RealizedSale.objects.get(owner=user, method="FIFO", date=datetime.date(2023, 6, 1))
+
+        _tx(user, asset, account, "BUY", datetime.date(2024, 2, 1), 1, 1)
+        assert realized_pnl_by_year(user, "FIFO") == _sales_by_year(user)
+        # The 2023 sale predates the new buy and is kept as is.
+        assert RealizedSale.objects.get(pk=kept.pk).sequence == 0
+
+        first.price = Decimal("5")
+        first.save()
+        assert not RealizedSale.objects.filter(pk=kept.pk).exists()
+        assert realized_pnl_by_year(user, "FIFO") == _sales_by_year(user)
+
+    def test_settings_change_rebuilds(self, user, history):
+        # LIFO sells the 2024 gift, so its cost depends on the gift cost mode.
+        _set_fiscal(user, "LIFO")
+        before = realized_pnl_by_year(user, "LIFO")
+        _set_fiscal(user, "LIFO", gift_cost_mode=Settings.GiftCostMode.MARKET)
+        after = realized_pnl_by_year(user, "LIFO")
+        assert after == _sales_by_year(user)
+        assert after[2024] != before[2024]
+
+    def test_bulk_writes_are_detected(self, user, asset, account, history):
+        sync_ledger(user, "FIFO")
+        Transaction.objects.bulk_create(
+            [
+                Transaction(
+                    owner=user,
+                    asset=asset,
+                    account=account,
+                    type="SELL",
+                    date=datetime.date(2023, 3, 1),
+                    quantity=Decimal("1"),
+                    price=Decimal("30"),
+                )
+            ]
+        )
+        assert realized_pnl_by_year(user, "FIFO") == _sales_by_year(user)
+        assert RealizedSale.objects.filter(owner=user, method="FIFO").count() == 3
+
+    def test_bulk_update_of_a_buy_is_detected(self, user, history):
+        first, _ = history
+        sync_ledger(user, "FIFO")
+        # QuerySet.update bypasses the signals that trim the ledger, and changes no sale.
+        Transaction.objects.filter(pk=first.pk).update(price=Decimal("5"))
+
+        assert realized_pnl_by_year(user, "FIFO") == _sales_by_year(user)
+        sale = RealizedSale.objects.get(owner=user, method="FIFO", date=datetime.date(2023, 6, 1))
+        # 10 @ 5.20 (commission included) + 5 @ 20.
+        assert sale.cost_basis == Decimal("152")
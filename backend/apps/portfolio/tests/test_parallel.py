@@ -0,0 +1,133 @@
+"""
+Tests for the per-asset parallel replay: splitting the history by asset
+across worker processes must give exactly what a sequential replay gives.
+"""
+
+import datetime
+import random
+from decimal import Decimal
+
+import pytest
+from django.contrib.auth import get_user_model
+
+from apps.assets.models import Account, Asset, Settings
+from apps.portfolio.engine import replay
+from apps.portfolio.ledger import sync_ledger
+from apps.portfolio.models import LotCheckpoint, RealizedLotMatch, RealizedSale
+from apps.portfolio.parallel import parallel_replays, worker_count
+from apps.transactions.models import Transaction
+
+User = get_user_model()
+
+
+@pytest.fixture
+def user(db):
+    return User.objects.create_user(username="paralleluser", password="testpass123")
+
+
+@pytest.fixture
+def history(user):
+    rnd = random.Random(7)
+    accounts = [Account.objects.create(owner=user, name=f"Broker {i}") for i in range(2)]
+    assets = [
+        Asset.objects.create(owner=user, name=f"Asset {i}", ticker=f"AS{i}", current_price=Decimal("50"))
+        for i in range(5)
+    ]
+    day = datetime.date(2023, 1, 1)
+    rows = []
+    for _ in range(120):
+        day += datetime.timedelta(days=rnd.choice((0, 1, 3)))
+        rows.append(
+            Transaction(
+                owner=user,
+                asset=rnd.choice(assets),
+                account=rnd.choice(accounts),
+                type=rnd.choice(("BUY", "BUY", "BUY", "GIFT", "SELL", "SELL")),
+                date=day,
+                quantity=Decimal(rnd.randint(1, 30_000)) / Decimal(1000),
+                price=Decimal(rnd.randint(1, 900_000)) / Decimal(1000),
+                commission=Decimal(rnd.randint(0, 300)) / Decimal(100),
+            )
+        )
+    Transaction.objects.bulk_create(rows)
+
+
+def _replay(user, method, **kwargs):
+    return replay(user, methods=[method], **kwargs)[method]
+
+
+def _state(reducer):
+    lots = {aid: [(lot.qty, lot.price_per_unit, lot.account_id) for lot in lots] for aid, lots in reducer.lots.items()}
+    sales = [sale.as_dict(reducer.asset_map[sale.asset_id]) for sale in reducer.realized_sales]
+    return list(lots.items()), sales, reducer.realized_pnl, reducer.cost_by_month, list(reducer.asset_map)
+
+
+@pytest.fixture
+def parallel(settings):
+    def enable():
+        settings.PORTFOLIO_PARALLEL_THRESHOLD = 1
+        settings.PORTFOLIO_PARALLEL_WORKERS = 3
+
+    settings.PORTFOLIO_PARALLEL_THRESHOLD = 0
+    with parallel_replays():
+        yield enable
+
+
+@pytest.mark.django_db
+class TestParallelReplay:
+    @pytest.mark.parametrize("method", ["FIFO", "LIFO", "WAC"])
+    def test_matches_sequential(self, user, history, settings, parallel, method):
+        settings.PORTFOLIO_CHECKPOINT_INTERVAL = 0
+        sequential = _state(_replay(user, method))
+        parallel()
+        assert _state(_replay(user, method)) == sequential
+
+    def test_resumes_from_checkpoint(self, user, history, settings, parallel):
+        settings.PORTFOLIO_CHECKPOINT_INTERVAL = 0
+        sequential = _state(_replay(user, "FIFO"))
+
+        # A sequential replay up to mid-history leaves checkpoints for the parallel one to resume from.
+        settings.PORTFOLIO_CHECKPOINT_INTERVAL = 20
+        midpoint = Transaction.objects.filter(owner=user).order_by("date")[60].date
+        _replay(user, "FIFO", as_of=midpoint)
+        resumed = LotCheckpoint.objects.filter(owner=user).latest("as_of")
+
+        parallel()
+        reducer = _replay(user, "FIFO")
+        assert reducer.resume_after == resumed.as_of
+        # The resumed reducer holds only the sales after the checkpoint, but the totals of all of them.
+        lots, sales, *totals = sequential
+        assert _state(reducer) == (lots, sales[reducer.sales_before :], *totals)
+        # It checkpoints once, after its last transaction.
+        newest = LotCheckpoint.objects.filter(owner=user).latest("as_of")
+        last = Transaction.objects.filter(owner=user).latest("date").date
+        assert (newest.as_of, newest.tx_count) == (last, Transaction.objects.filter(owner=user).count())
+        assert LotCheckpoint.objects.filter(owner=user, as_of__gt=resumed.as_of).count() == 1
+
+    def test_ledger_matches_sequential(self, user, history, settings, parallel):
+        Settings.load(user)
+        sync_ledger(user, "LIFO")
+        sequential = list(RealizedLotMatch.objects.values_list("sale__transaction_id", "source_id", "quantity", "cost"))
+        RealizedSale.objects.all().delete()
+        parallel()
+        sync_ledger(user, "LIFO")
+        assert list(RealizedLotMatch.objects.values_list("sale__transaction_id", "source_id", "quantity", "cost")) == (
+            sequential
+        )
+
+
+def test_worker_count(settings):
+    settings.PORTFOLIO_PARALLEL_THRESHOLD = 100
+    settings.PORTFOLIO_PARALLEL_WORKERS = 4
+    with parallel_replays():
+        assert worker_count(99) == 1
+        assert worker_count(100) == 4
+        settings.PORTFOLIO_PARALLEL_THRESHOLD = 0
+        assert worker_count(10**6) == 1
+
+
+def test_worker_count_outside_tasks_and_commands(settings):
+    # A web request never enters parallel_replays(), so it always replays sequentially.
+    settings.PORTFOLIO_PARALLEL_THRESHOLD = 100
+    settings.PORTFOLIO_PARALLEL_WORKERS = 4
+    assert worker_count(10**6) == 1
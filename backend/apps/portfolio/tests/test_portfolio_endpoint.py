@@ -125,6 +125,66 @@ class TestPortfolio:
         assert "totals" in data
         assert "total_market_value" in data["totals"]
 
+    def test_as_of(self, client, transaction):
+        resp = client.get("/api/portfolio/", {"as_of": "2024-12-31"})
+        assert resp.status_code == 200
+        assert resp.data["as_of"] == "2024-12-31"
+        assert resp.data["positions"] == []
+
+        resp = client.get("/api/portfolio/", {"as_of": "2025-01-15"})
+        assert resp.data["positions"][0]["quantity"] == "10.000000"
+
+    def test_as_of_invalid(self, client):
+        resp = client.get("/api/portfolio/", {"as_of": "31/12/2024"})
+        assert resp.status_code == 400
+
+    def test_payload_leaves_out_realized_sales(self, client, transaction):
+        resp = client.get("/api/portfolio/")
+        assert "realized_sales" not in resp.data
+        assert "total_realized_pnl" in resp.data["totals"]
+
+
+@pytest.mark.django_db
+class TestRealizedSales:
+    @pytest.fixture
+    def sales(self, user, asset, account, transaction):
+        other = Asset.objects.create(name="Other", ticker="OTH", current_price=Decimal("5"), owner=user)
+        for date, sold, qty in (("2025-02-01", asset, "2"), ("2025-03-01", other, "1"), ("2026-01-10", asset, "3")):
+            if sold is other:
+                Transaction.objects.create(
+                    date="2025-01-20", type="BUY", asset=other, account=account, quantity=1, price=4, owner=user
+                )
+            Transaction.objects.create(
+                date=date, type="SELL", asset=sold, account=account, quantity=Decimal(qty), price=12, owner=user
+            )
+        return other
+
+    def test_list_newest_first_with_lot_matches(self, client, transaction, sales):
+        resp = client.get("/api/portfolio/realized-sales/")
+        assert resp.status_code == 200
+        assert [s["date"] for s in resp.data["results"]] == ["2026-01-10", "2025-03-01", "2025-02-01"]
+        oldest = resp.data["results"][-1]
+        # 2 of the 10 @ 10 + 1.00 commission buy
+        assert (oldest["cost_basis"], oldest["proceeds"], oldest["realized_pnl"]) == ("20.20", "24.00", "3.80")
+        assert [(m["source"], m["cost"]) for m in oldest["matches"]] == [(transaction.pk, "20.20")]
+
+    def test_filters(self, client, asset, sales):
+        by_year = client.get("/api/portfolio/realized-sales/", {"year": 2025}).data["results"]
+        assert [s["date"] for s in by_year] == ["2025-03-01", "2025-02-01"]
+        by_asset = client.get("/api/portfolio/realized-sales/", {"asset_id": str(sales.pk)}).data["results"]
+        assert [s["asset_ticker"] for s in by_asset] == ["OTH"]
+        by_range = client.get(
+            "/api/portfolio/realized-sales/", {"from_date": "2025-02-15", "to_date": "2025-12-31"}
+        ).data["results"]
+        assert [s["date"] for s in by_range] == ["2025-03-01"]
+
+    def test_cursor_pagination(self, client, sales):
+        first = client.get("/api/portfolio/realized-sales/", {"page_size": 2}).data
+        assert len(first["results"]) == 2
+        second = client.get(first["next"]).data
+        assert [s["date"] for s in second["results"]] == ["2025-02-01"]
+        assert second["next"] is None
+
 
 # ---------------------------------------------------------------------------
 # Assets CRUD
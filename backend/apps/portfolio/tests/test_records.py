@@ -0,0 +1,87 @@
+"""
+Tests for the engine's compact records: the sale ledger must give back exactly
+the Decimals (and therefore the strings) it was handed.
+"""
+
+import datetime
+import uuid
+from decimal import Decimal
+from io import StringIO
+
+import pytest
+from django.core.management import call_command
+
+from apps.portfolio.records import SaleLedger
+
+ASSET = uuid.uuid4()
+
+
+def _row(**overrides):
+    row = {
+        "asset_id": ASSET,
+        "date": datetime.date(2024, 5, 17),
+        "quantity": Decimal("3.500000"),
+        "sell_price": Decimal("12.35"),
+        "cost_basis": Decimal("30.10"),
+        "proceeds": Decimal("42.22"),
+        "realized_pnl": Decimal("12.12"),
+        "oversell": Decimal("0.000000"),
+    }
+    row.update(overrides)
+    return row
+
+
+def _roundtrip(money_digits=2, **overrides):
+    ledger = SaleLedger(money_digits)
+    row = _row(**overrides)
+    ledger.append(**row)
+    sale = ledger[0]
+    return row, sale
+
+
+class TestSaleLedger:
+    def test_roundtrip_preserves_values_and_spelling(self):
+        row, sale = _roundtrip()
+        assert sale.asset_id == ASSET
+        assert sale.date == row["date"]
+        for field in ("quantity", "sell_price", "cost_basis", "proceeds", "realized_pnl"):
+            assert str(getattr(sale, field)) == str(row[field])
+        assert str(sale.oversell_quantity) == "0.000000"
+
+    def test_negative_zero_survives(self):
+        _, sale = _roundtrip(proceeds=Decimal("-0.00"), realized_pnl=Decimal("-0.00"), cost_basis=Decimal("0.00"))
+        assert str(sale.proceeds) == "-0.00"
+        assert str(sale.realized_pnl) == "-0.00"
+
+    def test_bare_zero_oversell(self):
+        _, sale = _roundtrip(oversell=Decimal("0"))
+        assert str(sale.oversell_quantity) == "0"
+
+    def test_zero_money_digits(self):
+        _, sale = _roundtrip(
+            money_digits=0,
+            sell_price=Decimal("12"),
+            cost_basis=Decimal("30"),
+            proceeds=Decimal("42"),
+            realized_pnl=Decimal("12"),
+        )
+        assert (str(sale.sell_price), str(sale.realized_pnl)) == ("12", "12")
+
+    def test_values_beyond_int64_fall_back_to_lists(self):
+        ledger = SaleLedger(2)
+        ledger.append(**_row())
+        huge = Decimal("123456789012345678.90")
+        ledger.append(**_row(proceeds=huge, realized_pnl=huge))
+        assert len(ledger) == 2
+        assert ledger[1].proceeds == huge
+        assert ledger[0].proceeds == Decimal("42.22")
+        assert ledger.total_pnl() == huge + Decimal("12.12")
+
+
+@pytest.mark.django_db
+def test_memory_benchmark_command_reports_reduction():
+    out = StringIO()
+    call_command("benchmark_engine_memory", "--transactions", "300", stdout=out)
+    lines = out.getvalue().splitlines()
+    assert [line.split(":")[0] for line in lines] == ["FIFO", "LIFO", "WAC"]
+    assert all("% less" in line for line in lines)
@@ -4,4 +4,5 @@ from . import views
 
 urlpatterns = [
     path("portfolio/", views.PortfolioView.as_view(), name="portfolio"),
+    path("portfolio/realized-sales/", views.RealizedSaleListView.as_view(), name="portfolio-realized-sales"),
 ]
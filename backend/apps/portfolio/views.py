@@ -1,17 +1,68 @@
+import datetime
+from decimal import Decimal
+
+from django.db.models import Prefetch
+from django.utils import timezone
+from django_filters.rest_framework import DjangoFilterBackend
+from rest_framework import generics
+from rest_framework.pagination import CursorPagination
 from rest_framework.response import Response
 from rest_framework.views import APIView
 
-from apps.core.cache import NS_PORTFOLIO, get_user_cache, set_user_cache
+from apps.assets.models import Settings
+from apps.core.cache import NS_PORTFOLIO
+from apps.core.mixins import CachedComputationMixin
 
+from .filters import RealizedSaleFilter
+from .ledger import sync_ledger
+from .models import RealizedLotMatch, RealizedSale
+from .serializers import RealizedSaleSerializer
 from .services import calculate_portfolio_full
 
 
-class PortfolioView(APIView):
+class PortfolioView(CachedComputationMixin, APIView):
+    cache_namespace = NS_PORTFOLIO
+
     def get(self, request):
-        cached = get_user_cache(request.user.pk, NS_PORTFOLIO)
-        if cached is not None:
-            return Response(cached)
+        as_of_param = request.query_params.get("as_of")
+        if as_of_param:
+            try:
+                as_of = datetime.date.fromisoformat(as_of_param)
+            except ValueError:
+                return Response({"detail": "as_of must be a date (YYYY-MM-DD)"}, status=400)
+            # Today or later is just the live portfolio.
+            if as_of < timezone.localdate():
+                return Response(calculate_portfolio_full(request.user, as_of=as_of))
+
+        return self.cached_response(request)
+
+
+class RealizedSaleCursorPagination(CursorPagination):
+    ordering = "-sequence"
+    page_size = 50
+    page_size_query_param = "page_size"
+    max_page_size = 500
+
+
+class RealizedSaleListView(generics.ListAPIView):
+    """Realized sales under the user's cost-basis method, newest first, from the realized-gain ledger."""
+
+    serializer_class = RealizedSaleSerializer
+    filter_backends = [DjangoFilterBackend]
+    filterset_class = RealizedSaleFilter
+    pagination_class = RealizedSaleCursorPagination
+
+    def get_queryset(self):
+        settings = Settings.snapshot(self.request.user)
+        sync_ledger(self.request.user, settings.cost_basis_method, settings)
+        return (
+            RealizedSale.objects.filter(owner=self.request.user, method=settings.cost_basis_method)
+            .select_related("asset")
+            .prefetch_related(Prefetch("matches", RealizedLotMatch.objects.select_related("source").order_by("id")))
+        )
 
-        data = calculate_portfolio_full(request.user)
-        set_user_cache(request.user.pk, NS_PORTFOLIO, data, timeout=60)
-        return Response(data)
+    def get_serializer_context(self):
+        context = super().get_serializer_context()
+        settings = Settings.snapshot(self.request.user)
+        context["money_exp"] = Decimal(10) ** -settings.rounding_money
+        return context
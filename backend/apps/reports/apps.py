@@ -1,6 +1,29 @@
 from django.apps import AppConfig
 
+_REPORT_TTL = 120  # 2 minutes
+
 
 class ReportsConfig(AppConfig):
     default_auto_field = "django.db.models.BigAutoField"
     name = "apps.reports"
+
+    def ready(self):
+        from apps.core.cache import (
+            NS_REPORTS_ANNUAL_SAVINGS,
+            NS_REPORTS_PATRIMONIO,
+            NS_REPORTS_RV,
+            NS_REPORTS_SAVINGS,
+            NS_REPORTS_YEAR,
+            register_user_computation,
+        )
+
+        from .services import annual_savings, monthly_savings, patrimonio_evolution, rv_evolution, year_summary
+
+        for namespace, compute in (
+            (NS_REPORTS_YEAR, year_summary),
+            (NS_REPORTS_PATRIMONIO, patrimonio_evolution),
+            (NS_REPORTS_RV, rv_evolution),
+            (NS_REPORTS_SAVINGS, monthly_savings),
+            (NS_REPORTS_ANNUAL_SAVINGS, annual_savings),
+        ):
+            register_user_computation(namespace, compute, timeout=_REPORT_TTL)
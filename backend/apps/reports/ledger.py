@@ -0,0 +1,173 @@
+"""Per-user monthly cash and investment-cost ledger.
+
+Each :class:`~apps.reports.models.MonthlyLedger` row holds the state at the
+end of a month in which the user has an account snapshot or a transaction:
+the cash (every account's latest balance, summed), the cost of the open lots
+under the fiscal cost method and the net amount invested. The savings and
+patrimonio reports read it with one indexed range scan instead of re-summing
+every account on every snapshot and replaying the transaction history.
+
+The ledger is maintained like the realized-gain ledger
+(``apps.portfolio.ledger``): snapshot and transaction writes delete the rows
+from the edited month on (see the receivers in ``apps.reports.models``), and
+:func:`sync_monthly_ledger` appends the missing months, starting from the
+last row kept. Each row counts the snapshots and transactions dated up to its
+month, which catches writes that bypass model signals.
+"""
+
+import datetime
+import logging
+from collections import Counter
+from decimal import ROUND_HALF_UP, Decimal
+
+from django.db import IntegrityError, transaction
+from django.db.models import Count, OuterRef, Subquery
+from django.db.models.functions import TruncMonth
+
+from apps.assets.models import Account, AccountSnapshot, Settings
+from apps.core.context import memoized
+from apps.portfolio.engine import replay
+from apps.portfolio.ledger import ledger_fingerprint as lots_fingerprint
+from apps.transactions.models import Transaction
+
+from .models import MonthlyLedger
+
+logger = logging.getLogger(__name__)
+
+_COST_EXP = Decimal(10) ** -MonthlyLedger._meta.get_field("investment_cost_end").decimal_places
+
+
+def ledger_fingerprint(settings):
+    """Identify the user settings that change the stored investment cost."""
+    return f"{settings.fiscal_cost_method};{lots_fingerprint(settings)}"
+
+
+def _month_end(month):
+    return (month + datetime.timedelta(days=32)).replace(day=1) - datetime.timedelta(days=1)
+
+
+def _month(key):
+    return datetime.date.fromisoformat(f"{key}-01")
+
+
+def sync_monthly_ledger(user, settings=None, engine=None):
+    """Bring the monthly ledger of ``user`` up to date.
+
+    Pass an ``engine`` result that already replayed the fiscal method with
+    flows to reuse it if months are missing.
+    """
+    if settings is None:
+        settings = engine.settings if engine is not None else Settings.snapshot(user)
+    fingerprint = ledger_fingerprint(settings)
+    rows = MonthlyLedger.objects.filter(owner=user)
+    rows.exclude(fingerprint=fingerprint).delete()
+
+    snapshots = AccountSnapshot.objects.filter(owner=user)
+    transactions = Transaction.objects.filter(owner=user)
+    last = rows.order_by("-month").first()
+    recorded = (last.snapshot_count, last.transaction_count) if last is not None else (0, 0)
+    if (snapshots.count(), transactions.count()) == recorded:
+        return
+
+    if last is not None:
+        end = _month_end(last.month)
+        if (snapshots.filter(date__lte=end).count(), transactions.filter(date__lte=end).count()) != recorded:
+            logger.warning("Monthly ledger for user %s is out of step with its history; rebuilding", user.pk)
+            rows.delete()
+            last = None
+
+    _extend(user, settings, fingerprint, engine, last)
+
+
+def _extend(user, settings, fingerprint, engine, last):
+    """Write a row for every month after ``last`` (a row, or None for the whole history)."""
+    snapshots = AccountSnapshot.objects.filter(owner=user)
+    transactions = Transaction.objects.filter(owner=user)
+    balances = {}
+    if last is not None:
+        end = _month_end(last.month)
+        snapshots = snapshots.filter(date__gt=end)
+        transactions = transactions.filter(date__gt=end)
+        last_balance = (
+            AccountSnapshot.objects.filter(account=OuterRef("pk"), date__lte=end)
+            .order_by("-date")
+            .values("balance")[:1]
+        )
+        accounts = Account.objects.filter(owner=user).annotate(balance_as_of=Subquery(last_balance))
+        balances = {pk: balance for pk, balance in accounts.values_list("pk", "balance_as_of") if balance is not None}
+
+    # Each snapshot replaces its account's balance, so the total moves by the difference.
+    cash = last.cash_end if last is not None else Decimal("0")
+    cash_by_month = {}
+    snapshot_counts = Counter()
+    for account_id, date, balance in snapshots.order_by("date").values_list("account_id", "date", "balance"):
+        cash += balance - balances.get(account_id, Decimal("0"))
+        balances[account_id] = balance
+        month = date.replace(day=1)
+        cash_by_month[month] = cash
+        snapshot_counts[month] += 1
+
+    transaction_counts = dict(
+        transactions.order_by()
+        .annotate(month=TruncMonth("date"))
+        .values("month")
+        .annotate(count=Count("id"))
+        .values_list("month", "count")
+    )
+
+    method = settings.fiscal_cost_method
+    if engine is None or engine.flows is None or method not in engine.methods:
+        engine = replay(user, methods=[method], flows=True, settings=settings)
+    after = last.month if last is not None else datetime.date.min
+    cost_by_month = {_month(key): cost for key, cost in engine[method].cost_by_month.items()}
+    flow_by_month = {_month(key): flow for key, flow in engine.flows.by_month.items()}
+
+    months = sorted(m for m in {*cash_by_month, *transaction_counts, *cost_by_month, *flow_by_month} if m > after)
+    if last is not None:
+        cash, cost, flow = last.cash_end, last.investment_cost_end, last.investment_flow_end
+        snapshot_count, transaction_count = last.snapshot_count, last.transaction_count
+    else:
+        cash = cost = flow = Decimal("0")
+        snapshot_count = transaction_count = 0
+
+    new_rows = []
+    for month in months:
+        cash = cash_by_month.get(month, cash)
+        cost = cost_by_month.get(month, cost)
+        flow = flow_by_month.get(month, flow)
+        snapshot_count += snapshot_counts[month]
+        transaction_count += transaction_counts.get(month, 0)
+        new_rows.append(
+            MonthlyLedger(
+                owner=user,
+                month=month,
+                fingerprint=fingerprint,
+                has_snapshot=month in cash_by_month,
+                cash_end=cash,
+                investment_cost_end=Decimal(cost).quantize(_COST_EXP, rounding=ROUND_HALF_UP),
+                investment_flow_end=Decimal(flow).quantize(_COST_EXP, rounding=ROUND_HALF_UP),
+                snapshot_count=snapshot_count,
+                transaction_count=transaction_count,
+            )
+        )
+
+    try:
+        with transaction.atomic():
+            MonthlyLedger.objects.bulk_create(new_rows)
+    except IntegrityError:
+        # A concurrent sync wrote the same months first; theirs are as good as ours.
+        logger.info("Monthly ledger for user %s already written", user.pk)
+
+
+def monthly_rows(user, settings=None, engine=None):
+    """The user's ledger rows in month order, brought up to date first.
+
+    Memoized per request or task, where the savings and patrimonio reports
+    (and annual savings, which reads both) share them.
+    """
+
+    def load():
+        sync_monthly_ledger(user, settings, engine)
+        return list(MonthlyLedger.objects.filter(owner=user).order_by("month"))
+
+    return memoized((user.pk, "reports:monthly_ledger"), load)
@@ -0,0 +1,69 @@
+# Generated by Django 6.0.9 on 2026-10-17 09:17
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("reports", "0002_replace_current_amount_with_base_type"),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="MonthlyLedger",
+            fields=[
+                ("id", models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name="ID")),
+                ("month", models.DateField(help_text="First day of the month.")),
+                ("fingerprint", models.CharField(max_length=64)),
+                (
+                    "has_snapshot",
+                    models.BooleanField(default=False, help_text="An account snapshot is dated in this month."),
+                ),
+                (
+                    "cash_end",
+                    models.DecimalField(
+                        decimal_places=2, help_text="Sum of every account's latest balance.", max_digits=20
+                    ),
+                ),
+                (
+                    "investment_cost_end",
+                    models.DecimalField(
+                        decimal_places=6, help_text="Cost of the open lots under the fiscal cost method.", max_digits=24
+                    ),
+                ),
+                (
+                    "investment_flow_end",
+                    models.DecimalField(
+                        decimal_places=6,
+                        help_text="Net amount invested: purchases and gifts less sale proceeds.",
+                        max_digits=24,
+                    ),
+                ),
+                (
+                    "snapshot_count",
+                    models.PositiveIntegerField(help_text="Account snapshots dated up to the end of the month."),
+                ),
+                (
+                    "transaction_count",
+                    models.PositiveIntegerField(help_text="Transactions dated up to the end of the month."),
+                ),
+                (
+                    "owner",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="reports_monthlyledger_set",
+                        to=settings.AUTH_USER_MODEL,
+                    ),
+                ),
+            ],
+            options={
+                "ordering": ["month"],
+                "constraints": [
+                    models.UniqueConstraint(fields=("owner", "month"), name="unique_monthlyledger_owner_month")
+                ],
+            },
+        ),
+    ]
@@ -0,0 +1,46 @@
+# Generated by Django 6.0.9 on 2026-10-17 09:24
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("reports", "0003_monthly_ledger"),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="YearlyIncome",
+            fields=[
+                ("id", models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name="ID")),
+                ("year", models.PositiveSmallIntegerField()),
+                ("dividend_count", models.PositiveIntegerField(default=0)),
+                ("dividends_gross", models.DecimalField(decimal_places=2, default=0, max_digits=20)),
+                ("dividends_tax", models.DecimalField(decimal_places=2, default=0, max_digits=20)),
+                ("dividends_net", models.DecimalField(decimal_places=2, default=0, max_digits=20)),
+                ("interest_count", models.PositiveIntegerField(default=0)),
+                ("interests_gross", models.DecimalField(decimal_places=2, default=0, max_digits=20)),
+                ("interests_net", models.DecimalField(decimal_places=2, default=0, max_digits=20)),
+                ("payroll_count", models.PositiveIntegerField(default=0)),
+                ("payroll_gross", models.DecimalField(decimal_places=2, default=0, max_digits=20)),
+                ("payroll_net", models.DecimalField(decimal_places=2, default=0, max_digits=20)),
+                (
+                    "owner",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="reports_yearlyincome_set",
+                        to=settings.AUTH_USER_MODEL,
+                    ),
+                ),
+            ],
+            options={
+                "ordering": ["year"],
+                "constraints": [
+                    models.UniqueConstraint(fields=("owner", "year"), name="unique_yearlyincome_owner_year")
+                ],
+            },
+        ),
+    ]
@@ -0,0 +1,50 @@
+"""Data migration: fill the yearly income rollup from existing records.
+
+From here on the rollup is kept up to date by the receivers in
+``apps.reports.models``; without this, users would see an empty year
+summary until they next write a dividend, interest or payroll in each
+year. The reverse step is a no-op because the table is dropped with its
+model.
+"""
+
+from django.db import migrations
+from django.db.models import Count, F, Sum
+from django.db.models.functions import Coalesce, ExtractYear
+
+
+def backfill_yearly_income(apps, schema_editor):
+    YearlyIncome = apps.get_model("reports", "YearlyIncome")
+    sources = (
+        (apps.get_model("transactions", "Dividend"), "date", "dividend", "dividends", {"tax": Sum("tax")}),
+        (apps.get_model("transactions", "Interest"), "date_end", "interest", "interests", {}),
+        (apps.get_model("payroll", "Payroll"), "period_end", "payroll", "payroll", {}),
+    )
+    rows = {}
+    for model, field, kind, prefix, extra in sources:
+        gross = Coalesce(F("base_irpf"), F("gross")) if kind == "payroll" else F("gross")
+        totals = (
+            model.objects.annotate(year=ExtractYear(field))
+            .values("owner_id", "year")
+            .annotate(count=Count("pk"), gross=Sum(gross), net=Sum("net"), **extra)
+            .order_by()
+        )
+        for total in totals:
+            row = rows.setdefault((total["owner_id"], total["year"]), {})
+            row[f"{kind}_count"] = total["count"]
+            for name in ("gross", "net", *extra):
+                row[f"{prefix}_{name}"] = total[name] or 0
+    YearlyIncome.objects.bulk_create(
+        YearlyIncome(owner_id=owner_id, year=year, **values) for (owner_id, year), values in rows.items()
+    )
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("reports", "0004_yearly_income"),
+        ("payroll", "0007_payroll_period_end_index"),
+        ("transactions", "0007_income_date_indexes"),
+    ]
+
+    operations = [
+        migrations.RunPython(backfill_yearly_income, migrations.RunPython.noop),
+    ]
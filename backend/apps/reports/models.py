@@ -1,6 +1,14 @@
+from django.conf import settings as django_settings
 from django.db import models
+from django.db.models import Count, F, Sum
+from django.db.models.functions import Coalesce
+from django.db.models.signals import post_delete, post_save, pre_save
+from django.dispatch import receiver
 
+from apps.assets.models import AccountSnapshot
 from apps.core.models import UserOwnedModel
+from apps.payroll.models import Payroll
+from apps.transactions.models import Dividend, Interest, Transaction
 
 
 class SavingsGoal(UserOwnedModel):
@@ -25,3 +33,180 @@ class SavingsGoal(UserOwnedModel):
 
     def __str__(self):
         return f"{self.name} ({self.target_amount})"
+
+
+class MonthlyLedger(models.Model):
+    """Month-end cash and investment totals of one user, for the savings and patrimonio reports.
+
+    One row per month in which the user has an account snapshot or a
+    transaction; each value is carried forward from earlier months, so a row
+    is the state at the end of its month. Maintained by ``apps.reports.ledger``.
+    """
+
+    owner = models.ForeignKey(
+        django_settings.AUTH_USER_MODEL,
+        on_delete=models.CASCADE,
+        related_name="reports_monthlyledger_set",
+    )
+    month = models.DateField(help_text="First day of the month.")
+    fingerprint = models.CharField(max_length=64)
+    has_snapshot = models.BooleanField(default=False, help_text="An account snapshot is dated in this month.")
+    cash_end = models.DecimalField(max_digits=20, decimal_places=2, help_text="Sum of every account's latest balance.")
+    investment_cost_end = models.DecimalField(
+        max_digits=24, decimal_places=6, help_text="Cost of the open lots under the fiscal cost method."
+    )
+    investment_flow_end = models.DecimalField(
+        max_digits=24, decimal_places=6, help_text="Net amount invested: purchases and gifts less sale proceeds."
+    )
+    snapshot_count = models.PositiveIntegerField(help_text="Account snapshots dated up to the end of the month.")
+    transaction_count = models.PositiveIntegerField(help_text="Transactions dated up to the end of the month.")
+
+    class Meta:
+        ordering = ["month"]
+        constraints = [
+            models.UniqueConstraint(fields=["owner", "month"], name="unique_monthlyledger_owner_month"),
+        ]
+
+    def __str__(self):
+        return f"{self.month:%Y-%m}: cash {self.cash_end}, cost {self.investment_cost_end}"
+
+
+def invalidate_monthly_ledger(owner_id, since):
+    """Drop the ledger rows of ``since``'s month and later."""
+    MonthlyLedger.objects.filter(owner_id=owner_id, month__gte=since.replace(day=1)).delete()
+
+
+def _field_date(model, value, field="date"):
+    # Importer paths assign raw ISO strings, so normalise before comparing.
+    return model._meta.get_field(field).to_python(value)
+
+
+@receiver(pre_save, sender=AccountSnapshot)
+def remember_previous_snapshot_date(sender, instance, **kwargs):
+    if instance._state.adding:
+        instance._ledger_previous_date = None
+        return
+    instance._ledger_previous_date = (
+        AccountSnapshot.objects.filter(pk=instance.pk).values_list("date", flat=True).first()
+    )
+
+
+@receiver(post_save, sender=AccountSnapshot)
+@receiver(post_save, sender=Transaction)
+def invalidate_monthly_ledger_on_save(sender, instance, **kwargs):
+    since = _field_date(sender, instance.date)
+    # Set by the pre_save receivers above and in apps.portfolio.models.
+    previous = getattr(instance, "_ledger_previous_date", None) or getattr(instance, "_checkpoint_previous_date", None)
+    if previous is not None and previous < since:
+        since = previous
+    invalidate_monthly_ledger(instance.owner_id, since)
+
+
+@receiver(post_delete, sender=AccountSnapshot)
+@receiver(post_delete, sender=Transaction)
+def invalidate_monthly_ledger_on_delete(sender, instance, **kwargs):
+    invalidate_monthly_ledger(instance.owner_id, _field_date(sender, instance.date))
+
+
+def _money():
+    return models.DecimalField(max_digits=20, decimal_places=2, default=0)
+
+
+class YearlyIncome(models.Model):
+    """Dividend, interest and payroll totals of one user for one calendar year.
+
+    Kept up to date on every write by the receivers below, so the year
+    summary reads a row per year instead of grouping the whole history. A
+    year is the one of the dividend ``date``, the interest ``date_end`` and
+    the payroll ``period_end``; payroll gross is ``base_irpf`` when present.
+    """
+
+    owner = models.ForeignKey(
+        django_settings.AUTH_USER_MODEL,
+        on_delete=models.CASCADE,
+        related_name="reports_yearlyincome_set",
+    )
+    year = models.PositiveSmallIntegerField()
+    dividend_count = models.PositiveIntegerField(default=0)
+    dividends_gross = _money()
+    dividends_tax = _money()
+    dividends_net = _money()
+    interest_count = models.PositiveIntegerField(default=0)
+    interests_gross = _money()
+    interests_net = _money()
+    payroll_count = models.PositiveIntegerField(default=0)
+    payroll_gross = _money()
+    payroll_net = _money()
+
+    class Meta:
+        ordering = ["year"]
+        constraints = [
+            models.UniqueConstraint(fields=["owner", "year"], name="unique_yearlyincome_owner_year"),
+        ]
+
+    def __str__(self):
+        return (
+            f"{self.year}: dividends {self.dividends_net}, interests {self.interests_net}, payroll {self.payroll_net}"
+        )
+
+    @classmethod
+    def refresh(cls, owner_id, years):
+        """Recompute the rows of ``years`` from the dividends, interests and payrolls dated in them."""
+        for year in years:
+            totals = {
+                **_year_totals(Dividend, "date", owner_id, year, "dividend", gross="gross", tax="tax", net="net"),
+                **_year_totals(Interest, "date_end", owner_id, year, "interest", gross="gross", net="net"),
+                **_year_totals(
+                    Payroll,
+                    "period_end",
+                    owner_id,
+                    year,
+                    "payroll",
+                    gross=Coalesce(F("base_irpf"), F("gross")),
+                    net="net",
+                ),
+            }
+            if any(totals[f"{kind}_count"] for kind in ("dividend", "interest", "payroll")):
+                cls.objects.update_or_create(owner_id=owner_id, year=year, defaults=totals)
+            else:
+                cls.objects.filter(owner_id=owner_id, year=year).delete()
+
+
+def _year_totals(model, field, owner_id, year, kind, **sums):
+    # ``__year`` compiles to a date range, so this reads the (owner, date) index.
+    prefix = {"dividend": "dividends", "interest": "interests", "payroll": "payroll"}[kind]
+    totals = model.objects.filter(owner_id=owner_id, **{f"{field}__year": year}).aggregate(
+        count=Count("pk"), **{name: Sum(expression) for name, expression in sums.items()}
+    )
+    return {
+        f"{kind}_count": totals.pop("count"),
+        **{f"{prefix}_{name}": total or 0 for name, total in totals.items()},
+    }
+
+
+_INCOME_DATE_FIELDS = {Dividend: "date", Interest: "date_end", Payroll: "period_end"}
+
+
+@receiver(pre_save, sender=Dividend)
+@receiver(pre_save, sender=Interest)
+@receiver(pre_save, sender=Payroll)
+def remember_previous_income_year(sender, instance, **kwargs):
+    instance._income_previous_year = None
+    if not instance._state.adding:
+        previous = sender.objects.filter(pk=instance.pk).values_list(_INCOME_DATE_FIELDS[sender], flat=True).first()
+        instance._income_previous_year = previous.year if previous is not None else None
+
+
+@receiver(post_save, sender=Dividend)
+@receiver(post_save, sender=Interest)
+@receiver(post_save, sender=Payroll)
+@receiver(post_delete, sender=Dividend)
+@receiver(post_delete, sender=Interest)
+@receiver(post_delete, sender=Payroll)
+def refresh_yearly_income(sender, instance, **kwargs):
+    field = _INCOME_DATE_FIELDS[sender]
+    years = {_field_date(sender, getattr(instance, field), field).year}
+    previous = getattr(instance, "_income_previous_year", None)
+    if previous is not None:
+        years.add(previous)
+    YearlyIncome.refresh(instance.owner_id, sorted(years))
@@ -1,13 +1,10 @@
+import datetime
 import logging
 from decimal import Decimal
 
-from django.db.models import F, Sum
-from django.db.models.functions import Coalesce, ExtractYear
 from django.utils import timezone
 
-from apps.payroll.models import Payroll
-from apps.portfolio.services import calculate_realized_pnl_fiscal
-from apps.transactions.models import Dividend, Interest
+from apps.portfolio.services import fiscal_realized_pnl_by_year
 
 logger = logging.getLogger(__name__)
 
@@ -29,64 +26,25 @@ def _default_year(y):
 
 
 def year_summary(user):
-    dividend_by_year = (
-        Dividend.objects.filter(owner=user)
-        .annotate(year=ExtractYear("date"))
-        .values("year")
-        .annotate(total_gross=Sum("gross"), total_tax=Sum("tax"), total_net=Sum("net"))
-        .order_by("year")
-    )
-
-    interest_by_year = (
-        Interest.objects.filter(owner=user)
-        .annotate(year=ExtractYear("date_end"))
-        .values("year")
-        .annotate(total_gross=Sum("gross"), total_net=Sum("net"))
-        .order_by("year")
-    )
-
-    # Mirror the Modo Renta / fiscal-tab convention: "gross subject" is
-    # base_irpf when present, otherwise gross. That's what AEAT considers
-    # rendimientos dinerarios sujetos for the Renta.
-    payroll_by_year = (
-        Payroll.objects.filter(owner=user)
-        .annotate(year=ExtractYear("period_end"))
-        .values("year")
-        .annotate(
-            total_gross=Sum(Coalesce(F("base_irpf"), F("gross"))),
-            total_net=Sum("net"),
-        )
-        .order_by("year")
-    )
+    from .models import YearlyIncome
 
     years = {}
-    for d in dividend_by_year:
-        y = d["year"]
-        years.setdefault(y, _default_year(y))
-        years[y]["dividends_gross"] = str(d["total_gross"] or Decimal("0"))
-        years[y]["dividends_tax"] = str(d["total_tax"] or Decimal("0"))
-        years[y]["dividends_net"] = str(d["total_net"] or Decimal("0"))
-
-    for i in interest_by_year:
-        y = i["year"]
-        years.setdefault(y, _default_year(y))
-        years[y]["interests_gross"] = str(i["total_gross"] or Decimal("0"))
-        years[y]["interests_net"] = str(i["total_net"] or Decimal("0"))
-
-    for p in payroll_by_year:
-        y = p["year"]
-        years.setdefault(y, _default_year(y))
-        years[y]["payroll_gross"] = str(p["total_gross"] or Decimal("0"))
-        years[y]["payroll_net"] = str(p["total_net"] or Decimal("0"))
-
-    realized = calculate_realized_pnl_fiscal(user)
-    sales_by_year = {}
-    for sale in realized["realized_sales"]:
-        y = int(sale["date"][:4])
-        sales_by_year.setdefault(y, Decimal("0"))
-        sales_by_year[y] += Decimal(sale["realized_pnl"])
-
-    for y, pnl in sales_by_year.items():
+    for row in YearlyIncome.objects.filter(owner=user).order_by("year"):
+        y = years.setdefault(row.year, _default_year(row.year))
+        if row.dividend_count:
+            y["dividends_gross"] = str(row.dividends_gross)
+            y["dividends_tax"] = str(row.dividends_tax)
+            y["dividends_net"] = str(row.dividends_net)
+        if row.interest_count:
+            y["interests_gross"] = str(row.interests_gross)
+            y["interests_net"] = str(row.interests_net)
+        # Mirror the Modo Renta / fiscal-tab convention: "gross subject" is
+        # base_irpf when present, otherwise gross (see YearlyIncome).
+        if row.payroll_count:
+            y["payroll_gross"] = str(row.payroll_gross)
+            y["payroll_net"] = str(row.payroll_net)
+
+    for y, pnl in fiscal_realized_pnl_by_year(user).items():
         years.setdefault(y, _default_year(y))
         years[y]["realized_pnl"] = str(pnl)
 
@@ -98,78 +56,132 @@ def year_summary(user):
     return sorted(years.values(), key=lambda x: x["year"])
 
 
-def rv_evolution(user):
-    from apps.assets.models import PortfolioSnapshot
+_TIER_WIDTHS = {"HOUR": datetime.timedelta(hours=1), "DAY": datetime.timedelta(days=1)}
 
-    snapshots = (
-        PortfolioSnapshot.objects.filter(owner=user)
-        .order_by("captured_at")
-        .values("captured_at", "total_market_value", "total_cost", "total_unrealized_pnl")
-    )
+
+def _snapshot_series(user, step, start, end):
+    """(time, value, cost, pnl) rows of the coarsest snapshot tier no wider than ``step``.
+
+    ``step`` None reads the snapshots themselves. Compaction deletes old
+    snapshots and hourly rollups, so the history before the first row of a
+    tier is filled from the next coarser one. Rollups stand at their close.
+    """
+    from apps.assets.models import PortfolioSnapshot, PortfolioSnapshotRollup
+
+    tiers = [None, *_TIER_WIDTHS]
+    coarsest = None
+    for tier, width in _TIER_WIDTHS.items():
+        if step is not None and width <= step:
+            coarsest = tier
+    tiers = tiers[tiers.index(coarsest) :]
+
+    rows = []
+    for tier in tiers:
+        if tier is None:
+            queryset = PortfolioSnapshot.objects.filter(owner=user, total_market_value__gt=0)
+            fields = ("captured_at", "total_market_value", "total_cost", "total_unrealized_pnl")
+        else:
+            queryset = PortfolioSnapshotRollup.objects.filter(owner=user, resolution=tier, value_close__gt=0)
+            fields = ("closed_at", "value_close", "cost_close", "pnl_close")
+        if start is not None:
+            queryset = queryset.filter(**{f"{fields[0]}__gte": start})
+        if rows:
+            queryset = queryset.filter(**{f"{fields[0]}__lt": rows[0][0]})
+        elif end is not None:
+            queryset = queryset.filter(**{f"{fields[0]}__lt": end})
+        rows = list(queryset.order_by(fields[0]).values_list(*fields)) + rows
+    return rows
+
+
+def rv_evolution(user, points=None, start=None, end=None):
+    """Portfolio value, cost and P&L over time, optionally between ``start`` and ``end`` (datetimes).
+
+    Without ``points`` (or with 0) every snapshot is returned. Otherwise the
+    series comes from the coarsest snapshot tier (snapshots, hourly or daily
+    rollups) still finer than the range split in ``points``, and is then
+    downsampled to ``points`` with LTTB on the value.
+    """
+    from django.db.models import Max, Min
+
+    from apps.assets.models import PortfolioSnapshotRollup
+
+    from .downsampling import lttb
+
+    step = None
+    if points:
+        # Daily rollups cover the whole history, so they give its span in one indexed read.
+        days = PortfolioSnapshotRollup.objects.filter(owner=user, resolution="DAY")
+        if start is not None:
+            days = days.filter(closed_at__gte=start)
+        if end is not None:
+            days = days.filter(opened_at__lt=end)
+        span = days.aggregate(first=Min("opened_at"), last=Max("closed_at"))
+        if span["first"] is not None:
+            step = (span["last"] - span["first"]) / points
+    rows = _snapshot_series(user, step, start, end)
+
+    if points and len(rows) > points:
+        kept = lttb([row[0].timestamp() for row in rows], [row[1] for row in rows], points)
+        rows = [rows[i] for i in kept]
 
     return [
         {
-            "captured_at": snap["captured_at"].isoformat(),
-            "value": str(snap["total_market_value"]),
-            "cost": str(snap["total_cost"] or 0),
-            "pnl": str(snap["total_unrealized_pnl"] or 0),
+            "captured_at": captured_at.isoformat(),
+            "value": str(value),
+            "cost": str(cost or 0),
+            "pnl": str(pnl or 0),
         }
-        for snap in snapshots
-        if snap["total_market_value"] > 0
+        for captured_at, value, cost, pnl in rows
     ]
 
 
-def patrimonio_evolution(user):
-    from apps.assets.models import AccountSnapshot, PortfolioSnapshot
+def _shared_engine(user):
+    """One engine pass covering every reducer the savings/patrimonio reports need."""
+    from apps.assets.models import Settings
+    from apps.portfolio.engine import replay
+
+    settings = Settings.snapshot(user)
+    return replay(
+        user,
+        methods=[settings.fiscal_cost_method, settings.cost_basis_method],
+        flows=True,
+        settings=settings,
+    )
+
+
+def patrimonio_evolution(user, engine=None):
+    from apps.assets.models import PortfolioSnapshotRollup, Settings
+    from apps.portfolio.engine import replay
     from apps.portfolio.services import calculate_portfolio
-    from apps.transactions.models import Transaction
 
-    EQUITY_TYPES = {"STOCK", "ETF", "CRYPTO"}
+    from .ledger import monthly_rows
 
-    account_balances = {}
-    monthly_cash = {}
+    EQUITY_TYPES = {"STOCK", "ETF", "CRYPTO"}
 
-    for snap in AccountSnapshot.objects.filter(owner=user).order_by("date").values("account_id", "date", "balance"):
-        month_key = snap["date"].strftime("%Y-%m")
-        account_balances[snap["account_id"]] = snap["balance"]
-        monthly_cash[month_key] = sum(account_balances.values(), Decimal("0"))
+    ledger = {row.month.strftime("%Y-%m"): row for row in monthly_rows(user, engine=engine)}
 
+    # The close of the last daily rollup of a month is its last snapshot.
     monthly_portfolio = {}
-    for snap in (
-        PortfolioSnapshot.objects.filter(owner=user)
-        .order_by("captured_at")
-        .values("captured_at", "batch_id", "total_market_value", "total_cost", "total_unrealized_pnl")
+    for day in (
+        PortfolioSnapshotRollup.objects.filter(owner=user, resolution=PortfolioSnapshotRollup.Resolution.DAY)
+        .order_by("period_start")
+        .values("closed_at", "value_close", "pnl_close")
     ):
-        month_key = snap["captured_at"].strftime("%Y-%m")
-        monthly_portfolio[month_key] = snap
+        monthly_portfolio[day["closed_at"].strftime("%Y-%m")] = day
 
-    if not monthly_portfolio and not monthly_cash:
+    if not monthly_portfolio and not any(row.has_snapshot for row in ledger.values()):
         return []
 
-    running_cost = Decimal("0")
-    tx_cost_by_month = {}
-
-    for tx in (
-        Transaction.objects.filter(owner=user)
-        .order_by("date", "created_at")
-        .values("date", "type", "quantity", "price", "commission")
-    ):
-        month_key = tx["date"].strftime("%Y-%m")
-        qty = tx["quantity"] or Decimal("0")
-        price = tx["price"] or Decimal("0")
-        commission = tx["commission"] or Decimal("0")
-        if tx["type"] in ("BUY", "GIFT"):
-            running_cost += qty * price + commission
-        elif tx["type"] == "SELL":
-            running_cost -= qty * price - commission
-        tx_cost_by_month[month_key] = running_cost
+    if engine is None:
+        settings = Settings.snapshot(user)
+        engine = replay(user, methods=[settings.cost_basis_method], settings=settings)
 
     live_total = Decimal("0")
     live_pnl = Decimal("0")
     live_rv = Decimal("0")
     live_rf = Decimal("0")
     try:
-        live_portfolio = calculate_portfolio(user)
+        live_portfolio = calculate_portfolio(user, engine=engine)
         live_total = Decimal(live_portfolio["totals"]["total_market_value"])
         live_pnl = Decimal(live_portfolio["totals"]["total_unrealized_pnl"])
         for pos in live_portfolio["positions"]:
@@ -184,7 +196,7 @@ def patrimonio_evolution(user):
 
     current_month = timezone.now().strftime("%Y-%m")
 
-    all_months_set = set(monthly_cash.keys()) | set(monthly_portfolio.keys()) | set(tx_cost_by_month.keys())
+    all_months_set = set(ledger) | set(monthly_portfolio)
     if monthly_portfolio or live_total > 0:
         all_months_set.add(current_month)
     all_months = sorted(all_months_set)
@@ -194,10 +206,9 @@ def patrimonio_evolution(user):
     result = []
 
     for month in all_months:
-        if month in monthly_cash:
-            last_cash = monthly_cash[month]
-        if month in tx_cost_by_month:
-            last_tx_cost = tx_cost_by_month[month]
+        if month in ledger:
+            last_cash = ledger[month].cash_end
+            last_tx_cost = ledger[month].investment_flow_end
 
         if month == current_month:
             total_investments = live_total
@@ -206,8 +217,8 @@ def patrimonio_evolution(user):
             rf = live_rf
         elif month in monthly_portfolio:
             portfolio = monthly_portfolio[month]
-            total_investments = Decimal(str(portfolio["total_market_value"]))
-            investment_pnl = Decimal(str(portfolio["total_unrealized_pnl"] or 0))
+            total_investments = Decimal(str(portfolio["value_close"]))
+            investment_pnl = Decimal(str(portfolio["pnl_close"] or 0))
             # Per-type breakdown not available for historical snapshots
             rv = Decimal("0")
             rf = Decimal("0")
@@ -257,18 +268,13 @@ def _compute_savings_stats(months_data):
     }
 
 
-def monthly_savings(user, start_date=None, end_date=None):
+def monthly_savings(user, start_date=None, end_date=None, engine=None):
     from apps.assets.models import AccountSnapshot
 
-    account_balances = {}
-    monthly_cash = {}
+    from .ledger import monthly_rows
 
-    for snap in AccountSnapshot.objects.filter(owner=user).order_by("date").values("account_id", "date", "balance"):
-        month_key = snap["date"].strftime("%Y-%m")
-        account_balances[snap["account_id"]] = snap["balance"]
-        monthly_cash[month_key] = sum(account_balances.values(), Decimal("0"))
-
-    if not monthly_cash:
+    cash_rows = [row for row in monthly_rows(user, engine=engine) if row.has_snapshot]
+    if not cash_rows:
         return {"months": [], "stats": None}
 
     monthly_comments: dict = {}
@@ -289,31 +295,16 @@ def monthly_savings(user, start_date=None, end_date=None):
             }
         )
 
-    from apps.portfolio.services import compute_investment_cost_by_month
-
-    inv_cost_by_month = compute_investment_cost_by_month(user)
-
-    sorted_tx_months = sorted(inv_cost_by_month.keys())
-    tx_idx = 0
-    last_inv_cost = Decimal("0")
-
     months_data = []
     prev_cash = None
     prev_inv_cost = None
 
-    cash_months = sorted(monthly_cash.keys())
-    if start_date:
-        cash_months = [m for m in cash_months if m >= start_date]
-    if end_date:
-        cash_months = [m for m in cash_months if m <= end_date]
-
-    for month in cash_months:
-        while tx_idx < len(sorted_tx_months) and sorted_tx_months[tx_idx] <= month:
-            last_inv_cost = inv_cost_by_month[sorted_tx_months[tx_idx]]
-            tx_idx += 1
-
-        cash_end = monthly_cash[month]
-        inv_cost_end = last_inv_cost
+    for row in cash_rows:
+        month = row.month.strftime("%Y-%m")
+        if (start_date and month < start_date) or (end_date and month > end_date):
+            continue
+        cash_end = row.cash_end
+        inv_cost_end = row.investment_cost_end
 
         cash_delta = (cash_end - prev_cash) if prev_cash is not None else None
         inv_cost_delta = (inv_cost_end - prev_inv_cost) if prev_inv_cost is not None else None
@@ -342,9 +333,10 @@ def monthly_savings(user, start_date=None, end_date=None):
 
 def annual_savings(user):
     """Aggregate monthly savings + patrimonio evolution by year."""
-    savings_result = monthly_savings(user)
+    engine = _shared_engine(user)
+    savings_result = monthly_savings(user, engine=engine)
     months_data = savings_result["months"]
-    patrimonio_data = patrimonio_evolution(user)
+    patrimonio_data = patrimonio_evolution(user, engine=engine)
 
     # Build patrimonio lookup by month
     patrimonio_by_month = {}
@@ -434,7 +426,8 @@ def savings_projection(user, goal_id):
     goal = SavingsGoal.objects.get(pk=goal_id, owner=user)
 
     # Get monthly savings data for trimmed mean
-    savings_result = monthly_savings(user)
+    engine = _shared_engine(user)
+    savings_result = monthly_savings(user, engine=engine)
     months_data = savings_result["months"]
 
     deltas = sorted(Decimal(m["real_savings"]) for m in months_data if m["real_savings"] is not None)
@@ -449,7 +442,7 @@ def savings_projection(user, goal_id):
     avg_monthly = (sum(trimmed) / Decimal(str(len(trimmed))) if trimmed else Decimal("0")).quantize(Decimal("0.01"))
 
     # Get current patrimony based on base_type
-    patrimonio_data = patrimonio_evolution(user)
+    patrimonio_data = patrimonio_evolution(user, engine=engine)
     if patrimonio_data:
         last = patrimonio_data[-1]
         if goal.base_type == "CASH":
@@ -10,7 +10,7 @@ would defeat the workflow.
 
 from decimal import Decimal
 
-from apps.portfolio.services import calculate_realized_pnl_fiscal
+from apps.portfolio.services import fiscal_realized_sales
 from apps.transactions.models import Dividend, Interest
 
 from . import register
@@ -43,7 +43,7 @@ class SpanishTaxAdapter:
     def declare(self, user, year: int) -> dict:
         from apps.assets.models import Settings as UserSettings
 
-        user_settings = UserSettings.load(user)
+        user_settings = UserSettings.snapshot(user)
         treaty_limits = user_settings.tax_treaty_limits or {}
 
         warnings: list[dict] = []
@@ -285,7 +285,7 @@ class SpanishTaxAdapter:
             )
 
         # ----- VENTAS (Ganancias y pérdidas patrimoniales) -----------------
-        realized = calculate_realized_pnl_fiscal(user)
+        realized_sales = fiscal_realized_sales(user, year)
         sales_rows = []
         transmission_total = Decimal("0")
         acquisition_total = Decimal("0")
@@ -294,10 +294,7 @@ class SpanishTaxAdapter:
         net_pnl = Decimal("0")
         sale_without_cost_basis_count = 0
 
-        for s in realized["realized_sales"]:
-            sale_year = int(s["date"][:4])
-            if sale_year != year:
-                continue
+        for s in realized_sales:
             proceeds = Decimal(s["proceeds"])
             cost_basis = Decimal(s["cost_basis"])
             pnl = Decimal(s["realized_pnl"])
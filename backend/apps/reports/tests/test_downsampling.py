@@ -0,0 +1,29 @@
+"""
+Tests for LTTB downsampling of chart series.
+"""
+
+import math
+
+from apps.reports.downsampling import lttb
+
+
+class TestLTTB:
+    def test_short_series_are_kept(self):
+        assert lttb([1, 2, 3], [5, 6, 7], 10) == [0, 1, 2]
+        assert lttb([1, 2, 3, 4], [5, 6, 7, 8], 2) == [0, 1, 2, 3]
+
+    def test_keeps_the_ends_and_one_point_per_bucket(self):
+        x = list(range(1000))
+        kept = lttb(x, [math.sin(i / 50) for i in x], 100)
+        assert len(kept) == 100
+        assert (kept[0], kept[-1]) == (0, 999)
+        assert kept == sorted(set(kept))
+        assert all(isinstance(i, int) for i in kept)
+
+    def test_keeps_spikes(self):
+        y = [0.0] * 10_000
+        y[4321] = 100.0
+        y[8765] = -100.0
+        kept = lttb(list(range(10_000)), y, 50)
+        assert 4321 in kept
+        assert 8765 in kept
@@ -0,0 +1,232 @@
+"""
+Tests for the monthly cash and investment-cost ledger and the yearly income
+rollup: their rows must match a rebuild from scratch and stay correct as
+snapshots, transactions, dividends, interests and payrolls change.
+"""
+
+import datetime
+from decimal import Decimal
+
+import pytest
+from django.contrib.auth import get_user_model
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from rest_framework.test import APIClient
+
+from apps.assets.models import Account, AccountSnapshot, Asset, Settings
+from apps.payroll.models import Employer, Payroll
+from apps.reports.ledger import monthly_rows
+from apps.reports.models import MonthlyLedger, YearlyIncome
+from apps.reports.services import monthly_savings, year_summary
+from apps.transactions.models import Dividend, Interest, Transaction
+
+User = get_user_model()
+
+
+@pytest.fixture
+def user(db):
+    return User.objects.create_user(username="monthlyuser", password="testpass123")
+
+
+@pytest.fixture
+def accounts(user):
+    return [
+        Account.objects.create(owner=user, name="Checking", type=Account.AccountType.OPERATIVA),
+        Account.objects.create(owner=user, name="Savings", type=Account.AccountType.AHORRO),
+    ]
+
+
+@pytest.fixture
+def asset(user):
+    return Asset.objects.create(owner=user, name="Alpha", ticker="ALP", current_price=Decimal("20.00"))
+
+
+def _snap(user, account, date, balance):
+    return AccountSnapshot.objects.create(owner=user, account=account, date=date, balance=Decimal(str(balance)))
+
+
+def _tx(user, asset, account, tx_type, date, qty, price):
+    return Transaction.objects.create(
+        owner=user,
+        asset=asset,
+        account=account,
+        type=tx_type,
+        date=date,
+        quantity=Decimal(str(qty)),
+        price=Decimal(str(price)),
+    )
+
+
+@pytest.fixture
+def history(user, accounts, asset):
+    checking, savings = accounts
+    _snap(user, checking, datetime.date(2024, 1, 31), 1000)
+    _snap(user, savings, datetime.date(2024, 1, 31), 500)
+    _tx(user, asset, checking, "BUY", datetime.date(2024, 2, 10), 10, 10)
+    _snap(user, checking, datetime.date(2024, 3, 31), 800)
+    _tx(user, asset, checking, "SELL", datetime.date(2024, 4, 5), 4, 15)
+    _snap(user, savings, datetime.date(2024, 5, 31), 700)
+
+
+def _table(user):
+    return [
+        (row.month.strftime("%Y-%m"), row.has_snapshot, row.cash_end, row.investment_cost_end, row.investment_flow_end)
+        for row in monthly_rows(user)
+    ]
+
+
+def _rebuilt(user):
+    MonthlyLedger.objects.filter(owner=user).delete()
+    return _table(user)
+
+
+@pytest.mark.django_db
+class TestMonthlyLedger:
+    def test_rows_carry_month_end_totals(self, user, history):
+        assert _table(user) == [
+            ("2024-01", True, Decimal("1500"), Decimal("0"), Decimal("0")),
+            ("2024-02", False, Decimal("1500"), Decimal("100"), Decimal("100")),
+            ("2024-03", True, Decimal("1300"), Decimal("100"), Decimal("100")),
+            ("2024-04", False, Decimal("1300"), Decimal("60"), Decimal("40")),
+            ("2024-05", True, Decimal("1500"), Decimal("60"), Decimal("40")),
+        ]
+
+    def test_appends_new_months_only(self, user, accounts, history):
+        monthly_rows(user)
+        january = MonthlyLedger.objects.get(owner=user, month=datetime.date(2024, 1, 1))
+        _snap(user, accounts[0], datetime.date(2024, 6, 30), 900)
+
+        table = _table(user)
+        assert MonthlyLedger.objects.get(owner=user, month=datetime.date(2024, 1, 1)).pk == january.pk
+        assert table[-1] == ("2024-06", True, Decimal("1600"), Decimal("60"), Decimal("40"))
+        assert table == _rebuilt(user)
+
+    def test_past_edits_rewrite_later_months(self, user, accounts, asset, history):
+        monthly_rows(user)
+        snapshot = AccountSnapshot.objects.get(account=accounts[0], date=datetime.date(2024, 1, 31))
+        snapshot.balance = Decimal("2000")
+        snapshot.save()
+        tx = Transaction.objects.get(owner=user, type="BUY")
+        tx.date = datetime.date(2024, 3, 1)
+        tx.save()
+
+        table = _table(user)
+        assert table[0][2] == Decimal("2500")
+        assert [month for month, *_ in table] == ["2024-01", "2024-03", "2024-04", "2024-05"]
+        assert table == _rebuilt(user)
+
+    def test_writes_that_bypass_signals_are_caught(self, user, accounts, history):
+        monthly_rows(user)
+        AccountSnapshot.objects.bulk_create(
+            [AccountSnapshot(owner=user, account=accounts[1], date=datetime.date(2024, 2, 29), balance=Decimal("600"))]
+        )
+
+        table = _table(user)
+        assert table[1] == ("2024-02", True, Decimal("1600"), Decimal("100"), Decimal("100"))
+        assert table == _rebuilt(user)
+
+    def test_bulk_snapshot_endpoint(self, user, accounts, history):
+        monthly_rows(user)
+        client = APIClient()
+        client.force_authenticate(user)
+        response = client.post(
+            "/api/accounts/bulk-snapshot/",
+            {"date": "2024-03-31", "snapshots": [{"account": str(a.pk), "balance": "250"} for a in accounts]},
+            format="json",
+        )
+        assert response.status_code == 201
+
+        table = _table(user)
+        assert table[2] == ("2024-03", True, Decimal("500"), Decimal("100"), Decimal("100"))
+        assert table == _rebuilt(user)
+
+    def test_fiscal_method_change_rebuilds(self, user, accounts, asset, history):
+        _tx(user, asset, accounts[0], "BUY", datetime.date(2024, 3, 10), 10, 20)
+        monthly_rows(user)
+        settings = Settings.load(user)
+        settings.fiscal_cost_method = Settings.CostBasisMethod.LIFO
+        settings.save()
+
+        rows = monthly_rows(user, settings=settings)
+        assert rows[-1].investment_cost_end == Decimal("220")
+        assert {row.fingerprint.split(";")[0] for row in rows} == {"LIFO"}
+
+    def test_up_to_date_ledger_skips_the_history(self, user, history):
+        monthly_savings(user)
+        with CaptureQueriesContext(connection) as ctx:
+            result = monthly_savings(user)
+
+        reads = [
+            q["sql"]
+            for q in ctx.captured_queries
+            if ('"transactions_transaction"' in q["sql"] or '"assets_accountsnapshot"' in q["sql"])
+            and "COUNT(" not in q["sql"]
+            and "note" not in q["sql"]
+        ]
+        assert reads == []
+        assert [m["cash_end"] for m in result["months"]] == ["1500.00", "1300.00", "1500.00"]
+
+
+def _dividend(user, asset, date, gross, tax):
+    return Dividend.objects.create(
+        owner=user, asset=asset, date=date, gross=Decimal(gross), tax=Decimal(tax), net=Decimal(gross) - Decimal(tax)
+    )
+
+
+def _income(user):
+    return {
+        row.year: (row.dividends_net, row.interests_net, row.payroll_gross)
+        for row in YearlyIncome.objects.filter(owner=user)
+    }
+
+
+@pytest.mark.django_db
+class TestYearlyIncome:
+    def test_follows_writes(self, user, accounts, asset):
+        first = _dividend(user, asset, datetime.date(2023, 6, 1), "10", "1")
+        _dividend(user, asset, datetime.date(2024, 6, 1), "20", "2")
+        Interest.objects.create(
+            owner=user,
+            account=accounts[0],
+            date_start=datetime.date(2024, 1, 1),
+            date_end=datetime.date(2024, 3, 31),
+            gross=Decimal("30"),
+            net=Decimal("25"),
+        )
+        employer = Employer.objects.create(owner=user, name="ACME")
+        Payroll.objects.create(
+            owner=user,
+            employer=employer,
+            period_start=datetime.date(2024, 1, 1),
+            period_end=datetime.date(2024, 1, 31),
+            gross=Decimal("3000"),
+            base_irpf=Decimal("2900"),
+            net=Decimal("2410"),
+        )
+        assert _income(user) == {
+            2023: (Decimal("9"), Decimal("0"), Decimal("0")),
+            2024: (Decimal("18"), Decimal("25"), Decimal("2900")),
+        }
+
+        first.date = datetime.date(2024, 2, 1)
+        first.save()
+        assert _income(user) == {2024: (Decimal("27"), Decimal("25"), Decimal("2900"))}
+
+        Payroll.objects.filter(owner=user).delete()
+        assert _income(user) == {2024: (Decimal("27"), Decimal("25"), Decimal("0"))}
+
+    def test_year_summary_reads_the_rollup(self, user, asset):
+        _dividend(user, asset, datetime.date(2024, 6, 1), "20", "2")
+        with CaptureQueriesContext(connection) as ctx:
+            result = year_summary(user)
+
+        income_reads = [
+            q["sql"]
+            for q in ctx.captured_queries
+            if any(
+                table in q["sql"]
+                for table in ('"transactions_dividend"', '"transactions_interest"', '"payroll_payroll"')
+            )
+        ]
+        assert income_reads == []
+        assert (result[0]["dividends_net"], result[0]["interests_net"]) == ("18.00", "0")
@@ -1,12 +1,19 @@
 """
-Tests for report views: YearSummary, CSV exports, and SavingsGoal CRUD.
+Tests for report views: YearSummary, Dashboard, CSV exports, and SavingsGoal CRUD.
 """
 
 import datetime
+import json
+import uuid
 from decimal import Decimal
+from unittest.mock import patch
 
 import pytest
 from django.contrib.auth import get_user_model
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
 from rest_framework.test import APIClient
 
 from apps.assets.models import Account, Asset
@@ -119,6 +126,120 @@ class TestYearSummary:
         assert resp.status_code == 401
 
 
+# ── RV Evolution ──────────────────────────────────────────────────────────────
+
+
+@pytest.fixture
+def snapshots(user):
+    from apps.assets.models import PortfolioSnapshot
+
+    start = timezone.make_aware(datetime.datetime(2025, 1, 1))
+    return [
+        PortfolioSnapshot.objects.create(
+            owner=user,
+            captured_at=start + datetime.timedelta(hours=6 * i),
+            batch_id=uuid.uuid4(),
+            total_market_value=Decimal(1000 + (i % 7) * 10),
+            total_cost=Decimal("900"),
+            total_unrealized_pnl=Decimal((i % 7) * 10 + 100),
+        )
+        for i in range(40)
+    ]
+
+
+@pytest.mark.django_db
+class TestRVEvolution:
+    def test_default_returns_every_snapshot(self, client, snapshots):
+        data = client.get("/api/reports/rv-evolution/").data
+        assert [parse_datetime(row["captured_at"]) for row in data] == [snap.captured_at for snap in snapshots]
+        assert [Decimal(data[0][key]) for key in ("value", "cost", "pnl")] == [1000, 900, 100]
+
+    def test_downsampled_when_asked(self, client, snapshots):
+        data = client.get("/api/reports/rv-evolution/?points=10").data
+        assert len(data) == 10
+        assert parse_datetime(data[0]["captured_at"]) == snapshots[0].captured_at
+        assert parse_datetime(data[-1]["captured_at"]) == snapshots[-1].captured_at
+
+    def test_points_and_range(self, client, snapshots):
+        assert len(client.get("/api/reports/rv-evolution/?points=5").data) == 5
+        assert len(client.get("/api/reports/rv-evolution/?points=0").data) == 40
+        # Dates are whole local days, four snapshots each; "to" is inclusive.
+        data = client.get("/api/reports/rv-evolution/?from=2025-01-02&to=2025-01-03").data
+        assert [parse_datetime(row["captured_at"]) for row in data] == [snap.captured_at for snap in snapshots[4:12]]
+        data = client.get("/api/reports/rv-evolution/", {"from": snapshots[10].captured_at.isoformat()}).data
+        assert len(data) == 30
+
+    def test_reads_the_coarsest_tier_and_compacted_history(self, client, snapshots, settings):
+        from apps.assets.services import compact_portfolio_snapshots
+
+        # Ten days in five points is two days a point: the daily rollups are enough.
+        data = client.get("/api/reports/rv-evolution/?points=5").data
+        closes = {snap.captured_at.astimezone(datetime.UTC).date(): snap.captured_at for snap in snapshots}
+        assert len(data) == 5
+        assert {parse_datetime(row["captured_at"]) for row in data} <= set(closes.values())
+
+        settings.SNAPSHOT_RAW_DAYS = 30
+        now = snapshots[20].captured_at + datetime.timedelta(days=30)
+        assert compact_portfolio_snapshots(snapshots[0].owner, now=now)["snapshots"] == 20
+        data = client.get("/api/reports/rv-evolution/?points=0").data
+        times = [parse_datetime(row["captured_at"]) for row in data]
+        assert times == [snap.captured_at for snap in snapshots]
+
+    def test_invalid_parameters(self, client, snapshots):
+        for query in ("points=abc", "points=2", "points=-1", "from=yesterday"):
+            assert client.get(f"/api/reports/rv-evolution/?{query}").status_code == 400
+
+
+# ── Dashboard ─────────────────────────────────────────────────────────────────
+
+_DASHBOARD_ENDPOINTS = {
+    "portfolio": "/api/portfolio/",
+    "year_summary": "/api/reports/year-summary/",
+    "patrimonio_evolution": "/api/reports/patrimonio-evolution/",
+    "rv_evolution": "/api/reports/rv-evolution/",
+    "monthly_savings": "/api/reports/monthly-savings/",
+    "annual_savings": "/api/reports/annual-savings/",
+}
+
+
+@pytest.mark.django_db
+class TestDashboard:
+    def test_sections_match_their_endpoints(self, client, transaction, dividend, interest):
+        resp = client.get("/api/reports/dashboard/")
+        assert resp.status_code == 200
+        body = json.loads(resp.content)
+        assert list(body) == list(_DASHBOARD_ENDPOINTS)
+        # The individual endpoints are now cache hits.
+        with patch("apps.core.codec.JSONRenderer.render") as render:
+            for name, url in _DASHBOARD_ENDPOINTS.items():
+                assert json.loads(client.get(url).content) == body[name]
+        render.assert_not_called()
+
+    def test_one_transaction_read_for_every_section(self, client, transaction):
+        with CaptureQueriesContext(connection) as ctx:
+            assert client.get("/api/reports/dashboard/").status_code == 200
+        reads = [
+            q["sql"]
+            for q in ctx.captured_queries
+            if 'FROM "transactions_transaction"' in q["sql"] and "COUNT(" not in q["sql"]
+        ]
+        assert len(reads) == 1
+
+    def test_section_selector(self, client, dividend):
+        resp = client.get("/api/reports/dashboard/?sections=year_summary,rv_evolution")
+        assert list(json.loads(resp.content)) == ["year_summary", "rv_evolution"]
+
+        resp = client.get("/api/reports/dashboard/?sections=year_summary,bogus")
+        assert resp.status_code == 400
+        assert "bogus" in resp.data["detail"]
+
+    def test_etag(self, client, dividend):
+        etag = client.get("/api/reports/dashboard/")["ETag"]
+        assert client.get("/api/reports/dashboard/", HTTP_IF_NONE_MATCH=etag).status_code == 304
+        selected = client.get("/api/reports/dashboard/?sections=year_summary")["ETag"]
+        assert selected != etag
+
+
 # ── CSV Exports ───────────────────────────────────────────────────────────────
 
 
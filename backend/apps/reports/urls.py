@@ -3,6 +3,7 @@ from django.urls import path
 from . import views
 
 urlpatterns = [
+    path("reports/dashboard/", views.DashboardView.as_view(), name="dashboard"),
     path("reports/year-summary/", views.YearSummaryView.as_view(), name="year-summary"),
     path("reports/patrimonio-evolution/", views.PatrimonioEvolutionView.as_view(), name="patrimonio-evolution"),
     path("reports/rv-evolution/", views.RVEvolutionView.as_view(), name="rv-evolution"),
@@ -1,91 +1,139 @@
 import csv
-from datetime import timedelta
+from datetime import datetime, time, timedelta
 from decimal import Decimal
 
 from django.http import StreamingHttpResponse
 from django.utils import timezone
+from django.utils.dateparse import parse_date, parse_datetime
 from rest_framework import viewsets
 from rest_framework.response import Response
 from rest_framework.views import APIView
 
+from apps.core import codec
 from apps.core.cache import (
+    NS_PORTFOLIO,
     NS_REPORTS_ANNUAL_SAVINGS,
     NS_REPORTS_PATRIMONIO,
     NS_REPORTS_RV,
     NS_REPORTS_SAVINGS,
     NS_REPORTS_YEAR,
-    get_user_cache,
-    set_user_cache,
+    cached_user_computation,
 )
-from apps.core.mixins import OwnedByUserMixin
+from apps.core.mixins import CachedComputationMixin, OwnedByUserMixin, rendered_response
 from apps.transactions.models import Dividend, Interest, Transaction
 
 from .models import SavingsGoal
 from .serializers import SavingsGoalSerializer
-from .services import (
-    annual_savings,
-    monthly_savings,
-    patrimonio_evolution,
-    rv_evolution,
-    savings_projection,
-    year_summary,
-)
+from .services import monthly_savings, rv_evolution, savings_projection
 from .tax_adapters import get_adapter
 
-_REPORT_TTL = 120  # 2 minutes
 
+class YearSummaryView(CachedComputationMixin, APIView):
+    cache_namespace = NS_REPORTS_YEAR
 
-class YearSummaryView(APIView):
-    def get(self, request):
-        cached = get_user_cache(request.user.pk, NS_REPORTS_YEAR)
-        if cached is not None:
-            return Response(cached)
-        data = year_summary(request.user)
-        set_user_cache(request.user.pk, NS_REPORTS_YEAR, data, timeout=_REPORT_TTL)
-        return Response(data)
 
+class PatrimonioEvolutionView(CachedComputationMixin, APIView):
+    cache_namespace = NS_REPORTS_PATRIMONIO
+
+
+def _parse_bound(value, end=False):
+    """An ISO datetime, or a date meaning the start of that day (of the next one for an inclusive ``end``)."""
+    day = parse_date(value)
+    if day is not None:
+        moment = datetime.combine(day + timedelta(days=1) if end else day, time.min)
+    else:
+        moment = parse_datetime(value)
+        if moment is None:
+            raise ValueError(value)
+    return timezone.make_aware(moment) if timezone.is_naive(moment) else moment
 
-class PatrimonioEvolutionView(APIView):
-    def get(self, request):
-        cached = get_user_cache(request.user.pk, NS_REPORTS_PATRIMONIO)
-        if cached is not None:
-            return Response(cached)
-        data = patrimonio_evolution(request.user)
-        set_user_cache(request.user.pk, NS_REPORTS_PATRIMONIO, data, timeout=_REPORT_TTL)
-        return Response(data)
 
+class RVEvolutionView(CachedComputationMixin, APIView):
+    """GET /api/reports/rv-evolution/?points=500&from=2025-01-01&to=2025-06-30 — portfolio snapshots over time.
+
+    Without parameters the series is the cached one, with every snapshot;
+    ``points`` downsamples it to that many points (0 also returns every snapshot).
+    """
+
+    cache_namespace = NS_REPORTS_RV
 
-class RVEvolutionView(APIView):
     def get(self, request):
-        cached = get_user_cache(request.user.pk, NS_REPORTS_RV)
-        if cached is not None:
-            return Response(cached)
-        data = rv_evolution(request.user)
-        set_user_cache(request.user.pk, NS_REPORTS_RV, data, timeout=_REPORT_TTL)
-        return Response(data)
+        params = request.query_params
+        if not {"points", "from", "to"} & set(params):
+            return self.cached_response(request)
+        try:
+            points = int(params["points"]) if "points" in params else None
+            start = _parse_bound(params["from"]) if params.get("from") else None
+            end = _parse_bound(params["to"], end=True) if params.get("to") else None
+        except ValueError:
+            return Response({"detail": "points must be an integer; from and to ISO dates or datetimes."}, status=400)
+        if points is not None and (points < 0 or 0 < points < 3):
+            return Response({"detail": "points must be 0 (every snapshot) or at least 3."}, status=400)
+        return Response(rv_evolution(request.user, points=points, start=start, end=end))
+
 
+class MonthlySavingsView(CachedComputationMixin, APIView):
+    cache_namespace = NS_REPORTS_SAVINGS
 
-class MonthlySavingsView(APIView):
     def get(self, request):
         from_month = request.query_params.get("from")
         to_month = request.query_params.get("to")
         if not from_month and not to_month:
-            cached = get_user_cache(request.user.pk, NS_REPORTS_SAVINGS)
-            if cached is not None:
-                return Response(cached)
+            return self.cached_response(request)
         result = monthly_savings(request.user, start_date=from_month, end_date=to_month)
-        if not from_month and not to_month:
-            set_user_cache(request.user.pk, NS_REPORTS_SAVINGS, result, timeout=_REPORT_TTL)
         return Response(result)
 
 
+# Dashboard sections and the namespace each one is cached under.
+DASHBOARD_SECTIONS = {
+    "portfolio": NS_PORTFOLIO,
+    "year_summary": NS_REPORTS_YEAR,
+    "patrimonio_evolution": NS_REPORTS_PATRIMONIO,
+    "rv_evolution": NS_REPORTS_RV,
+    "monthly_savings": NS_REPORTS_SAVINGS,
+    "annual_savings": NS_REPORTS_ANNUAL_SAVINGS,
+}
+
+
+class DashboardView(APIView):
+    """GET /api/reports/dashboard/?sections=portfolio,year_summary — several reports in one response.
+
+    Each section is the body of its own endpoint, served from (and stored
+    under) the same cache entry, so the individual endpoints benefit too.
+    Without ``sections`` every section is included.
+    """
+
+    def get(self, request):
+        param = request.query_params.get("sections")
+        requested = [name.strip() for name in param.split(",") if name.strip()] if param else list(DASHBOARD_SECTIONS)
+        unknown = [name for name in requested if name not in DASHBOARD_SECTIONS]
+        if unknown:
+            return Response(
+                {"detail": f"Unknown sections: {', '.join(unknown)}. Available: {', '.join(DASHBOARD_SECTIONS)}."},
+                status=400,
+            )
+
+        names = list(dict.fromkeys(requested))
+        # Annual savings goes first: it replays every reducer the other reports
+        # need, and the request's computation context (apps.core.context) hands
+        # them on to the later sections.
+        sections = {}
+        for name in sorted(names, key=lambda name: name != "annual_savings"):
+            sections[name] = cached_user_computation(request.user, DASHBOARD_SECTIONS[name])
+        body = b"{" + b",".join(b'"%s":%s' % (name.encode(), sections[name][0].body) for name in names) + b"}"
+        etag = codec.Rendered.of("".join(sections[name][0].etag for name in names).encode()).etag
+        return rendered_response(
+            request, codec.Rendered(body, etag), stale=any(stale for _, stale in sections.values())
+        )
+
+
 class SnapshotStatusView(APIView):
     def get(self, request):
         import math
 
         from apps.assets.models import PortfolioSnapshot, Settings
 
-        settings = Settings.load(request.user)
+        settings = Settings.snapshot(request.user)
         freq = settings.snapshot_frequency
         last = PortfolioSnapshot.objects.filter(owner=request.user).order_by("-captured_at").first()
 
@@ -116,7 +164,7 @@ class TaxDeclarationView(APIView):
         except (TypeError, ValueError):
             return Response({"detail": "year must be an integer"}, status=400)
 
-        user_settings = UserSettings.load(request.user)
+        user_settings = UserSettings.snapshot(request.user)
         adapter = get_adapter(user_settings.tax_country)
         if adapter is None:
             return Response(
@@ -126,14 +174,8 @@ class TaxDeclarationView(APIView):
         return Response(adapter.declare(request.user, year))
 
 
-class AnnualSavingsView(APIView):
-    def get(self, request):
-        cached = get_user_cache(request.user.pk, NS_REPORTS_ANNUAL_SAVINGS)
-        if cached is not None:
-            return Response(cached)
-        data = annual_savings(request.user)
-        set_user_cache(request.user.pk, NS_REPORTS_ANNUAL_SAVINGS, data, timeout=_REPORT_TTL)
-        return Response(data)
+class AnnualSavingsView(CachedComputationMixin, APIView):
+    cache_namespace = NS_REPORTS_ANNUAL_SAVINGS
 
 
 class SavingsGoalViewSet(OwnedByUserMixin, viewsets.ModelViewSet):
@@ -0,0 +1,23 @@
+# Generated by Django 6.0.9 on 2026-10-17 09:24
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("assets", "0007_settings_tax_country"),
+        ("transactions", "0006_dividend_commission_interest_tax_commission"),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name="dividend",
+            index=models.Index(fields=["owner", "date"], name="idx_div_owner_date"),
+        ),
+        migrations.AddIndex(
+            model_name="interest",
+            index=models.Index(fields=["owner", "date_end"], name="idx_int_owner_date_end"),
+        ),
+    ]
@@ -65,6 +65,9 @@ class Dividend(UserOwnedModel):
         constraints = [
             models.UniqueConstraint(fields=["owner", "import_hash"], name="unique_div_owner_import_hash"),
         ]
+        indexes = [
+            models.Index(fields=["owner", "date"], name="idx_div_owner_date"),
+        ]
 
     def __str__(self):
         return f"{self.date} Dividend {self.asset.name} {self.net}"
@@ -101,6 +104,9 @@ class Interest(UserOwnedModel):
         constraints = [
             models.UniqueConstraint(fields=["owner", "import_hash"], name="unique_int_owner_import_hash"),
         ]
+        indexes = [
+            models.Index(fields=["owner", "date_end"], name="idx_int_owner_date_end"),
+        ]
 
     @property
     def days(self):
@@ -1,9 +1,30 @@
 import os
 
 from celery import Celery
+from celery.signals import task_postrun, task_prerun
 
 os.environ.setdefault("DJANGO_SETTINGS_MODULE", "config.settings.production")
 
 app = Celery("fintrack")
 app.config_from_object("django.conf:settings", namespace="CELERY")
 app.autodiscover_tasks()
+
+
+@task_prerun.connect
+def open_computation_context(task=None, **kwargs):
+    """Scope memoized per-user computations (see ``apps.core.context``) to one task run."""
+    from apps.core.context import enter_computation_context
+    from apps.portfolio.parallel import allow_parallel_replays
+
+    task.request.computation_context_token = enter_computation_context()
+    # Tasks may replay large histories on a process pool; web requests never do.
+    task.request.parallel_replays_token = allow_parallel_replays()
+
+
+@task_postrun.connect
+def close_computation_context(task=None, **kwargs):
+    from apps.core.context import exit_computation_context
+    from apps.portfolio.parallel import disallow_parallel_replays
+
+    exit_computation_context(getattr(task.request, "computation_context_token", None))
+    disallow_parallel_replays(getattr(task.request, "parallel_replays_token", None))
@@ -50,6 +50,7 @@ MIDDLEWARE = [
     "django.middleware.common.CommonMiddleware",
     "django.middleware.csrf.CsrfViewMiddleware",
     "django.contrib.auth.middleware.AuthenticationMiddleware",
+    "apps.core.middleware.ComputationContextMiddleware",
     "django.contrib.messages.middleware.MessageMiddleware",
     "django.middleware.clickjacking.XFrameOptionsMiddleware",
 ]
@@ -99,6 +100,35 @@ CACHES = {
         "LOCATION": os.environ.get("REDIS_URL", "redis://redis:6379/0"),
     }
 }
+# Single-flight cache misses (apps.core.cache.get_or_compute_user_cache): how
+# long the computing process holds its lock, and how long others wait for it.
+CACHE_COMPUTE_LOCK_TIMEOUT = int(os.environ.get("CACHE_COMPUTE_LOCK_TIMEOUT", "30"))
+CACHE_COMPUTE_WAIT = float(os.environ.get("CACHE_COMPUTE_WAIT", "5"))
+# Stale-while-revalidate for portfolio and report payloads: once expired, an
+# entry is still served (flagged with X-Cache-Stale) for CACHE_STALE_TTL more
+# seconds while a Celery task recomputes it. Invalidation bypasses it.
+CACHE_STALE_WHILE_REVALIDATE = os.environ.get("CACHE_STALE_WHILE_REVALIDATE", "False").lower() in ("true", "1", "yes")
+CACHE_STALE_TTL = int(os.environ.get("CACHE_STALE_TTL", "3600"))
+# In-process L1 in front of Redis (apps.core.cache): max entries per process
+# (0 disables it) and the longest an entry is kept without a Redis round trip.
+CACHE_L1_MAX_ENTRIES = int(os.environ.get("CACHE_L1_MAX_ENTRIES", "1000"))
+CACHE_L1_TTL = int(os.environ.get("CACHE_L1_TTL", "30"))
+# Portfolio and report payloads are stored in Redis as JSON bytes (not pickles),
+# zlib-compressed from CACHE_COMPRESS_MIN_BYTES (0 never compresses).
+CACHE_COMPACT_PAYLOADS = os.environ.get("CACHE_COMPACT_PAYLOADS", "True").lower() in ("true", "1", "yes")
+CACHE_COMPRESS_MIN_BYTES = int(os.environ.get("CACHE_COMPRESS_MIN_BYTES", "1024"))
+CACHE_COMPRESS_LEVEL = int(os.environ.get("CACHE_COMPRESS_LEVEL", "6"))
+# Warm-up: recompute portfolio and report caches in Celery after price updates
+# and snapshots (CACHE_WARM_UP) and, optionally, on login. At most one warm-up
+# per user every CACHE_WARM_INTERVAL seconds, and CACHE_WARM_RATE_LIMIT per worker.
+CACHE_WARM_UP = os.environ.get("CACHE_WARM_UP", "True").lower() in ("true", "1", "yes")
+CACHE_WARM_ON_LOGIN = os.environ.get("CACHE_WARM_ON_LOGIN", "False").lower() in ("true", "1", "yes")
+CACHE_WARM_INTERVAL = int(os.environ.get("CACHE_WARM_INTERVAL", "60"))
+CACHE_WARM_RATE_LIMIT = os.environ.get("CACHE_WARM_RATE_LIMIT", "30/m")
+# Per-namespace cache metrics (apps.core.metrics, GET /api/cache/metrics/): each
+# process adds its counts to Redis every CACHE_METRICS_FLUSH_INTERVAL seconds.
+CACHE_METRICS = os.environ.get("CACHE_METRICS", "True").lower() in ("true", "1", "yes")
+CACHE_METRICS_FLUSH_INTERVAL = int(os.environ.get("CACHE_METRICS_FLUSH_INTERVAL", "10"))
 
 # ---------------------------------------------------------------------------
 # Auth
@@ -208,6 +238,10 @@ CELERY_BEAT_SCHEDULE = {
         "task": "apps.assets.tasks.purge_old_snapshots_task",
         "schedule": 86400.0,  # daily
     },
+    "compact-snapshots": {
+        "task": "apps.assets.tasks.compact_snapshots_task",
+        "schedule": 86400.0,  # daily
+    },
 }
 
 # ---------------------------------------------------------------------------
@@ -225,7 +259,27 @@ SPECTACULAR_SETTINGS = {
 ALLOW_REGISTRATION = os.environ.get("ALLOW_REGISTRATION", "true").lower() in ("true", "1", "yes")
 GOOGLE_CLIENT_ID = os.environ.get("GOOGLE_CLIENT_ID", "")
 
+# Portfolio snapshot compaction. Snapshots older than SNAPSHOT_RAW_DAYS, and
+# hourly rollups older than SNAPSHOT_HOURLY_DAYS, are deleted once their
+# hourly and daily rollups hold them; 0 keeps them. Daily rollups follow the
+# per-user data retention setting.
+SNAPSHOT_RAW_DAYS = int(os.environ.get("SNAPSHOT_RAW_DAYS", "30"))
+SNAPSHOT_HOURLY_DAYS = int(os.environ.get("SNAPSHOT_HOURLY_DAYS", "365"))
+
 # Payslip PDF parser strategy (apps.payroll.services.parsers). Built-in
 # values: "regex-es". Future values may include "ai-claude" or similar.
 # See ADR-008 for the strategy pattern.
 PAYSLIP_PARSER = os.environ.get("PAYSLIP_PARSER", "regex-es")
+
+# Cost-basis engine (apps.portfolio). A lot-state checkpoint is persisted every
+# N replayed transactions so later replays resume from it instead of from the
+# first trade. 0 disables checkpoint writes.
+PORTFOLIO_CHECKPOINT_INTERVAL = int(os.environ.get("PORTFOLIO_CHECKPOINT_INTERVAL", "1000"))
+# Merge a FIFO/LIFO buy into the previous open lot when both share account and
+# unit cost, keeping lot counts bounded for many-small-buys (DCA) histories.
+PORTFOLIO_COALESCE_LOTS = os.environ.get("PORTFOLIO_COALESCE_LOTS", "False").lower() in ("true", "1", "yes")
+# Replays of at least this many transactions match lots per asset on a pool of
+# PORTFOLIO_PARALLEL_WORKERS processes (default: one per CPU). 0 disables it.
+# Only Celery tasks and management commands replay in parallel, never web requests.
+PORTFOLIO_PARALLEL_THRESHOLD = int(os.environ.get("PORTFOLIO_PARALLEL_THRESHOLD", "50000"))
+PORTFOLIO_PARALLEL_WORKERS = int(os.environ.get("PORTFOLIO_PARALLEL_WORKERS", "0")) or None
@@ -2,11 +2,12 @@ from django.contrib import admin
 from django.urls import include, path
 from drf_spectacular.views import SpectacularAPIView, SpectacularRedocView, SpectacularSwaggerView
 
-from apps.core.views import HealthView, TaskStatusView
+from apps.core.views import CacheMetricsView, HealthView, TaskStatusView
 
 urlpatterns = [
     path("admin/", admin.site.urls),
     path("api/health/", HealthView.as_view(), name="health"),
+    path("api/cache/metrics/", CacheMetricsView.as_view(), name="cache-metrics"),
     path("api/tasks/<str:task_id>/", TaskStatusView.as_view(), name="task-status"),
     path("api/auth/", include("apps.core.urls")),
     path("api/", include("apps.assets.urls")),
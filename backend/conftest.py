@@ -1,4 +1,4 @@
-"""Root conftest — disables DRF throttling so tests are not rate-limited."""
+"""Root conftest — disables DRF throttling so tests are not rate-limited, and resets the in-process cache."""
 
 import pytest
 
@@ -15,3 +15,13 @@ def _disable_throttling(settings):
         "auth_password": "99999/minute",
     }
     settings.REST_FRAMEWORK = rf
+
+
+@pytest.fixture(autouse=True)
+def _clear_local_cache():
+    # The in-process cache tier outlives each test's database transaction.
+    yield
+    from apps.core.cache import _local
+
+    if _local() is not None:
+        _local().clear()
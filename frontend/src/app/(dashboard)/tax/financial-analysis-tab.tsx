@@ -19,7 +19,8 @@ import { formatMoney, formatPct } from "@/lib/utils";
 import { useTranslations } from "@/i18n/use-translations";
 import type {
   YearSummary,
-  PortfolioData,
+  RealizedSale,
+  CursorPaginatedResponse,
   Dividend,
   Interest,
   PaginatedResponse,
@@ -98,9 +99,26 @@ export function FinancialAnalysisTab({ year }: Props) {
     queryFn: () => api.get<YearSummary[]>("/reports/year-summary/"),
   });
 
-  const { data: portfolio } = useQuery({
-    queryKey: ["portfolio"],
-    queryFn: () => api.get<PortfolioData>("/portfolio/"),
+  // Under the "portfolio" key so transaction edits that refresh the
+  // portfolio refresh the year's sales too. The totals need every sale of
+  // the year, so follow the cursor until the last page.
+  const { data: salesData } = useQuery({
+    queryKey: ["portfolio", "realized-sales", year],
+    queryFn: async () => {
+      const all: RealizedSale[] = [];
+      let cursor: string | null = null;
+      do {
+        const res: CursorPaginatedResponse<RealizedSale> = await api.get(
+          `/portfolio/realized-sales/?year=${year}&page_size=500` +
+            (cursor ? `&cursor=${encodeURIComponent(cursor)}` : ""),
+        );
+        all.push(...res.results);
+        cursor = res.next
+          ? new URL(res.next).searchParams.get("cursor")
+          : null;
+      } while (cursor);
+      return all;
+    },
   });
 
   const { data: dividendsData } = useQuery({
@@ -145,8 +163,8 @@ export function FinancialAnalysisTab({ year }: Props) {
 
   const summary = years?.find((y) => y.year === parseInt(year));
 
-  const salesYear =
-    portfolio?.realized_sales.filter((s) => s.date.startsWith(year)) ?? [];
+  // The endpoint lists newest first; the table reads oldest first.
+  const salesYear = [...(salesData ?? [])].reverse();
   const salesTotals = (() => {
     const qty = salesYear.reduce((s, r) => s + parseFloat(r.quantity), 0);
     const cost = salesYear.reduce((s, r) => s + parseFloat(r.cost_basis), 0);
@@ -4,7 +4,7 @@ export { demoAccounts } from "./accounts";
 export { demoTransactions } from "./transactions";
 export { demoDividends } from "./dividends";
 export { demoInterests } from "./interests";
-export { demoPortfolio } from "./portfolio";
+export { demoPortfolio, demoRealizedSales } from "./portfolio";
 export { demoSettings } from "./settings";
 export {
   demoYearSummary,
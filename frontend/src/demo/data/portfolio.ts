@@ -1,4 +1,4 @@
-import type { PortfolioData } from "@/types";
+import type { PortfolioData, RealizedSale } from "@/types";
 
 // Positions reflect net holdings after buys and sells (FIFO):
 // AAPL: bought 25+10=35, sold 10 → 25 shares (cost 4070.75)
@@ -133,38 +133,6 @@ export const demoPortfolio: PortfolioData = {
       weight: "9.08",
     },
   ],
-  realized_sales: [
-    {
-      date: "2024-04-15",
-      asset_name: "Apple Inc.",
-      asset_ticker: "AAPL",
-      quantity: "10.0000",
-      sell_price: "185.20",
-      cost_basis: "1425.70",
-      proceeds: "1851.00",
-      realized_pnl: "425.30",
-    },
-    {
-      date: "2024-07-10",
-      asset_name: "CrowdStrike Holdings",
-      asset_ticker: "CRWD",
-      quantity: "3.0000",
-      sell_price: "392.15",
-      cost_basis: "787.58",
-      proceeds: "1175.45",
-      realized_pnl: "387.87",
-    },
-    {
-      date: "2025-02-20",
-      asset_name: "NVIDIA Corporation",
-      asset_ticker: "NVDA",
-      quantity: "15.0000",
-      sell_price: "131.80",
-      cost_basis: "1313.18",
-      proceeds: "1976.00",
-      realized_pnl: "662.82",
-    },
-  ],
   totals: {
     total_cost: "50021.47",
     total_market_value: "66691.30",
@@ -175,3 +143,73 @@ export const demoPortfolio: PortfolioData = {
     grand_total: "76177.48",
   },
 };
+
+// Newest first, as /portfolio/realized-sales/ returns them.
+export const demoRealizedSales: RealizedSale[] = [
+  {
+    transaction: "c1000000-0017-4000-c000-000000000017",
+    date: "2025-02-20",
+    asset: "a1b2c3d4-8888-4000-a000-000000000008",
+    asset_name: "NVIDIA Corporation",
+    asset_ticker: "NVDA",
+    quantity: "15.0000",
+    sell_price: "131.80",
+    cost_basis: "1313.18",
+    proceeds: "1976.00",
+    realized_pnl: "662.82",
+    oversell_quantity: "0.0000",
+    matches: [
+      {
+        source: "c1000000-0010-4000-c000-000000000010",
+        source_date: "2024-03-05",
+        source_type: "BUY",
+        quantity: "15.0000",
+        cost: "1313.18",
+      },
+    ],
+  },
+  {
+    transaction: "c1000000-0013-4000-c000-000000000013",
+    date: "2024-07-10",
+    asset: "a1b2c3d4-7777-4000-a000-000000000007",
+    asset_name: "CrowdStrike Holdings",
+    asset_ticker: "CRWD",
+    quantity: "3.0000",
+    sell_price: "392.15",
+    cost_basis: "787.58",
+    proceeds: "1175.45",
+    realized_pnl: "387.87",
+    oversell_quantity: "0.0000",
+    matches: [
+      {
+        source: "c1000000-0009-4000-c000-000000000009",
+        source_date: "2024-01-22",
+        source_type: "BUY",
+        quantity: "3.0000",
+        cost: "787.58",
+      },
+    ],
+  },
+  {
+    transaction: "c1000000-0011-4000-c000-000000000011",
+    date: "2024-04-15",
+    asset: "a1b2c3d4-1111-4000-a000-000000000001",
+    asset_name: "Apple Inc.",
+    asset_ticker: "AAPL",
+    quantity: "10.0000",
+    sell_price: "185.20",
+    cost_basis: "1425.70",
+    proceeds: "1851.00",
+    realized_pnl: "425.30",
+    oversell_quantity: "0.0000",
+    matches: [
+      {
+        source: "c1000000-0001-4000-c000-000000000001",
+        source_date: "2023-01-20",
+        source_type: "BUY",
+        quantity: "10.0000",
+        cost: "1425.70",
+      },
+    ],
+  },
+];
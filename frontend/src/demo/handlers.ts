@@ -8,6 +8,7 @@ import {
   demoDividends,
   demoInterests,
   demoPortfolio,
+  demoRealizedSales,
   demoYearSummary,
   demoPatrimonioEvolution,
   demoRVEvolution,
@@ -345,6 +346,15 @@ const proxyHandlers = [
     return HttpResponse.json(demoPortfolio);
   }),
 
+  http.get("/api/proxy/portfolio/realized-sales/", async ({ request }) => {
+    await delay(200);
+    const year = new URL(request.url).searchParams.get("year");
+    const results = year
+      ? demoRealizedSales.filter((s) => s.date.startsWith(year))
+      : demoRealizedSales;
+    return HttpResponse.json({ next: null, previous: null, results });
+  }),
+
   // ---- Reports ----
   http.get("/api/proxy/reports/year-summary/", async () => {
     await delay(200);
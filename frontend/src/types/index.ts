@@ -218,8 +218,19 @@ export interface Position {
   weight: string;
 }
 
+export interface RealizedLotMatch {
+  source: string;
+  source_date: string;
+  source_type: TransactionType;
+  quantity: string;
+  cost: string;
+}
+
+/** One row of /portfolio/realized-sales/ (cursor-paginated, newest first). */
 export interface RealizedSale {
+  transaction: string;
   date: string;
+  asset: string;
   asset_name: string;
   asset_ticker: string | null;
   quantity: string;
@@ -227,11 +238,12 @@ export interface RealizedSale {
   cost_basis: string;
   proceeds: string;
   realized_pnl: string;
+  oversell_quantity: string;
+  matches: RealizedLotMatch[];
 }
 
 export interface PortfolioData {
   positions: Position[];
-  realized_sales: RealizedSale[];
   totals: {
     total_cost: string;
     total_market_value: string;
@@ -338,6 +350,12 @@ export interface PaginatedResponse<T> {
   results: T[];
 }
 
+export interface CursorPaginatedResponse<T> {
+  next: string | null;
+  previous: string | null;
+  results: T[];
+}
+
 // ── Charts / Price History ────────────────────────────────────────
 export interface OHLCBar {
   time: string; // YYYY-MM-DD